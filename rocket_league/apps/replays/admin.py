@@ -17,6 +17,7 @@ reprocess_matches.short_description = "Reprocess selected matches"
 def recalculate_average_rating(modeladmin, request, queryset):
     for obj in queryset:
         obj.average_rating = obj.calculate_average_rating()
+        obj.bump_content_version()
         obj.save()
 
 
@@ -84,6 +85,10 @@ class ReplayAdmin(admin.ModelAdmin):
     # inlines = [PlayerInlineAdmin, GoalInlineAdmin, BoostDataInlineAdmin]
     actions = [reprocess_matches, recalculate_average_rating]
 
+    def save_model(self, request, obj, form, change):
+        obj.bump_content_version()
+        super(ReplayAdmin, self).save_model(request, obj, form, change)
+
 
 @admin.register(Map)
 class MapAdmin(admin.ModelAdmin):
@@ -0,0 +1,480 @@
+"""
+Analyzers pull the data we store out of a replay's network frames.
+
+`NetstreamParser` only keeps the actor state every replay needs (the actors
+themselves, players, teams, cars and goals).  Everything else is worked out by
+an `Analyzer`, which declares what it needs from the frame walk:
+
+- `handles` on its methods, for the properties it wants to see,
+- `classes`, the actor classes it wants to hear about being spawned or
+  destroyed,
+- the frame hooks it overrides (`start_frame`, `end_frame`).
+
+The parser only routes events to the analyzers which asked for them, so an
+analyzer which isn't running costs nothing, and a reprocess can run just the
+analyzers whose output needs rebuilding.
+"""
+import numpy as np
+
+from .frames import FrameStore
+from .heatmaps import Heatmap, add_dwell_time
+from .hits import BallTimeline, Timeline, find_touches
+
+BALL_CLASSES = ['TAGame.Ball_TA', 'TAGame.Ball_Breakout_TA']
+
+
+def handles(*properties):
+    """
+    Register the decorated method as the handler for the given properties.
+    When a replication carries more than one handled property, handlers run
+    in the order they're defined in the class.
+    """
+    def decorator(func):
+        func.handles = properties
+        return func
+    return decorator
+
+
+def handler_methods(obj):
+    """
+    Return the bound property handlers of an object, in definition order.
+    """
+    names = []
+
+    for klass in reversed(type(obj).__mro__):
+        for name, attr in vars(klass).items():
+            if hasattr(attr, 'handles') and name not in names:
+                names.append(name)
+
+    return [getattr(obj, name) for name in names]
+
+
+class Analyzer(object):
+
+    """
+    The base class for analyzers.  Subclasses set `name`, list the keys of
+    `results()` in `produces` and the names of any analyzers they read from
+    (or whose output theirs includes) in `requires`.  Bump `version` whenever
+    the output changes, so stored output can be rebuilt.
+    """
+
+    name = None
+    version = 1
+    classes = ()
+    produces = ()
+    requires = ()
+
+    def __init__(self, netstream):
+        self.netstream = netstream
+
+    def overrides(self, method_name):
+        return getattr(type(self), method_name) is not getattr(Analyzer, method_name)
+
+    def start_frame(self, index):
+        pass
+
+    def actor_spawned(self, index, actor_id, value):
+        pass
+
+    def actor_destroyed(self, index, actor_id, value):
+        pass
+
+    def end_frame(self, index, changed):
+        pass
+
+    def finish(self):
+        pass
+
+    def results(self):
+        return {}
+
+
+class LocationAnalyzer(Analyzer):
+
+    """
+    The position of every actor at each frame it moved, and the match clock,
+    for the location JSON.
+    """
+
+    name = 'locations'
+    produces = ('frame_store', 'seconds_mapping')
+    # The location JSON carries the boost data too.
+    requires = ('boost',)
+
+    def __init__(self, netstream):
+        super(LocationAnalyzer, self).__init__(netstream)
+
+        self.frame_store = FrameStore()
+        self.seconds_mapping = {}  # Frame -> seconds remaining mapping.
+
+    def start_frame(self, index):
+        self.frame_store.add_frame()
+
+    @handles('TAGame.RBActor_TA:ReplicatedRBState')
+    def handle_rigid_body_state(self, index, actor_id, flattened_value):
+        location = flattened_value['TAGame.RBActor_TA:ReplicatedRBState']['value']['location']
+        rotation = flattened_value['TAGame.RBActor_TA:ReplicatedRBState']['value']['rotation']
+
+        self.frame_store.append(
+            # Get the player actor id.
+            self.netstream.car_players.get(actor_id, 'ball'),
+            actor_id,
+            index,
+            location['x'],
+            location['y'],
+            location['z'],
+            rotation['x']['value'],
+            rotation['y']['value'],
+            rotation['z']['value'],
+        )
+
+    @handles('TAGame.GameEvent_Soccar_TA:SecondsRemaining')
+    def handle_seconds_remaining(self, index, actor_id, flattened_value):
+        # Store the mapping of frame -> clock time.
+        self.seconds_mapping[index] = flattened_value['TAGame.GameEvent_Soccar_TA:SecondsRemaining']['value']
+
+    def results(self):
+        return {
+            'frame_store': self.frame_store,
+            'seconds_mapping': self.seconds_mapping,
+        }
+
+
+class BoostAnalyzer(Analyzer):
+
+    """
+    The boost amount of each player at every frame it changed.
+    """
+
+    name = 'boost'
+    produces = ('boost_data',)
+
+    def __init__(self, netstream):
+        super(BoostAnalyzer, self).__init__(netstream)
+
+        self.boost_data = {}  # Used for the boost stats.
+        self.unknown_boost_data = {}  # Holding dict for boosts without player data.
+
+    @handles('TAGame.CarComponent_Boost_TA:ReplicatedBoostAmount')
+    def handle_boost_amount(self, index, actor_id, flattened_value):
+        # Store the boost data for each actor at each frame where it changes.
+        boost_value = flattened_value['TAGame.CarComponent_Boost_TA:ReplicatedBoostAmount']['value']
+        assert 0 <= boost_value <= 255, 'Boost value {} is not in range 0-255.'.format(boost_value)
+
+        actors = self.netstream.actors
+        boost_data = self.boost_data
+        unknown_boost_data = self.unknown_boost_data
+
+        if actor_id not in boost_data:
+            boost_data[actor_id] = {}
+
+        # Sometimes we have a boost component without a reference to
+        # a car. We don't want to lose that data, so stick it into a
+        # holding dictionary until we can figure out who it belongs to.
+
+        if 'TAGame.CarComponent_TA:Vehicle' not in actors[actor_id]:
+            if actor_id not in unknown_boost_data:
+                unknown_boost_data[actor_id] = {}
+
+            unknown_boost_data[actor_id][index] = boost_value
+        else:
+            car_id = actors[actor_id]['TAGame.CarComponent_TA:Vehicle']['value']
+
+            # Find out which player this car belongs to.
+            player_actor_id = self.netstream.car_players.get(car_id)
+
+            if player_actor_id is not None:
+                if player_actor_id not in boost_data:
+                    boost_data[player_actor_id] = {}
+
+                boost_data[player_actor_id][index] = boost_value
+
+                # Attach any floating data (if we can).
+                if actor_id in unknown_boost_data:
+                    for frame_index, boost_value in unknown_boost_data[actor_id].items():
+                        boost_data[player_actor_id][frame_index] = boost_value
+
+                    del unknown_boost_data[actor_id]
+
+    def results(self):
+        return {'boost_data': self.boost_data}
+
+
+class HeatmapAnalyzer(Analyzer):
+
+    """
+    How long each player and the ball spent in each part of the pitch, not
+    counting kickoff countdowns.  The positions come from the frame store once
+    the match is over, the frame walk only notes the countdowns and who each
+    ball and car should be counted under.
+
+    Only the standard ball and cars which belong to a player are counted.
+    A car counts under its player from the frame it's linked to them, at the
+    last place it moved to.
+    """
+
+    name = 'heatmap'
+    # Version 1 heatmaps may count Breakout balls, and cars which weren't yet
+    # linked to a player, as the ball.
+    version = 2
+    classes = ['TAGame.Ball_TA', 'TAGame.Car_TA']
+    produces = ('heatmap',)
+    requires = ('locations',)
+
+    def __init__(self, netstream):
+        super(HeatmapAnalyzer, self).__init__(netstream)
+
+        self.heatmap = Heatmap()
+        self.paused = []  # (start, end) frames the cars were frozen in place (3.. 2.. 1..)
+        self.paused_since = None
+        # Actor ID -> [(frame, label, spawned), ...], who the actor's
+        # positions count under from each frame.
+        self.changes = {}
+
+    @handles('TAGame.GameEvent_TA:ReplicatedGameStateTimeRemaining')
+    def handle_game_state_time_remaining(self, index, actor_id, flattened_value):
+        # See if the cars are frozen in place.
+        time_remaining = flattened_value['TAGame.GameEvent_TA:ReplicatedGameStateTimeRemaining']['value']
+
+        if time_remaining == 3 and self.paused_since is None:
+            self.paused_since = index
+        elif time_remaining == 0 and self.paused_since is not None:
+            self.paused.append((self.paused_since, index))
+            self.paused_since = None
+
+    def actor_spawned(self, index, actor_id, value):
+        # An actor which is spawned again without being destroyed keeps its
+        # state.
+        if self.netstream.actors[actor_id] is not value:
+            return
+
+        if value['class_name'] == 'TAGame.Ball_TA':
+            label = 'ball'
+        elif 'Engine.Pawn:PlayerReplicationInfo' in value:
+            label = value['Engine.Pawn:PlayerReplicationInfo']['value']
+        else:
+            label = None
+
+        self.changes.setdefault(actor_id, []).append((index, label, True))
+
+    @handles('Engine.Pawn:PlayerReplicationInfo')
+    def handle_player_replication_info(self, index, actor_id, flattened_value):
+        actor = self.netstream.actors.get(actor_id)
+
+        if actor is not None and actor['class_name'] == 'TAGame.Car_TA':
+            self.changes[actor_id].append((index, flattened_value['Engine.Pawn:PlayerReplicationInfo']['value'], False))
+
+    def actor_destroyed(self, index, actor_id, value):
+        self.changes[actor_id].append((index, None, True))
+
+    def finish(self):
+        num_frames = self.netstream.num_frames
+        paused = self.paused
+
+        if self.paused_since is not None:
+            paused = paused + [(self.paused_since, num_frames)]
+
+        # Group the moves by the actor which made them, whichever track they
+        # were filed under, keeping them in the order they happened.
+        tracks = list(self.netstream.analyzers['locations'].frame_store.tracks.values())
+
+        if not tracks:
+            return
+
+        actor_ids = np.concatenate([track.actor_ids() for track in tracks])
+        moves = np.lexsort((np.concatenate([track.update_order() for track in tracks]), actor_ids))
+        actor_ids = actor_ids[moves]
+        frames = np.concatenate([track.frame_indices() for track in tracks])[moves]
+        xs = np.concatenate([track.column('x') for track in tracks])[moves]
+        ys = np.concatenate([track.column('y') for track in tracks])[moves]
+
+        for actor_id, changes in self.changes.items():
+            start, end = np.searchsorted(actor_ids, [actor_id, actor_id + 1])
+
+            add_dwell_time(
+                self.heatmap,
+                frames[start:end],
+                xs[start:end],
+                ys[start:end],
+                changes,
+                num_frames,
+                paused=paused,
+            )
+
+    def results(self):
+        return {'heatmap': self.heatmap}
+
+
+class ShotAnalyzer(Analyzer):
+
+    """
+    Ball touches, and where the ball and the last player from the scoring
+    team to touch it were when each goal went in.
+    """
+
+    name = 'shots'
+    classes = ['TAGame.Ball_TA', 'TAGame.Team_Soccar_TA']
+    produces = ('shot_data', 'touches')
+    # Car positions come from the frame store.
+    requires = ('locations',)
+
+    def __init__(self, netstream):
+        super(ShotAnalyzer, self).__init__(netstream)
+
+        self.actor_positions = {}  # The current position data for all actors. Do we need this?
+        self.ball_actor_id = None
+        self.ball_possession = None  # The team currently in possession of the ball.
+        self.confirmed_ball_hit = False
+        self.ball_spawned = False
+        self.sampled_ball_actor_id = None
+        self.moved_actors = []  # Actors with a new position this frame.
+
+        self.shot_data = []  # The locations of the player and the ball when goals were scored.
+        self.shot_teams = []  # (team, first frame of the shot's play) for each shot.
+        self.last_goal_frame = 0
+
+        # What we need to attribute ball touches after the frame walk.
+        self.ball_timeline = BallTimeline()
+        self.team_timeline = Timeline()  # The team actor of each player.
+        self.team_numbers = {}  # Team actor ID -> team number.
+        self.touches = None
+
+    def start_frame(self, index):
+        self.confirmed_ball_hit = False
+        self.ball_spawned = False
+        self.moved_actors = []
+
+        if index in self.netstream.goals:
+            self.record_shot(index)
+
+    def record_shot(self, index):
+        # Get the ball position.
+        self.ball_actor_id = self.netstream.registry.first(*BALL_CLASSES)
+
+        if self.ball_actor_id is None:
+            raise IndexError('No ball actor at goal frame {}.'.format(index))
+
+        ball_position = self.actor_positions[self.ball_actor_id]
+
+        # The player position is filled in from the touch timeline once the
+        # whole match has been seen.
+        # XXX: Update this to also register the hitter?
+        self.shot_data.append({
+            'player': None,
+            'ball': ball_position,
+            'frame': index
+        })
+        self.shot_teams.append((self.netstream.goals[index]['PlayerTeam'], self.last_goal_frame))
+        self.last_goal_frame = index
+
+    def actor_spawned(self, index, actor_id, value):
+        if value['class_name'] == 'TAGame.Ball_TA':
+            self.ball_spawned = True
+        elif value['class_name'] == 'TAGame.Team_Soccar_TA':
+            try:
+                self.team_numbers[actor_id] = int(self.netstream.team_data[actor_id].replace('GameEvent_Soccar_TA_', ''))
+            except ValueError:
+                pass
+
+    @handles('TAGame.RBActor_TA:ReplicatedRBState')
+    def handle_rigid_body_state(self, index, actor_id, flattened_value):
+        location = flattened_value['TAGame.RBActor_TA:ReplicatedRBState']['value']['location']
+
+        self.actor_positions[actor_id] = [location['x'], location['y'], location['z']]
+        self.moved_actors.append(actor_id)
+
+    @handles('TAGame.Ball_TA:HitTeamNum')
+    def handle_hit_team(self, index, actor_id, flattened_value):
+        # If this property exists, the ball has changed possession.
+        self.confirmed_ball_hit = True
+        self.ball_possession = flattened_value['TAGame.Ball_TA:HitTeamNum']['value']
+
+        # Clean up the actor positions.
+        car_players = self.netstream.car_players
+
+        for actor_position in list(self.actor_positions):
+            if actor_position not in car_players and actor_position != self.ball_actor_id:
+                del self.actor_positions[actor_position]
+
+    @handles('Engine.PlayerReplicationInfo:Team')
+    def handle_team(self, index, actor_id, flattened_value):
+        self.team_timeline.set(actor_id, index, flattened_value['Engine.PlayerReplicationInfo:Team']['value'])
+
+    def end_frame(self, index, changed):
+        # Sample the ball whenever it has moved or been replaced, touches are
+        # worked out from these samples once the match is over.
+        ball_actor_id = self.ball_actor_id = self.netstream.registry.ball()
+
+        if ball_actor_id is not None and (
+            ball_actor_id != self.sampled_ball_actor_id or
+            ball_actor_id in self.moved_actors
+        ):
+            rigid_body = self.netstream.actors[ball_actor_id].get('TAGame.RBActor_TA:ReplicatedRBState')
+
+            if rigid_body and 'angular_velocity' in rigid_body['value']:
+                self.ball_timeline.append(
+                    index,
+                    rigid_body['value']['angular_velocity'],
+                    self.ball_spawned,
+                    self.confirmed_ball_hit,
+                    self.ball_possession,
+                    self.actor_positions.get(ball_actor_id),
+                )
+
+        self.sampled_ball_actor_id = ball_actor_id
+
+    def finish(self):
+        self.touches = find_touches(
+            self.ball_timeline,
+            self.netstream.analyzers['locations'].frame_store,
+            self.netstream.car_timeline,
+            self.team_timeline,
+            self.team_numbers,
+        )
+
+        # Credit each shot to the last touch by the scoring team since the
+        # previous goal.
+        for shot, (team, start) in zip(self.shot_data, self.shot_teams):
+            shot['player'] = self.touches.last_touch(team, start, shot['frame'])
+
+    def results(self):
+        return {
+            'shot_data': self.shot_data,
+            'touches': self.touches,
+        }
+
+
+# Every analyzer, in the order they run.  Analyzers come after anything they
+# require.
+ANALYZERS = [
+    BoostAnalyzer,
+    LocationAnalyzer,
+    HeatmapAnalyzer,
+    ShotAnalyzer,
+]
+
+
+def get_analyzers(names=None):
+    """
+    Return the analyzer classes for the given names, along with any they
+    require, in the order they run.  With no names, return them all.
+    """
+    by_name = {analyzer.name: analyzer for analyzer in ANALYZERS}
+
+    if names is None:
+        return list(ANALYZERS)
+
+    wanted = set()
+    pending = list(names)
+
+    while pending:
+        name = pending.pop()
+
+        if name not in by_name:
+            raise ValueError('Unknown analyzer: {}'.format(name))
+
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(by_name[name].requires)
+
+    return [analyzer for analyzer in ANALYZERS if analyzer.name in wanted]
@@ -0,0 +1,505 @@
+"""
+The boost analysis of a replay: each player's pickups and consumption, and
+the data behind the charts.
+
+Each player's boost timeline is turned into chart series with array operations
+rather than frame by frame: the boost value at each change, the frames tweened
+in between while boost is being used, the running consumption, and the team
+totals and distributions.  The output matches what the `boost_chart_data` tag
+used to build in Python, which is kept in the benchmark_boost_chart command
+for comparison.
+
+Both are worked out when a replay is processed, see save_boost_analysis, and
+stored with the replay so the boost analysis page doesn't compute anything.
+"""
+import json
+import pickle
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import player_boost_arrays
+
+# Bump this when the output of boost_chart changes, so cached charts from an
+# older version aren't served.
+BOOST_CHART_VERSION = 3
+
+BOOST_CHART_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Boost is reset to 85 on kickoff, a drop to 85 this many frames after a goal
+# isn't counted as boost being used.
+GOAL_RESET_FRAMES = 75
+
+# How quickly boost drains, in boost units per frame.
+BOOST_PER_FRAME = 255 / 74
+
+TEAMS = (-1, 0, 1)
+
+
+def _percentage(values):
+    return np.ceil(values * (100 / 255)).astype(np.int64)
+
+
+def _changes(frames, values, goal_frames):
+    """
+    Split a player's boost changes into drops from using boost, and drops to
+    85 from the kickoff after a goal.
+    """
+    previous = np.concatenate([[85], values[:-1]])
+    decreased = values < previous
+
+    # A goal within GOAL_RESET_FRAMES frames before the change.
+    after = np.searchsorted(goal_frames, frames - GOAL_RESET_FRAMES, side='left')
+    before = np.searchsorted(goal_frames, frames, side='left')
+    reset = decreased & (values == 85) & (before > after)
+
+    return previous, decreased, reset, decreased & ~reset
+
+
+def _events(frames, values, previous, decreased, reset, used):
+    """
+    Return the points written to the chart for one player's boost changes, in
+    the order they're written, as arrays of frame, rendered value, whether
+    the point counts towards the team totals and whether it's a tween.
+    """
+    count = len(frames)
+    entries = np.arange(count)
+
+    frame_diff = np.floor((previous - values) / BOOST_PER_FRAME).astype(np.int64)
+
+    # A drop caused by the kickoff reset is drawn as a step rather than tweened.
+    reset_entries = entries[reset]
+
+    # Frames leading up to a drop are tweened at the drain rate.
+    tween_counts = np.where(used, np.maximum(frame_diff - 1, 0), 0)
+    tween_entries = np.repeat(entries, tween_counts)
+    tween_steps = np.arange(len(tween_entries)) - np.repeat(np.cumsum(tween_counts) - tween_counts, tween_counts)
+    tween_frames = frames[tween_entries] - frame_diff[tween_entries] + 1 + tween_steps
+    tween_values = np.ceil(values[tween_entries] + (frames[tween_entries] - tween_frames) * BOOST_PER_FRAME)
+
+    # Otherwise the previous value is held until the frame before the change.
+    held_entries = entries[~decreased & (frames > 0)]
+
+    # Within a change the points are written in this order: the reset step,
+    # the tweens, the held value, then the new value.
+    parts = [
+        (reset_entries, np.zeros(len(reset_entries), dtype=np.int64), frames[reset_entries] - frame_diff[reset_entries], _percentage(previous[reset_entries]), False, False),
+        (tween_entries, 1 + tween_steps, tween_frames, _percentage(tween_values), True, True),
+        (held_entries, np.full(len(held_entries), 256, dtype=np.int64), frames[held_entries] - 1, _percentage(previous[held_entries]), True, False),
+        (entries, np.full(count, 257, dtype=np.int64), frames, _percentage(values), True, False),
+    ]
+
+    entry_index = np.concatenate([part[0] for part in parts])
+    step = np.concatenate([part[1] for part in parts])
+    order = np.lexsort((step, entry_index))
+
+    return tuple(
+        np.concatenate([np.broadcast_to(part[column], len(part[0])) for part in parts])[order]
+        for column in range(2, 6)
+    )
+
+
+def _filled(frames, values, length):
+    """
+    Sum `values` into frames 0 to `length` - 1, carrying the last total
+    forward over frames which have no values.
+    """
+    in_range = (frames >= 0) & (frames < length)
+    frames = frames[in_range]
+
+    totals = np.zeros(length, dtype=np.int64)
+    np.add.at(totals, frames, values[in_range])
+
+    present = np.zeros(length, dtype=bool)
+    present[frames] = True
+
+    last = np.maximum.accumulate(np.where(present, np.arange(length), -1))
+
+    return np.where(last >= 0, totals[np.maximum(last, 0)], 0)
+
+
+def boost_chart(players, goal_frames, num_frames):
+    """
+    Build the chart data from a list of (actor ID, team, player name, frames,
+    values) tuples, one per player, with the frames and values as arrays.
+    """
+    goal_frames = np.sort(np.array([frame for frame in goal_frames if frame is not None], dtype=np.int64))
+
+    # Players are keyed by actor ID, if more than one player has the same
+    # actor ID the first one's timeline is added again for each of them.
+    runs = OrderedDict()
+    player_names = {}
+
+    for actor_id, team, player_name, frames, values in players:
+        if actor_id in runs:
+            frames, values = runs[actor_id][0][1:]
+
+        runs.setdefault(actor_id, []).append((team, frames, values))
+        player_names.setdefault(actor_id, player_name)
+
+    boost_values = {}
+    boost_consumption = {}
+
+    team_points = {team: [] for team in TEAMS}
+    team_used = {team: [] for team in TEAMS}
+
+    for actor_id, actor_runs in runs.items():
+        events = []
+        used_frames = []
+        used_amounts = []
+
+        for team, frames, values in actor_runs:
+            frames = np.asarray(frames, dtype=np.int64)
+            values = np.asarray(values, dtype=np.int64)
+
+            if not len(frames):
+                continue
+
+            previous, decreased, reset, used = _changes(frames, values, goal_frames)
+
+            points = _events(frames, values, previous, decreased, reset, used)
+            events.append(points + (np.full(len(points[0]), team),))
+
+            amounts = _percentage(previous[used] - values[used])
+
+            used_frames.append(frames[used])
+            used_amounts.append(amounts)
+            team_used[team].append((frames[used], amounts))
+
+        boost_values[actor_id] = OrderedDict()
+        boost_consumption[actor_id] = OrderedDict()
+
+        if not events:
+            continue
+
+        event_frames, event_values, counted, tween, event_teams = [
+            np.concatenate(column) for column in zip(*events)
+        ]
+
+        # A tween only fills a frame nothing has been written to yet.
+        _, first = np.unique(event_frames, return_index=True)
+        is_first = np.zeros(len(event_frames), dtype=bool)
+        is_first[first] = True
+        applied = ~tween | is_first
+
+        # The last point written to a frame is the one shown.
+        shown_frames = event_frames[applied][::-1]
+        shown_values = event_values[applied][::-1]
+        frames, last = np.unique(shown_frames, return_index=True)
+        boost_values[actor_id] = OrderedDict(zip(frames.tolist(), shown_values[last].tolist()))
+
+        counted &= applied
+
+        for team in TEAMS:
+            in_team = counted & (event_teams == team)
+            team_points[team].append((event_frames[in_team], event_values[in_team]))
+
+        # Consumption keeps running across runs for the same actor.
+        running = np.cumsum(np.concatenate(used_amounts))
+        boost_consumption[actor_id] = OrderedDict(sorted(
+            dict(zip(np.concatenate(used_frames).tolist(), running.tolist())).items()
+        ))
+
+    for series in (boost_consumption, boost_values):
+        for actor_id, values in series.items():
+            # Ensure the last frame is present for each dict.
+            if num_frames not in values and len(values) > 0:
+                values[num_frames] = values[next(reversed(values))]
+
+    team_boost_consumption = {}
+
+    for team in TEAMS:
+        if team_used[team]:
+            frames = np.concatenate([used[0] for used in team_used[team]])
+            amounts = np.concatenate([used[1] for used in team_used[team]])
+        else:
+            frames = amounts = np.zeros(0, dtype=np.int64)
+
+        in_range = (frames >= 0) & (frames <= num_frames)
+        totals = np.zeros(num_frames + 1, dtype=np.int64)
+        np.add.at(totals, frames[in_range], amounts[in_range])
+
+        team_boost_consumption[team] = OrderedDict(enumerate(np.cumsum(totals).tolist()))
+
+    team_boost_values = {-1: OrderedDict(), 0: OrderedDict(), 1: OrderedDict()}
+    distributions = {}
+
+    for team in TEAMS:
+        if team_points[team]:
+            frames = np.concatenate([point[0] for point in team_points[team]])
+            values = np.concatenate([point[1] for point in team_points[team]])
+        else:
+            frames = values = np.zeros(0, dtype=np.int64)
+
+        distributions[team] = np.bincount(values, minlength=101)
+
+        if team in (0, 1):
+            team_boost_values[team] = OrderedDict(enumerate(_filled(frames, values, num_frames).tolist()))
+
+    # Pad the distributions for both teams up to the highest value either has.
+    boost_distribution = {-1: OrderedDict(), 0: OrderedDict(), 1: OrderedDict()}
+    seen = np.flatnonzero(distributions[0] + distributions[1])
+
+    if len(seen):
+        for team in (0, 1):
+            boost_distribution[team] = OrderedDict(enumerate(distributions[team][:seen[-1] + 1].tolist()))
+
+    return {
+        'boost_values': boost_values,
+        'team_boost_values': team_boost_values,
+        'boost_consumption': boost_consumption,
+        'team_boost_consumption': team_boost_consumption,
+        'boost_distribution': boost_distribution,
+        'player_names': player_names,
+    }
+
+
+def lttb(x, y, points):
+    """
+    Pick `points` indices of a series with the largest-triangle-three-buckets
+    algorithm, which keeps the points that most change the shape of the line.
+    The first and last points are always kept.
+    """
+    count = len(x)
+
+    if points >= count or points < 3:
+        return np.arange(count)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # The points between the first and last are split into even buckets, one
+    # point is picked from each.
+    every = (count - 2) / (points - 2)
+    selected = np.zeros(points, dtype=np.int64)
+    selected[-1] = count - 1
+
+    for bucket in range(points - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+
+        # The triangle's third corner is the average of the next bucket.
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+
+        previous = selected[bucket]
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous]) -
+            (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+
+        selected[bucket + 1] = start + np.argmax(areas)
+
+    return selected
+
+
+def _downsample(series, points, keep=()):
+    """
+    Reduce an OrderedDict of frame -> value to about `points` points, keeping
+    the exact values at the frames in `keep`.
+    """
+    if not points or len(series) <= points:
+        return series
+
+    frames = np.fromiter(series.keys(), dtype=np.int64, count=len(series))
+    values = np.fromiter(series.values(), dtype=np.int64, count=len(series))
+
+    keep = np.isin(frames, np.asarray(list(keep), dtype=np.int64))
+
+    # The kept points come out of the same budget.
+    selected = keep.copy()
+    selected[lttb(frames, values, max(points - keep.sum(), 3))] = True
+
+    return OrderedDict(zip(frames[selected].tolist(), values[selected].tolist()))
+
+
+def _steps(series, limit):
+    """
+    The frames of the largest `limit` rises in the boost amount (pickups) and
+    the largest `limit` falls (boost runs and demolitions), and the frame
+    before each, so the step is drawn straight.
+    """
+    frames = np.fromiter(series.keys(), dtype=np.int64, count=len(series))
+    values = np.fromiter(series.values(), dtype=np.int64, count=len(series))
+
+    change = np.diff(values)
+    rises = np.flatnonzero(change > 0)
+    rises = rises[np.argsort(-change[rises], kind='mergesort')[:limit]]
+    falls = np.flatnonzero(change < 0)
+    falls = falls[np.argsort(change[falls], kind='mergesort')[:limit]]
+    steps = np.concatenate([rises, falls])
+
+    return np.concatenate([frames[steps], frames[steps + 1]])
+
+
+def downsample_chart(data, goal_frames, points=None):
+    """
+    Reduce each line of the chart data to about `points` points (the
+    BOOST_CHART_POINTS setting by default), so the page doesn't grow with the
+    length of the match.  The values at goals are kept.  On the boost amount
+    lines, so are the biggest pickups and drops, up to an eighth of the points
+    each, with the frame before each.
+    """
+    if points is None:
+        points = settings.BOOST_CHART_POINTS
+
+    if not points:
+        return data
+
+    goal_frames = [frame for frame in goal_frames if frame is not None]
+
+    return dict(
+        data,
+        boost_values={
+            actor_id: _downsample(series, points, goal_frames + _steps(series, points // 8).tolist())
+            for actor_id, series in data['boost_values'].items()
+        },
+        team_boost_values={
+            team: _downsample(series, points, goal_frames + _steps(series, points // 8).tolist())
+            for team, series in data['team_boost_values'].items()
+        },
+        boost_consumption={
+            actor_id: _downsample(series, points, goal_frames)
+            for actor_id, series in data['boost_consumption'].items()
+        },
+        team_boost_consumption={
+            team: _downsample(series, points, goal_frames)
+            for team, series in data['team_boost_consumption'].items()
+        },
+    )
+
+
+def boost_summary(values):
+    """
+    Count a player's boost pickups and the boost they used from their boost
+    values.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    diff = np.diff(np.concatenate([[85], values]))
+
+    gained = diff > 0
+    large = gained & (values == 255)
+    small = gained & ~large & (diff >= 28) & (diff <= 30)
+    # A jump back up to 85 is the kickoff reset rather than a pickup.
+    unknown = gained & ~large & ~small & (values != 85)
+
+    return {
+        'small_pickups': int(small.sum()),
+        'large_pickups': int(large.sum()),
+        'boost_consumption': int(_percentage(-diff[diff < 0]).sum()),
+        'unknown_pickups': int(unknown.sum()),
+    }
+
+
+def chart_players(replay):
+    return [
+        (player.actor_id, player.team, player.player_name) + tuple(player_boost_arrays(player))
+        for player in replay.player_set.filter(spectator=False).select_related('boost_timeline')
+    ]
+
+
+def _int_keys(pairs):
+    # JSON object keys are always strings, but the chart data is keyed by
+    # frames, teams and actor IDs.
+    return OrderedDict(
+        (int(key) if key.lstrip('-').isdigit() else key, value)
+        for key, value in pairs
+    )
+
+
+def save_boost_analysis(replay_obj):
+    """
+    Work out the boost summaries of a replay's players and its chart data
+    once, when it's processed, so the boost analysis page only has to read
+    them.  The chart is written to the media storage, so this runs once the
+    parse has been committed, and the replay's previous chart is removed.
+    """
+    players = list(replay_obj.player_set.select_related('boost_timeline'))
+    chart = []
+
+    for player in players:
+        frames, values = player_boost_arrays(player)
+
+        player.boost_data = boost_summary(values)
+
+        if not player.spectator:
+            chart.append((player.actor_id, player.team, player.player_name, frames, values))
+
+    goal_frames = list(replay_obj.goal_set.values_list('frame', flat=True))
+    data = downsample_chart(boost_chart(chart, goal_frames, replay_obj.num_frames or 0), goal_frames)
+
+    previous = replay_obj.boost_chart_file.name
+    name = default_storage.save(
+        'uploads/replay_boost_chart_files/{}.json'.format(replay_obj.replay_id),
+        ContentFile(json.dumps({
+            'version': BOOST_CHART_VERSION,
+            'data': data,
+        }, separators=(',', ':')))
+    )
+
+    try:
+        with transaction.atomic():
+            for player in players:
+                player.save(update_fields=['boost_data'])
+
+            replay_obj.boost_chart_file = name
+            replay_obj.save(update_fields=['boost_chart_file'])
+    except Exception:
+        default_storage.delete(name)
+        raise
+
+    # Storages pick a new name rather than overwriting a file.
+    if previous and previous != name:
+        default_storage.delete(previous)
+
+
+def _load_boost_chart(replay):
+    if replay.boost_chart_file:
+        replay.boost_chart_file.open('rb')
+
+        try:
+            stored = json.loads(replay.boost_chart_file.read().decode('utf-8'), object_pairs_hook=_int_keys)
+        finally:
+            replay.boost_chart_file.close()
+
+        if stored['version'] == BOOST_CHART_VERSION:
+            return stored['data']
+
+    # Replays processed before the chart data was stored, or with an older
+    # version of it, are worked out on the fly until they're reprocessed.
+    goal_frames = list(replay.goal_set.values_list('frame', flat=True))
+
+    return downsample_chart(boost_chart(chart_players(replay), goal_frames, replay.num_frames or 0), goal_frames)
+
+
+def boost_chart_data(replay):
+    """
+    The boost chart data for a replay, cached until the replay is reprocessed
+    or its chart data is stored (by save_boost_analysis).
+    """
+    key = 'boost_chart_data:{}:{}:{}:{}'.format(
+        replay.pk,
+        BOOST_CHART_VERSION,
+        replay.content_version,
+        replay.boost_chart_file.name or '',
+    )
+
+    # The charts for a long match can be bigger than a memcached item, but
+    # they compress well.
+    cached = cache.get(key)
+
+    if cached is not None:
+        return pickle.loads(zlib.decompress(cached))
+
+    data = _load_boost_chart(replay)
+
+    cache.set(key, zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL)), BOOST_CHART_CACHE_TIMEOUT)
+
+    return data
@@ -0,0 +1,79 @@
+"""
+ETags and Last-Modified times for the replay pages and API, so a client
+asking for a replay which hasn't changed since it last looked gets a 304
+after one indexed lookup, before any of the view's work is done.
+
+Replays only change when they're processed or edited, which bumps their
+content_version (see Replay.bump_content_version).
+"""
+import hashlib
+
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.utils.timezone import now
+
+from ..site.entitlements import entitlements, get_entitlements, pledge_amount
+from .models import PRIVACY_PRIVATE, Replay
+
+
+def get_replay(request, queryset=None, **filters):
+    """
+    The fields of a replay the ETags are built from, looked up once per
+    request.  `queryset` should be the one the view itself looks the replay
+    up in.
+    """
+    if not hasattr(request, '_conditional_replay'):
+        if queryset is None:
+            queryset = Replay.objects.all()
+
+        replays = queryset.filter(**filters).only(
+            'pk', 'content_version', 'last_modified', 'user', 'privacy',
+        )[:1]
+
+        request._conditional_replay = replays[0] if replays else None
+
+    return request._conditional_replay
+
+
+def page_etag(request, replay):
+    """
+    The pages also depend on who's looking at them and whether the replay
+    is eligible for the patron features, which only changes with the patrons
+    (see replay_fragment_key).  Other details, such as the players' ratings,
+    can be up to a day old.
+    """
+    # Flash messages are only shown once, so the page has to be rendered.
+    # They're kept in a cookie (MESSAGE_STORAGE), so checking for one doesn't
+    # need to read them.
+    if replay is None or CookieStorage.cookie_name in request.COOKIES:
+        return None
+
+    user_id = request.user.pk if request.user.is_authenticated() else None
+
+    # Let the view 404 for anyone who can't see the replay, rather than
+    # answering their If-None-Match.
+    if replay.privacy == PRIVACY_PRIVATE and (user_id is None or user_id != replay.user_id):
+        return None
+
+    get_entitlements()
+
+    return '-'.join(str(part) for part in [
+        replay.pk,
+        replay.content_version,
+        now().date().isoformat(),
+        user_id or 0,
+        pledge_amount(user_id=user_id) if user_id else 0,
+        entitlements.generation or 0,
+    ])
+
+
+def api_etag(request, replay):
+    if replay is None:
+        return None
+
+    # The hyperlinks depend on the host, and the fields on the query string.
+    variant = hashlib.md5('{}?{}'.format(
+        request.get_host(),
+        request.META.get('QUERY_STRING', ''),
+    ).encode('utf-8')).hexdigest()[:12]
+
+    return '{}-{}-{}'.format(replay.pk, replay.content_version, variant)
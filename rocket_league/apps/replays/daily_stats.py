@@ -0,0 +1,181 @@
+"""
+Site statistics rolled up per day in DailyStats.
+
+The stats page counted every replay, goal and distinct player in the tables
+each time it was viewed.  Instead each day keeps its number of replays and
+goals, and HyperLogLog sketches of the distinct player names and Steam IDs.
+A sketch is a fixed size array of registers which can be merged with others
+by taking the maximum of each register, so the distinct players over any
+number of days can be estimated (within a few percent) from their rows.
+"""
+import hashlib
+import math
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import DailyStats, Goal, Replay
+
+# 2 ** 11 registers of one byte each, for a standard error of about 2%.
+PRECISION = 11
+REGISTERS = 2 ** PRECISION
+
+STEAM_PLATFORMS = ['OnlinePlatform_Steam', '1']
+
+ALL_TIME_CACHE_KEY = 'daily_stats_all_time'
+ALL_TIME_CACHE_TIMEOUT = 60 * 60
+
+
+def _hash(value):
+    # Python's hash() differs between processes.
+    return int.from_bytes(hashlib.md5(str(value).encode('utf-8')).digest()[:8], 'big')
+
+
+def sketch(values):
+    registers = np.zeros(REGISTERS, dtype=np.uint8)
+    indexes = []
+    ranks = []
+
+    for value in values:
+        value = _hash(value)
+        rest = value & ((1 << (64 - PRECISION)) - 1)
+
+        indexes.append(value >> (64 - PRECISION))
+        # The position of the first set bit in the rest of the hash.
+        ranks.append(64 - PRECISION - rest.bit_length() + 1)
+
+    np.maximum.at(registers, np.array(indexes, dtype=np.intp), np.array(ranks, dtype=np.uint8))
+
+    return registers
+
+
+def load_sketch(data):
+    if not data:
+        return np.zeros(REGISTERS, dtype=np.uint8)
+
+    return np.frombuffer(bytes(data), dtype=np.uint8)
+
+
+def merge(*sketches):
+    return np.maximum.reduce([np.zeros(REGISTERS, dtype=np.uint8)] + list(sketches))
+
+
+def estimate(registers):
+    alpha = 0.7213 / (1 + 1.079 / REGISTERS)
+    count = alpha * REGISTERS ** 2 / np.sum(np.power(2.0, -registers.astype(np.float64)))
+
+    # Small counts are better estimated from the empty registers.
+    empty = np.count_nonzero(registers == 0)
+
+    if count <= 2.5 * REGISTERS and empty:
+        count = REGISTERS * math.log(REGISTERS / float(empty))
+
+    return int(round(count))
+
+
+def _add(date, **values):
+    """
+    Merge values into the sketches of a day's row, and set its other fields.
+    """
+    sketches = {
+        field: values.pop(field)
+        for field in ['player_names', 'steam_ids', 'steam_logins']
+        if field in values
+    }
+
+    with transaction.atomic():
+        DailyStats.objects.get_or_create(date=date)
+        stats = DailyStats.objects.select_for_update().get(date=date)
+
+        for field, field_values in sketches.items():
+            setattr(stats, field, merge(load_sketch(getattr(stats, field)), sketch(field_values)).tobytes())
+
+        for field, value in values.items():
+            setattr(stats, field, value)
+
+        stats.save()
+
+
+def day_counts(date):
+    """
+    The number of replays played on a day, and the goals in them.
+    """
+    return {
+        'replays': Replay.objects.filter(
+            timestamp_date=date,
+        ).count(),
+        'goals': Goal.objects.filter(
+            replay__timestamp_date=date,
+        ).count(),
+    }
+
+
+def update_daily_stats(replay_obj):
+    """
+    Count a processed replay in the stats of the day it was played.  The
+    day's totals are counted again, so reprocessing a replay doesn't count
+    it twice, and adding its players to the sketches again changes nothing.
+    """
+    if not replay_obj.processed or replay_obj.timestamp_date is None:
+        return
+
+    players = replay_obj.scoreboard_players
+
+    _add(
+        replay_obj.timestamp_date,
+        player_names=[player['player_name'] for player in players],
+        steam_ids=[
+            player['online_id'] for player in players
+            if player['platform'] in STEAM_PLATFORMS and player['online_id']
+        ],
+        **day_counts(replay_obj.timestamp_date)
+    )
+
+
+def add_steam_logins(uids):
+    _add(now().date(), steam_logins=uids)
+
+
+def summarise(days, logins=False):
+    """
+    The totals over some DailyStats rows.  The Steam accounts of people who
+    have signed in only count when `logins` is set.  The rows are merged
+    one at a time, so `days` can be an iterator.
+    """
+    steam_fields = ['steam_ids', 'steam_logins'] if logins else ['steam_ids']
+
+    replays = 0
+    goals = 0
+    players = np.zeros(REGISTERS, dtype=np.uint8)
+    steam_accounts = np.zeros(REGISTERS, dtype=np.uint8)
+
+    for day in days:
+        replays += day.replays
+        goals += day.goals
+        np.maximum(players, load_sketch(day.player_names), out=players)
+
+        for field in steam_fields:
+            np.maximum(steam_accounts, load_sketch(getattr(day, field)), out=steam_accounts)
+
+    return {
+        'replays': replays,
+        'goals': goals,
+        'players': estimate(players),
+        'steam_accounts': estimate(steam_accounts),
+    }
+
+
+def all_time_summary():
+    """
+    The totals over every day, with everyone who has signed in with Steam.
+    That means reading every row, so they're cached for a while.
+    """
+    stats = cache.get(ALL_TIME_CACHE_KEY)
+
+    if stats is None:
+        stats = summarise(DailyStats.objects.order_by().iterator(), logins=True)
+        cache.set(ALL_TIME_CACHE_KEY, stats, ALL_TIME_CACHE_TIMEOUT)
+
+    return stats
@@ -0,0 +1,168 @@
+"""
+Columnar storage for the positions pulled out of the network stream.
+
+Every rigid body update used to become its own dict in a list of lists, which
+for a full match is millions of small objects.  `FrameStore` instead keeps one
+`ActorTrack` per actor, with a typed array per column, and can hand those
+columns to NumPy without copying them.
+"""
+from array import array
+
+import numpy as np
+
+COLUMNS = ('x', 'y', 'z', 'roll', 'pitch', 'yaw')
+
+
+class ActorTrack(object):
+
+    """
+    The position and rotation of a single actor at each frame it moved.
+    """
+
+    __slots__ = ('frames', 'order', 'actors') + COLUMNS
+
+    def __init__(self):
+        self.frames = array('q')
+        # Position of the update within its frame, used to put the legacy
+        # frame data back in the order it arrived in.
+        self.order = array('q')
+        # The actor which moved.  A player's car changes over the match, and
+        # everything which isn't a car shares the 'ball' track.
+        self.actors = array('q')
+
+        for column in COLUMNS:
+            setattr(self, column, array('d'))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def append(self, frame, order, actor_id, x, y, z, roll, pitch, yaw):
+        self.frames.append(frame)
+        self.order.append(order)
+        self.actors.append(actor_id)
+        self.x.append(x)
+        self.y.append(y)
+        self.z.append(z)
+        self.roll.append(roll)
+        self.pitch.append(pitch)
+        self.yaw.append(yaw)
+
+    def frame_indices(self):
+        return np.frombuffer(self.frames, dtype=np.int64) if self.frames else np.empty(0, dtype=np.int64)
+
+    def update_order(self):
+        return np.frombuffer(self.order, dtype=np.int64) if self.order else np.empty(0, dtype=np.int64)
+
+    def actor_ids(self):
+        return np.frombuffer(self.actors, dtype=np.int64) if self.actors else np.empty(0, dtype=np.int64)
+
+    def column(self, name):
+        values = getattr(self, name)
+        return np.frombuffer(values, dtype=np.float64) if values else np.empty(0)
+
+    def positions(self):
+        """
+        An (n, 3) array of x, y, z positions.
+        """
+        return np.column_stack([self.column('x'), self.column('y'), self.column('z')])
+
+    def rotations(self):
+        """
+        An (n, 3) array of roll, pitch, yaw values.
+        """
+        return np.column_stack([self.column('roll'), self.column('pitch'), self.column('yaw')])
+
+    def last_position(self):
+        if not self.frames:
+            return None
+
+        return [json_number(self.x[-1]), json_number(self.y[-1]), json_number(self.z[-1])]
+
+    def forward_fill(self, num_frames):
+        """
+        Return a (num_frames, 3) array with the last known position of the
+        actor at every frame, or NaN before its first update.  Where an actor
+        moved more than once in a frame, the final update wins.
+        """
+        filled = np.full((num_frames, 3), np.nan)
+
+        if not self.frames:
+            return filled
+
+        frames = self.frame_indices()
+        positions = self.positions()
+
+        # Index of the latest update at or before each frame.
+        latest = np.searchsorted(frames, np.arange(num_frames), side='right') - 1
+        known = latest >= 0
+        filled[known] = positions[latest[known]]
+
+        return filled
+
+
+class FrameStore(object):
+
+    """
+    The moves of every actor in a replay, keyed by a label: the player actor
+    ID for cars and 'ball' for everything else.  Each move also records the
+    actor which made it.
+    """
+
+    __slots__ = ('tracks', 'num_frames', 'updates')
+
+    def __init__(self):
+        self.tracks = {}
+        self.num_frames = 0
+        self.updates = 0
+
+    def __len__(self):
+        return self.num_frames
+
+    def add_frame(self):
+        """
+        Start a new frame and return its index.
+        """
+        self.num_frames += 1
+        return self.num_frames - 1
+
+    def append(self, label, actor_id, frame, x, y, z, roll, pitch, yaw):
+        track = self.tracks.get(label)
+
+        if track is None:
+            track = self.tracks[label] = ActorTrack()
+
+        track.append(frame, self.updates, actor_id, x, y, z, roll, pitch, yaw)
+        self.updates += 1
+
+    def track(self, label):
+        return self.tracks.get(label)
+
+    def to_frame_data(self):
+        """
+        Export the store in the shape the location JSON has always used: a
+        list with one entry per frame, each a list of dicts for the actors
+        which moved in that frame.
+        """
+        frames = [[] for _ in range(self.num_frames)]
+        updates = []
+
+        for label, track in self.tracks.items():
+            columns = [track.x, track.y, track.z, track.roll, track.pitch, track.yaw]
+
+            for position, (frame, order) in enumerate(zip(track.frames, track.order)):
+                updates.append((order, frame, label, [column[position] for column in columns]))
+
+        updates.sort(key=lambda update: update[0])
+
+        for _, frame, label, values in updates:
+            data = {'id': label}
+            data.update(zip(COLUMNS, map(json_number, values)))
+            frames[frame].append(data)
+
+        return frames
+
+
+def json_number(value):
+    # Rattletrap gives us whole numbers for positions and rotations, keep them
+    # that way in the JSON.
+    return int(value) if value.is_integer() else value
@@ -0,0 +1,221 @@
+"""
+Heatmaps of where each actor spent its time.
+
+Positions are binned into a fixed grid over the pitch rather than counted per
+raw coordinate, so the cost of recording a position is a little arithmetic and
+the stored file has an upper bound on its size however long the match is.
+
+Time is counted in frames.  Rather than adding one to every actor's cell on
+every frame, `add_dwell_time` works out how long each of an actor's positions
+in the frame store lasted and adds those to the grid in one go.
+"""
+import math
+from array import array
+
+import numpy as np
+from django.conf import settings
+
+# The area covered by the grid, in unreal units.  This is the pitch plus the
+# goals, anything outside of it (cars on the walls, for instance) is clamped
+# into the edge bins.
+X_MIN = -4096
+X_MAX = 4096
+Y_MIN = -6016
+Y_MAX = 6016
+
+
+class Heatmap(object):
+
+    """
+    A grid of counts for each actor, keyed by the same labels as the frame
+    store: the player actor ID, or 'ball'.
+    """
+
+    def __init__(self, bin_size=None):
+        self.bin_size = bin_size or settings.HEATMAP_BIN_SIZE
+        self.width = int(math.ceil((X_MAX - X_MIN) / self.bin_size))
+        self.height = int(math.ceil((Y_MAX - Y_MIN) / self.bin_size))
+        self.counts = {}
+
+    def cell(self, x, y):
+        """
+        Return the index of the grid cell containing the given position.
+        """
+        column = int((x - X_MIN) // self.bin_size)
+        row = int((y - Y_MIN) // self.bin_size)
+
+        if column < 0:
+            column = 0
+        elif column >= self.width:
+            column = self.width - 1
+
+        if row < 0:
+            row = 0
+        elif row >= self.height:
+            row = self.height - 1
+
+        return row * self.width + column
+
+    def _counts(self, label):
+        counts = self.counts.get(label)
+
+        if counts is None:
+            counts = self.counts[label] = array('q', bytes(8 * self.width * self.height))
+
+        return counts
+
+    def add(self, label, x, y, count=1):
+        self._counts(label)[self.cell(x, y)] += count
+
+    def add_cell(self, label, cell, count=1):
+        self._counts(label)[cell] += count
+
+    def cells(self, xs, ys):
+        """
+        The cell indexes for arrays of positions, as `cell` would give them.
+        """
+        columns = np.clip(np.floor_divide(np.asarray(xs, dtype=np.float64) - X_MIN, self.bin_size), 0, self.width - 1)
+        rows = np.clip(np.floor_divide(np.asarray(ys, dtype=np.float64) - Y_MIN, self.bin_size), 0, self.height - 1)
+
+        return rows.astype(np.int64) * self.width + columns.astype(np.int64)
+
+    def add_cells(self, label, cells, counts):
+        np.add.at(np.frombuffer(self._counts(label), dtype=np.int64), cells, counts)
+
+    def grid(self, label):
+        """
+        The counts for an actor as a (height, width) array, rows running along
+        the y axis.
+        """
+        if label not in self.counts:
+            return np.zeros((self.height, self.width), dtype=np.int64)
+
+        return np.frombuffer(self.counts[label], dtype=np.int64).reshape(self.height, self.width)
+
+    def centre(self, cell):
+        row, column = divmod(cell, self.width)
+
+        return (
+            X_MIN + column * self.bin_size + self.bin_size // 2,
+            Y_MIN + row * self.bin_size + self.bin_size // 2,
+        )
+
+    def to_json(self):
+        """
+        The compact form of the heatmap: the grid geometry, and for each actor
+        the indexes of the cells it visited along with their counts.
+        """
+        actors = {}
+
+        for label in self.counts:
+            counts = self.grid(label).ravel()
+            cells = np.flatnonzero(counts)
+
+            actors[label] = {
+                'cells': cells.tolist(),
+                'counts': counts[cells].tolist(),
+            }
+
+        return {
+            'bin_size': self.bin_size,
+            'x_min': X_MIN,
+            'y_min': Y_MIN,
+            'width': self.width,
+            'height': self.height,
+            'actors': actors,
+        }
+
+    def to_legacy_json(self):
+        """
+        The heatmap in the shape heatmap.js has always been given: for each
+        actor, a count keyed by "x,y".  Each cell is reported at its centre.
+        """
+        data = {}
+
+        for label in self.counts:
+            counts = self.grid(label).ravel()
+            cells = np.flatnonzero(counts)
+
+            data[label] = {
+                '{},{}'.format(*self.centre(cell)): count
+                for cell, count in zip(cells.tolist(), counts[cells].tolist())
+            }
+
+        return data
+
+
+def _paused_before(frames, paused):
+    """
+    The number of frames before each of `frames` which fall in the paused
+    (start, end) ranges.  The ranges are in order and don't overlap.
+    """
+    if not paused:
+        return np.zeros(len(frames), dtype=np.int64)
+
+    starts, ends = np.asarray(paused, dtype=np.int64).T
+    lengths = ends - starts
+    before = np.concatenate([[0], np.cumsum(lengths)])
+
+    # The last range starting at or before each frame, and the ranges before
+    # it.
+    index = np.searchsorted(starts, frames, side='right') - 1
+    last = np.maximum(index, 0)
+    partial = np.where(index >= 0, np.clip(frames - starts[last], 0, lengths[last]), 0)
+
+    return before[last] + partial
+
+
+def add_dwell_time(heatmap, frames, xs, ys, changes, num_frames, paused=()):
+    """
+    Add the number of frames an actor spent in each cell to the heatmap.
+    `frames`, `xs` and `ys` are the frames it moved in, in order, and where it
+    moved to.  `changes` are the (frame, label, spawned) changes to the label
+    it's counted under, in order, with a label of None while it isn't counted.
+    `spawned` marks the actor being spawned or destroyed, after which it has no
+    position until it next moves.
+
+    Each position counts under the current label until the actor next moves or
+    changes, apart from during the `paused` (start, end) ranges.  Where there's
+    more than one event in a frame, the state at the end of the frame wins.
+    """
+    frames = np.asarray(frames, dtype=np.int64)
+    labels = []
+    change_frames = np.empty(len(changes), dtype=np.int64)
+    change_labels = np.empty(len(changes), dtype=np.int64)
+    spawns = np.empty(len(changes), dtype=bool)
+
+    for position, (frame, label, spawned) in enumerate(changes):
+        if label is not None and label not in labels:
+            labels.append(label)
+
+        change_frames[position] = frame
+        change_labels[position] = -1 if label is None else labels.index(label)
+        spawns[position] = spawned
+
+    # A change comes before a move in the same frame, as the actor has to be
+    # spawned before it can move.  Events of the same kind keep their order.
+    starts = np.concatenate([change_frames, frames])
+    is_change = np.concatenate([np.ones(len(changes), dtype=bool), np.zeros(len(frames), dtype=bool)])
+    sets_cell = np.concatenate([spawns, np.ones(len(frames), dtype=bool)])
+    cells = np.concatenate([np.full(len(changes), -1, dtype=np.int64), heatmap.cells(xs, ys)])
+    label_indexes = np.concatenate([change_labels, np.full(len(frames), -1, dtype=np.int64)])
+
+    order = np.lexsort((~is_change, starts))
+    starts = starts[order]
+
+    # The cell and label in effect after each event.
+    events = np.arange(len(starts))
+    latest_cell = np.maximum.accumulate(np.where(sets_cell[order], events, -1))
+    latest_label = np.maximum.accumulate(np.where(is_change[order], events, -1))
+    cells = np.where(latest_cell >= 0, cells[order][latest_cell], -1)
+    label_indexes = np.where(latest_label >= 0, label_indexes[order][latest_label], -1)
+
+    ends = np.append(starts[1:], num_frames)
+    counts = ends - starts - (_paused_before(ends, paused) - _paused_before(starts, paused))
+    counted = (cells >= 0) & (label_indexes >= 0) & (counts > 0)
+
+    for index, label in enumerate(labels):
+        in_label = counted & (label_indexes == index)
+
+        if in_label.any():
+            heatmap.add_cells(label, cells[in_label], counts[in_label])
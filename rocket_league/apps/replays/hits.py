@@ -0,0 +1,239 @@
+"""
+Ball touch attribution, worked out over the whole match at once.
+
+While the frames are walked we only note down what's needed: samples of the
+ball's state whenever it moves, when each player gets into or out of a car and
+which team each player is on.  Once the walk is finished `find_touches` looks
+for changes in the ball's angular velocity and measures the distance from the
+ball to every car at those frames with NumPy, giving a timeline of touches
+that the shot data (and anything else) can be read from.
+"""
+from array import array
+
+import numpy as np
+
+from .frames import json_number
+
+# The furthest a car has been seen from the ball when a touch was confirmed by
+# the game, used for touches the game didn't tell us about.
+MAX_TOUCH_DISTANCE = 350
+
+NO_TEAM = -1
+NO_POSSESSION = -2
+
+
+class BallTimeline(object):
+
+    """
+    The state of the ball, sampled at the end of every frame in which it
+    moved or was replaced by a new ball.
+    """
+
+    __slots__ = (
+        'frames', 'angular_velocity', 'stopped', 'spawned', 'confirmed',
+        'possession', 'has_position', 'position',
+    )
+
+    def __init__(self):
+        self.frames = array('q')
+        self.angular_velocity = array('d')
+        self.stopped = array('b')  # Whether the angular velocity was null.
+        self.spawned = array('b')
+        self.confirmed = array('b')
+        self.possession = array('q')
+        self.has_position = array('b')
+        self.position = array('d')
+
+    def __len__(self):
+        return len(self.frames)
+
+    def append(self, frame, angular_velocity, spawned, confirmed, possession, position):
+        self.frames.append(frame)
+
+        if angular_velocity is None:
+            self.stopped.append(True)
+            self.angular_velocity.extend([0, 0, 0])
+        else:
+            self.stopped.append(False)
+            self.angular_velocity.extend([angular_velocity['x'], angular_velocity['y'], angular_velocity['z']])
+
+        self.spawned.append(spawned)
+        self.confirmed.append(confirmed)
+        self.possession.append(NO_POSSESSION if possession is None else possession)
+
+        if position is None:
+            self.has_position.append(False)
+            self.position.extend([0, 0, 0])
+        else:
+            self.has_position.append(True)
+            self.position.extend(position)
+
+    def column(self, name, dtype):
+        values = getattr(self, name)
+        return np.frombuffer(values, dtype=dtype) if values else np.empty(0, dtype=dtype)
+
+    def hits(self):
+        """
+        Return the sample indexes at which the ball changed direction or speed
+        and could have been touched: it has a position, and it didn't only
+        just appear.
+        """
+        angular_velocity = self.column('angular_velocity', np.float64).reshape(-1, 3)
+        stopped = self.column('stopped', np.int8).astype(bool)
+
+        changed = np.ones(len(self), dtype=bool)
+        changed[1:] = (
+            (stopped[1:] != stopped[:-1]) |
+            (~stopped[1:] & np.any(angular_velocity[1:] != angular_velocity[:-1], axis=1))
+        )
+
+        return np.flatnonzero(
+            changed &
+            ~self.column('spawned', np.int8).astype(bool) &
+            self.column('has_position', np.int8).astype(bool)
+        )
+
+
+class Timeline(object):
+
+    """
+    A value for each player which changes at known frames, such as the car
+    they're in or the team they're on.
+    """
+
+    def __init__(self):
+        self.changes = {}  # Player -> ([frame, ...], [value, ...])
+
+    def set(self, player, frame, value):
+        frames, values = self.changes.setdefault(player, ([], []))
+        frames.append(frame)
+        values.append(value)
+
+    def at(self, player, frames, default):
+        """
+        Return the value for a player at each of the given frames.  Where it
+        changed more than once in a frame the last change wins.
+        """
+        if player not in self.changes:
+            return np.full(len(frames), default)
+
+        change_frames, values = self.changes[player]
+        latest = np.searchsorted(change_frames, frames, side='right') - 1
+        result = np.asarray(values)[np.maximum(latest, 0)]
+        result[latest < 0] = default
+
+        return result
+
+    def changed_at(self, player, frames):
+        """
+        Return the frame of the most recent change for a player at each of the
+        given frames, or -1 if it hadn't changed yet.
+        """
+        if player not in self.changes:
+            return np.full(len(frames), -1)
+
+        change_frames = np.asarray(self.changes[player][0])
+        latest = np.searchsorted(change_frames, frames, side='right') - 1
+
+        return np.where(latest >= 0, change_frames[np.maximum(latest, 0)], -1)
+
+
+class TouchTimeline(object):
+
+    """
+    The touches of the ball we were able to attribute to a player, in frame
+    order.
+    """
+
+    def __init__(self, frames, teams, players, positions):
+        self.frames = frames
+        self.teams = teams
+        self.players = players
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.frames)
+
+    def last_touch(self, team, start, end):
+        """
+        Return the position of the car which made the last touch for `team`
+        in frames `start` up to but not including `end`.
+        """
+        first = np.searchsorted(self.frames, start, side='left')
+        last = np.searchsorted(self.frames, end, side='left')
+        touches = np.flatnonzero(self.teams[first:last] == team)
+
+        if not len(touches):
+            return None
+
+        return [json_number(value) for value in self.positions[first + touches[-1]].tolist()]
+
+
+def find_touches(ball, frame_store, cars, teams, team_numbers):
+    """
+    Work out which player touched the ball each time it changed direction.
+
+    The closest car from the team in possession gets the touch, provided it's
+    within MAX_TOUCH_DISTANCE of the ball.  If the game told us the ball had
+    been touched that frame, the closest car gets it however far away it is.
+
+    `cars` is a Timeline of whether each player is in a car, `teams` one of
+    the team actor each player belongs to, and `team_numbers` maps team actors
+    to their team number.
+    """
+    hits = ball.hits()
+    frames = ball.column('frames', np.int64)[hits]
+    possession = ball.column('possession', np.int64)[hits]
+    confirmed = ball.column('confirmed', np.int8)[hits].astype(bool)
+    ball_positions = ball.column('position', np.float64).reshape(-1, 3)[hits]
+
+    players = [label for label in frame_store.tracks if label != 'ball']
+
+    distances = np.full((len(frames), len(players)), np.inf)
+    positions = np.zeros((len(frames), len(players), 3))
+
+    for column, player in enumerate(players):
+        track = frame_store.track(player)
+        track_frames = track.frame_indices()
+
+        # The car's last known position at each hit.
+        latest = np.searchsorted(track_frames, frames, side='right') - 1
+        known = latest >= 0
+        latest = np.maximum(latest, 0)
+
+        # Only positions reported since the player got into their current car
+        # count, the previous car may be long gone.
+        in_car = cars.at(player, frames, False).astype(bool)
+        known &= in_car & (track_frames[latest] >= cars.changed_at(player, frames))
+
+        team_actors = teams.at(player, frames, NO_TEAM)
+        player_teams = np.array([team_numbers.get(team_actor, NO_TEAM) for team_actor in team_actors.tolist()], dtype=np.int64)
+
+        valid = known & (player_teams == possession)
+
+        if not valid.any():
+            continue
+
+        car_positions = track.positions()[latest]
+        offset = car_positions - ball_positions
+        dx, dy, dz = offset[:, 0], offset[:, 1], offset[:, 2]
+        player_distances = np.sqrt(dx * dx + dy * dy + dz * dz)
+
+        valid &= confirmed | (player_distances <= MAX_TOUCH_DISTANCE)
+
+        distances[valid, column] = player_distances[valid]
+        positions[:, column] = car_positions
+
+    if players:
+        closest = np.argmin(distances, axis=1)
+        touched = np.isfinite(distances[np.arange(len(frames)), closest])
+    else:
+        closest = np.zeros(len(frames), dtype=np.int64)
+        touched = np.zeros(len(frames), dtype=bool)
+
+    return TouchTimeline(
+        frames=frames[touched],
+        teams=possession[touched],
+        players=[players[column] for column in closest[touched].tolist()],
+        positions=positions[np.flatnonzero(touched), closest[touched]],
+    )
@@ -0,0 +1,109 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from ...models import Goal, Player, Replay
+from ...serializers import ReplaySerializer
+
+
+def seed_replays(count, team_size=3, seed=0):
+    """
+    Create processed replays with players and goals to serialize.
+    """
+    rng = random.Random(seed)
+
+    for index in range(count):
+        replay = Replay.objects.create(
+            processed=True,
+            replay_id='BENCHMARK{:023d}'.format(index),
+            team_sizes=team_size,
+            num_frames=9000,
+            record_fps=30,
+        )
+
+        players = [
+            Player.objects.create(
+                replay=replay,
+                player_name='Player {}'.format(player),
+                team=player % 2,
+                score=rng.randint(0, 800),
+                online_id=str(76561197960265728 + rng.randint(0, 10 ** 6)),
+                platform='1',
+            )
+            for player in range(team_size * 2)
+        ]
+
+        for number in range(1, rng.randint(1, 8) + 1):
+            Goal.objects.create(
+                replay=replay,
+                number=number,
+                player=rng.choice(players),
+                frame=rng.randint(0, 9000),
+            )
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the replay API list and retrieve responses, with and without "
+        "their relations loaded up front, against a seeded database.  The "
+        "seeded replays are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replays', type=int, default=200, help='Replays to seed.')
+        parser.add_argument('--repeat', type=int, default=5, help='Take the best of this many runs.')
+        parser.add_argument('--query', default='', help='Query string to pass, e.g. "fields=id,map&expand=map".')
+
+    def measure(self, func, repeat):
+        best = None
+
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+
+            if best is None or elapsed < best:
+                best = elapsed
+
+        return best, len(queries)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        request = Request(factory.get('/api/replays/?{}'.format(options['query']), HTTP_HOST=settings.SITE_DOMAIN))
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+
+        def serialize(queryset, many):
+            return ReplaySerializer(queryset, many=many, context={'request': request}).data
+
+        with transaction.atomic():
+            seed_replays(options['replays'])
+
+            replays = Replay.objects.filter(replay_id__startswith='BENCHMARK')
+            pk = replays.order_by('pk').values_list('pk', flat=True)[0]
+
+            cases = [
+                ('list', lambda queryset: serialize(list(queryset[:page_size]), True)),
+                ('retrieve', lambda queryset: serialize(queryset.get(pk=pk), False)),
+            ]
+
+            for name, func in cases:
+                plain = self.measure(lambda: func(replays), options['repeat'])
+                prepared = self.measure(lambda: func(ReplaySerializer.setup_queryset(replays, request)), options['repeat'])
+
+                self.stdout.write('{}: plain {:.3f}s in {} queries, prefetched {:.3f}s in {} queries, {:.1f}x'.format(
+                    name,
+                    plain[0],
+                    plain[1],
+                    prepared[0],
+                    prepared[1],
+                    plain[0] / prepared[0] if prepared[0] else 0,
+                ))
+
+            transaction.set_rollback(True)
@@ -0,0 +1,304 @@
+import math
+import random
+import time
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand
+
+from ...boost import boost_chart, chart_players
+from ...models import Replay
+
+
+def legacy_boost_chart(players, goal_frames, num_frames):
+    """
+    The boost_chart_data template tag as it was before it was moved to
+    NumPy, kept as the baseline for comparisons.
+    """
+    boost_values = {}
+    boost_consumption = {}
+
+    team_boost_consumption = {-1: {}, 0: {}, 1: {}}
+
+    player_names = {}
+    team_boost_values = {
+        -1: {},
+        0: {},
+        1: {}
+    }
+
+    boost_distribution = {-1: {}, 0: {}, 1: {}}
+
+    boost_consumed_values = {}
+    boost_data_values = {}
+
+    for actor_id, team, player_name, frames, values in players:
+
+        if actor_id not in boost_values:
+            boost_values[actor_id] = OrderedDict()
+
+        if actor_id not in boost_consumption:
+            boost_consumption[actor_id] = {}
+
+        if actor_id not in player_names:
+            player_names[actor_id] = player_name
+
+        if actor_id not in boost_consumed_values:
+            boost_consumed_values[actor_id] = 0
+
+        if actor_id not in boost_data_values:
+            boost_data_values[actor_id] = OrderedDict(zip(frames, values))
+
+        # Calculate the tween values.
+        previous_value = 85
+        for key, value in boost_data_values[actor_id].items():
+            # If the value is 85, we need to check if a goal was just scored
+            # as we don't want to tween or register boost as being consumed
+            # by the goal reset.
+            reset = False
+            if value == 85:
+                buffer_frames = set(range(key - 75, key))
+                reset = len(buffer_frames.intersection(goal_frames)) > 0
+
+            if value < previous_value:
+                # Store the diff.
+                # Determine how many frames of tweening this change required.
+                frame_diff_required = math.floor((previous_value - value) / (255 / 74))
+
+                if reset:
+                    boost_values[actor_id][key - frame_diff_required] = math.ceil(previous_value * (100 / 255))
+                else:
+                    boost_consumed_values[actor_id] += math.ceil((previous_value - value) * (100 / 255))
+                    boost_consumption[actor_id][key] = boost_consumed_values[actor_id]
+
+                    if key not in team_boost_consumption[team]:
+                        team_boost_consumption[team][key] = 0
+                    team_boost_consumption[team][key] += math.ceil((previous_value - value) * (100 / 255))
+
+                    for frame in range(key - frame_diff_required + 1, key):
+                        tween_value = math.ceil(value + ((key - frame) * (255 / 74)))
+
+                        if frame not in boost_values[actor_id]:
+                            # Add data.
+                            rendered_value = math.ceil(tween_value * (100 / 255))
+
+                            boost_values[actor_id][frame] = rendered_value
+
+                            if frame not in team_boost_values[team]:
+                                team_boost_values[team][frame] = 0
+
+                            team_boost_values[team][frame] += rendered_value
+
+                            # Boost distribution
+                            if rendered_value not in boost_distribution[team]:
+                                boost_distribution[team][rendered_value] = 0
+                            boost_distribution[team][rendered_value] += 1
+
+                            previous_value = tween_value
+            else:
+                if key > 0:
+                    # Add data.
+                    rendered_value = math.ceil(previous_value * (100 / 255))
+
+                    boost_values[actor_id][key - 1] = rendered_value
+
+                    if key - 1 not in team_boost_values.get(team, {}):
+                        team_boost_values[team][key - 1] = 0
+
+                    team_boost_values[team][key - 1] += rendered_value
+
+                    # Boost distribution
+                    if rendered_value not in boost_distribution[team]:
+                        boost_distribution[team][rendered_value] = 0
+                    boost_distribution[team][rendered_value] += 1
+
+            # Add data.
+            rendered_value = math.ceil(value * (100 / 255))
+            boost_values[actor_id][key] = rendered_value
+
+            if key not in team_boost_values[team]:
+                team_boost_values[team][key] = 0
+
+            team_boost_values[team][key] += rendered_value
+
+            # Boost distribution
+            if rendered_value not in boost_distribution[team]:
+                boost_distribution[team][rendered_value] = 0
+            boost_distribution[team][rendered_value] += 1
+
+            previous_value = value
+
+    for key in boost_consumption:
+        boost_consumption[key] = OrderedDict(sorted(boost_consumption[key].items()))
+
+        # Ensure the last frame is present for each dict.
+        if num_frames not in boost_consumption[key] and len(boost_consumption[key]) > 0:
+            boost_consumption[key][num_frames] = boost_consumption[key][next(reversed(boost_consumption[key]))]
+
+    team_boost_consumption_full = {-1: OrderedDict(), 0: OrderedDict(), 1: OrderedDict()}
+
+    for key in team_boost_consumption:
+        # team_boost_consumption[key] = OrderedDict(sorted(team_boost_consumption[key].items()))
+        current_value = 0
+
+        # Fix the values.
+        for frame in range(num_frames + 1):
+            team_boost_consumption_full[key][frame] = current_value
+
+            if frame in team_boost_consumption[key]:
+                team_boost_consumption_full[key][frame] += team_boost_consumption[key][frame]
+
+            current_value = team_boost_consumption_full[key][frame]
+
+    for key in boost_values:
+        boost_values[key] = OrderedDict(sorted(boost_values[key].items()))
+
+        # Ensure the last frame is present for each dict.
+        if num_frames not in boost_values[key] and len(boost_values[key]) > 0:
+            boost_values[key][num_frames] = boost_values[key][next(reversed(boost_values[key]))]
+
+    # Generate the team boost distribution charts.
+    team_boost_values_full = {-1: OrderedDict(), 0: OrderedDict(), 1: OrderedDict()}
+
+    for frame in range(num_frames):
+        for team in range(2):
+            if frame in team_boost_values[team]:
+                team_boost_values_full[team][frame] = team_boost_values[team][frame]
+            else:
+                if len(team_boost_values_full[team]) > 0:
+                    value = team_boost_values_full[team][next(reversed(team_boost_values_full[team]))]
+                else:
+                    value = 0
+
+                team_boost_values_full[team][frame] = value
+
+    team_boost_values = team_boost_values_full
+
+    # Get the maximum value for both teams, in terms of boost value. Pad any empty values.
+    boost_distribution_full = {-1: OrderedDict(), 0: OrderedDict(), 1: OrderedDict()}
+    for value in range(max(list(boost_distribution[0].keys()) + list(boost_distribution[1].keys())) + 1):
+        for team in range(2):
+            if value not in boost_distribution[team]:
+                boost_distribution_full[team][value] = 0
+            else:
+                boost_distribution_full[team][value] = boost_distribution[team][value]
+
+    return {
+        'boost_values': boost_values,
+        'team_boost_values': team_boost_values,
+        'boost_consumption': boost_consumption,
+        'team_boost_consumption': team_boost_consumption_full,
+        'boost_distribution': boost_distribution_full,
+        'player_names': player_names,
+    }
+
+
+def simulate_boost(seed, num_frames=9000, team_size=3):
+    """
+    Build boost timelines for a match: boost used in bursts, small and large
+    pickups, and everyone reset to 85 at each kickoff.
+    """
+    rng = random.Random(seed)
+
+    goal_frames = sorted(rng.sample(range(300, num_frames), rng.randint(0, 8)))
+    kickoffs = [frame + rng.randint(1, 70) for frame in goal_frames]
+
+    players = []
+
+    for index in range(team_size * 2):
+        frames = []
+        values = []
+        value = 85
+        frame = rng.randint(0, 30)
+
+        while frame < num_frames:
+            if kickoffs and any(0 <= frame - kickoff < 5 for kickoff in kickoffs):
+                value = 85
+            elif rng.random() < 0.4 and value > 0:
+                value = max(0, value - rng.randint(1, 120))
+            elif rng.random() < 0.3:
+                value = 255
+            else:
+                value = min(255, value + rng.choice([28, 29, 30, rng.randint(1, 60)]))
+
+            frames.append(frame)
+            values.append(value)
+            frame += rng.randint(1, 40)
+
+        players.append((index + 10, index % 2, 'Player {}'.format(index), frames, values))
+
+    return players, goal_frames, num_frames
+
+
+def current_boost_chart(players, goal_frames, num_frames):
+    return boost_chart(players, goal_frames, num_frames)
+
+
+class Command(BaseCommand):
+    help = "Compare the speed and output of the boost chart data against the legacy template tag"
+
+    def add_arguments(self, parser):
+        parser.add_argument('replays', nargs='*', type=int, help='Replay IDs to benchmark.')
+        parser.add_argument('--longest', type=int, default=0, help='Also benchmark this many of the longest replays.')
+        parser.add_argument('--synthetic', type=int, default=0, help='Also benchmark this many simulated matches.')
+        parser.add_argument('--frames', type=int, default=18000, help='Length of the simulated matches.')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        matches = []
+
+        replays = list(Replay.objects.filter(pk__in=options['replays']))
+
+        if options['longest']:
+            replays += list(Replay.objects.filter(
+                num_frames__isnull=False,
+            ).exclude(
+                pk__in=options['replays'],
+            ).order_by('-num_frames')[:options['longest']])
+
+        for replay in replays:
+            # Load the data up front so only the chart building is timed.
+            matches.append(('replay {}'.format(replay.pk), (
+                [
+                    (actor_id, team, player_name, frames.tolist(), values.tolist())
+                    for actor_id, team, player_name, frames, values in chart_players(replay)
+                ],
+                list(replay.goal_set.values_list('frame', flat=True)),
+                replay.num_frames or 0,
+            )))
+
+        for seed in range(options['synthetic']):
+            matches.append(('simulated {}'.format(seed), simulate_boost(seed, options['frames'])))
+
+        totals = {'legacy': 0, 'current': 0}
+
+        for name, match in matches:
+            timings = {}
+            results = {}
+
+            for implementation, func in [('legacy', legacy_boost_chart), ('current', current_boost_chart)]:
+                best = None
+
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    results[implementation] = func(*match)
+                    elapsed = time.perf_counter() - start
+
+                    if best is None or elapsed < best:
+                        best = elapsed
+
+                timings[implementation] = best
+                totals[implementation] += best
+
+            self.stdout.write('{} ({} frames): legacy {:.3f}s, current {:.3f}s, {:.1f}x, output {}'.format(
+                name,
+                match[2],
+                timings['legacy'],
+                timings['current'],
+                timings['legacy'] / timings['current'] if timings['current'] else 0,
+                'matches' if results['legacy'] == results['current'] else 'DIFFERS',
+            ))
+
+        if totals['current']:
+            self.stdout.write('Total: legacy {:.3f}s, current {:.3f}s, {:.1f}x'.format(
+                totals['legacy'], totals['current'], totals['legacy'] / totals['current'],
+            ))
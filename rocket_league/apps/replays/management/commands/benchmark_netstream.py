@@ -0,0 +1,541 @@
+import copy
+import glob
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...heatmaps import Heatmap
+from ...netstream import NetstreamParser
+from ...parser import distance, flatten_value, get_value
+from ...rattletrap import iter_command, rattletrap_binary
+
+
+def legacy_netstream(goals, frames):
+    """
+    The frame loop as it was before the netstream parser was split out into
+    handlers, kept as the baseline for comparisons.
+    """
+    last_hits = {
+        0: None,
+        1: None
+    }
+
+    actors = {}  # All actors
+    player_actors = {}  # XXX: This will be used to make the replay.save() easier.
+    match_goals = {}
+    teaminfo_score = {}
+    goal_actors = {}
+    team_data = {}
+    actor_positions = {}  # The current position data for all actors. Do we need this?
+    player_cars = {}  # Car -> Player actor ID mappings.
+    ball_angular_velocity = None  # The current angular velocity of the ball.
+    ball_possession = None  # The team currently in possession of the ball.
+    cars_frozen = False  # Whether the cars are frozen in place (3.. 2.. 1..)
+    shot_data = []  # The locations of the player and the ball when goals were scored.
+    unknown_boost_data = {}  # Holding dict for boosts without player data.
+    ball_actor_id = None
+    replay_fields = {}
+
+    location_data = []  # Used for the location JSON.
+    boost_data = {}  # Used for the boost stats.
+    heatmap_data = {}
+    seconds_mapping = {}  # Frame -> seconds remaining mapping.
+
+    for index, frame in enumerate(frames):
+        # Add an empty location list for this frame.
+        location_data.append([])
+
+        ball_hit = False
+        confirmed_ball_hit = False
+        ball_spawned = False
+
+        if index in goals:
+            # Get the ball position.
+            ball_actor_id = list(filter(lambda x: actors[x]['class_name'] in ['TAGame.Ball_TA', 'TAGame.Ball_Breakout_TA'], actors))[0]
+            ball_position = actor_positions[ball_actor_id]
+
+            # XXX: Update this to also register the hitter?
+            hit_position = last_hits[goals[index]['PlayerTeam']]
+
+            shot_data.append({
+                'player': hit_position,
+                'ball': ball_position,
+                'frame': index
+            })
+
+            # Reset the last hits.
+            last_hits = {
+                0: None,
+                1: None
+            }
+
+        # Handle any new actors.
+        for replication in frame['replications']:
+            actor_id = int(replication['actor_id']['value'])
+            replication_type = list(replication['value'].keys())[0]
+            value = replication['value'][replication_type]
+            flattened_value = flatten_value(value)
+
+            if replication_type == 'spawned':
+                if actor_id not in actors:
+                    actors[actor_id] = value
+
+                if 'Engine.Pawn:PlayerReplicationInfo' in flattened_value:
+                    player_actor_id = value['Engine.Pawn:PlayerReplicationInfo']['value']
+                    player_cars[player_actor_id] = actor_id
+
+                if value['class_name'] == 'TAGame.Ball_TA':
+                    ball_spawned = True
+                elif value['class_name'] == 'TAGame.PRI_TA':
+                    player_actors[actor_id] = value
+                    player_actors[actor_id]['joined'] = index
+                elif value['class_name'] == 'TAGame.Team_Soccar_TA':
+                    team_data[actor_id] = value['object_name'].replace('Archetypes.Teams.Team', '')
+
+            # Handle any updates to existing actors.
+            elif replication_type == 'updated':
+                if (
+                    'Engine.PlayerReplicationInfo:Team' in flattened_value and
+                    not flattened_value['Engine.PlayerReplicationInfo:Team']['value']
+                ):
+                    del flattened_value['Engine.PlayerReplicationInfo:Team']
+
+                # If an actor is getting their team value nuked, store what it was
+                # so we can use it later on.
+                if (
+                    'Engine.PlayerReplicationInfo:Team' in flattened_value and
+                    flattened_value['Engine.PlayerReplicationInfo:Team']['value'] == -1 and
+                    actors[actor_id]['Engine.PlayerReplicationInfo:Team']['value'] != -1
+                ):
+                    actors[actor_id]['Engine.PlayerReplicationInfo:CachedTeam'] = actors[actor_id]['Engine.PlayerReplicationInfo:Team']
+
+                # Merge the new properties with the existing.
+                if actors[actor_id] != value:
+                    actors[actor_id] = {**actors[actor_id], **flattened_value}
+
+                    if actor_id in player_actors:
+                        player_actors[actor_id] = actors[actor_id]
+
+                if 'Engine.Pawn:PlayerReplicationInfo' in flattened_value:
+                    player_actor_id = flattened_value['Engine.Pawn:PlayerReplicationInfo']['value']
+                    player_cars[player_actor_id] = actor_id
+
+            # Handle removing any destroyed actors.
+            elif replication_type == 'destroyed':
+                del actors[actor_id]
+
+                if actor_id in player_actors:
+                    player_actors[actor_id]['left'] = index
+            else:
+                raise Exception('Unhandled replication_type: {}'.format(replication_type))
+
+        # Loop over actors which have changed in this frame.
+        for replication in frame['replications']:
+            actor_id = int(replication['actor_id']['value'])
+            replication_type = list(replication['value'].keys())[0]
+            value = replication['value'][replication_type]
+            flattened_value = flatten_value(value)
+
+            if replication_type not in ['spawned', 'updated']:
+                continue
+
+            # Look for any position data.
+            if 'TAGame.RBActor_TA:ReplicatedRBState' in flattened_value:
+                location = flattened_value['TAGame.RBActor_TA:ReplicatedRBState']['value']['location']
+                rotation = flattened_value['TAGame.RBActor_TA:ReplicatedRBState']['value']['rotation']
+
+                actor_positions[actor_id] = [location['x'], location['y'], location['z']]
+
+                # Get the player actor id.
+                real_actor_id = actor_id
+
+                for player_actor_id, car_actor_id in player_cars.items():
+                    if actor_id == car_actor_id:
+                        real_actor_id = player_actor_id
+                        break
+
+                if real_actor_id == actor_id:
+                    real_actor_id = 'ball'
+
+                data_dict = {'id': real_actor_id}
+                data_dict['x'] = location['x']
+                data_dict['y'] = location['y']
+                data_dict['z'] = location['z']
+
+                # print(rotation)
+                data_dict['roll'] = rotation['x']['value']
+                data_dict['pitch'] = rotation['y']['value']
+                data_dict['yaw'] = rotation['z']['value']
+
+                location_data[index].append(data_dict)
+
+            # If this property exists, the ball has changed possession.
+            if 'TAGame.Ball_TA:HitTeamNum' in flattened_value:
+                ball_hit = confirmed_ball_hit = True
+                hit_team_num = flattened_value['TAGame.Ball_TA:HitTeamNum']['value']
+                ball_possession = hit_team_num
+
+                # Clean up the actor positions.
+                actor_positions_copy = actor_positions.copy()
+                for actor_position in actor_positions_copy:
+                    found = False
+
+                    for car in player_cars:
+                        if actor_position == player_cars[car]:
+                            found = True
+
+                    if not found and actor_position != ball_actor_id:
+                        del actor_positions[actor_position]
+
+            # Store the boost data for each actor at each frame where it changes.
+            if 'TAGame.CarComponent_Boost_TA:ReplicatedBoostAmount' in flattened_value:
+                boost_value = flattened_value['TAGame.CarComponent_Boost_TA:ReplicatedBoostAmount']['value']
+                assert 0 <= boost_value <= 255, 'Boost value {} is not in range 0-255.'.format(boost_value)
+
+                if actor_id not in boost_data:
+                    boost_data[actor_id] = {}
+
+                # Sometimes we have a boost component without a reference to
+                # a car. We don't want to lose that data, so stick it into a
+                # holding dictionary until we can figure out who it belongs to.
+
+                if 'TAGame.CarComponent_TA:Vehicle' not in actors[actor_id]:
+                    if actor_id not in unknown_boost_data:
+                        unknown_boost_data[actor_id] = {}
+
+                    unknown_boost_data[actor_id][index] = boost_value
+                else:
+                    car_id = actors[actor_id]['TAGame.CarComponent_TA:Vehicle']['value']
+
+                    # Find out which player this car belongs to.
+                    try:
+                        player_actor_id = [
+                            player_actor_id
+                            for player_actor_id, car_actor_id in player_cars.items()
+                            if car_actor_id == car_id
+                        ][0]
+
+                        if player_actor_id not in boost_data:
+                            boost_data[player_actor_id] = {}
+
+                        boost_data[player_actor_id][index] = boost_value
+
+                        # Attach any floating data (if we can).
+                        if actor_id in unknown_boost_data:
+                            for frame_index, boost_value in unknown_boost_data[actor_id].items():
+                                boost_data[player_actor_id][frame_index] = boost_value
+
+                            del unknown_boost_data[actor_id]
+
+                    except IndexError:
+                        pass
+
+            # Store the mapping of frame -> clock time.
+            if 'TAGame.GameEvent_Soccar_TA:SecondsRemaining' in flattened_value:
+                seconds_mapping[index] = flattened_value['TAGame.GameEvent_Soccar_TA:SecondsRemaining']['value']
+
+            # See if the cars are frozen in place.
+            if 'TAGame.GameEvent_TA:ReplicatedGameStateTimeRemaining' in flattened_value:
+                if flattened_value['TAGame.GameEvent_TA:ReplicatedGameStateTimeRemaining']['value'] == 3:
+                    cars_frozen = True
+                elif flattened_value['TAGame.GameEvent_TA:ReplicatedGameStateTimeRemaining']['value'] == 0:
+                    cars_frozen = False
+
+            # Get the camera details.
+            if 'TAGame.CameraSettingsActor_TA:ProfileSettings' in flattened_value:
+                if actors[actor_id]['class_name'] == 'TAGame.CameraSettingsActor_TA':
+                    # Define some short variable names to stop the next line
+                    # being over 200 characters long.  This block of code
+                    # makes new replays have a camera structure which is
+                    # similar to that of the old replays - where the camera
+                    # settings are directly attached to the player rather
+                    # than a CameraActor (which is what the actor in this
+                    # current loop is).
+
+                    csa = 'TAGame.CameraSettingsActor_TA:PRI'
+                    ps = 'TAGame.CameraSettingsActor_TA:ProfileSettings'
+                    cs = 'TAGame.PRI_TA:CameraSettings'
+
+                    if csa in flattened_value:
+                        player_actor_id = flattened_value[csa]['value']
+                        actors[player_actor_id][cs] = flattened_value[ps]['value']
+
+            if 'Engine.GameReplicationInfo:ServerName' in flattened_value:
+                replay_fields['server_name'] = flattened_value['Engine.GameReplicationInfo:ServerName']['value']
+
+            if 'ProjectX.GRI_X:ReplicatedGamePlaylist' in flattened_value:
+                replay_fields['playlist'] = flattened_value['ProjectX.GRI_X:ReplicatedGamePlaylist']['value']
+
+            if 'TAGame.GameEvent_Team_TA:MaxTeamSize' in flattened_value:
+                replay_fields['team_sizes'] = flattened_value['TAGame.GameEvent_Team_TA:MaxTeamSize']['value']
+
+            if 'TAGame.PRI_TA:MatchGoals' in flattened_value:
+                # Get the closest goal to this frame.
+                mg = flattened_value['TAGame.PRI_TA:MatchGoals']
+                mg_increased = False
+
+                if mg['value'] > match_goals.get(actor_id, 0):
+                    match_goals[actor_id] = mg['value']
+                    mg_increased = True
+
+                if index not in match_goals and mg_increased:
+                    goal_actors[index] = actor_id
+                    match_goals[actor_id] = mg['value']
+
+            if 'Engine.TeamInfo:Score' in flattened_value:
+                tis = flattened_value['Engine.TeamInfo:Score']
+                tis_increased = False
+
+                if tis['value'] > teaminfo_score.get(actor_id, 0):
+                    teaminfo_score[actor_id] = tis['value']
+                    tis_increased = True
+
+                if index not in goal_actors and tis_increased:
+                    goal_actors[index] = actor_id
+
+        # Work out which direction the ball is travelling and if it has
+        # changed direction or speed.
+        ball = None
+        ball_actor_id = None
+        for actor_id, value in actors.items():
+            if value['class_name'] == 'TAGame.Ball_TA':
+                ball_actor_id = actor_id
+                ball = value
+                break
+
+        ball_hit = False
+
+        # Take a look at the ball this frame, has anything changed?
+        if (
+            ball and
+            'TAGame.RBActor_TA:ReplicatedRBState' in ball and
+            'angular_velocity' in ball['TAGame.RBActor_TA:ReplicatedRBState']['value']
+        ):
+            new_ball_angular_velocity = ball['TAGame.RBActor_TA:ReplicatedRBState']['value']['angular_velocity']
+
+            # The ball has *changed direction*, but not necessarily been hit (it
+            # may have bounced).
+
+            if ball_angular_velocity != new_ball_angular_velocity:
+                ball_hit = True
+
+            ball_angular_velocity = new_ball_angular_velocity
+
+            # Calculate the current distances between cars and the ball.
+            # Do we have position data for the ball?
+            if ball_hit and not ball_spawned and ball_actor_id in actor_positions:
+
+                # Iterate over the cars to get the players.
+                lowest_distance = None
+                lowest_distance_car_actor = None
+
+                for player_id, car_actor_id in player_cars.items():
+                    # Get the team.
+                    if (
+                        player_id in actors and
+                        'Engine.PlayerReplicationInfo:Team' in actors[player_id] and
+                        actors[player_id]['Engine.PlayerReplicationInfo:Team']['value']
+                    ):
+                        team_id = actors[player_id]['Engine.PlayerReplicationInfo:Team']['value']
+
+                        try:
+                            team_actor = actors[team_id]
+                            team = int(team_actor['object_name'].replace('Archetypes.Teams.Team', '').replace('GameEvent_Soccar_TA_', ''))
+                        except KeyError:
+                            team = -1
+                    else:
+                        team = -1
+
+                    # Make sure this actor is in on the team which is currently
+                    # in possession.
+
+                    if team != ball_possession:
+                        continue
+
+                    if car_actor_id in actor_positions:
+                        actor_distance = distance(actor_positions[car_actor_id], actor_positions[ball_actor_id])
+
+                        if not confirmed_ball_hit:
+                            if actor_distance > 350:  # Value taken from the max confirmed distance.
+                                continue
+
+                        # Get the player on this team with the lowest distance.
+                        if lowest_distance is None or actor_distance < lowest_distance:
+                            lowest_distance = actor_distance
+                            lowest_distance_car_actor = car_actor_id
+
+                if lowest_distance_car_actor:
+                    last_hits[ball_possession] = actor_positions[lowest_distance_car_actor]
+
+        # Generate the heatmap data for this frame.  Get all of the players
+        # and the ball.
+        if not cars_frozen:
+            moveable_actors = [
+                (actor_id, value)
+                for actor_id, value in actors.items()
+                if value['class_name'] in ['TAGame.Ball_TA', 'TAGame.PRI_TA', 'TAGame.Car_TA'] and
+                (
+                    'TAGame.RBActor_TA:ReplicatedRBState' in value or
+                    'location' in value
+                )
+            ]
+
+            for actor_id, value in moveable_actors:
+                if value['class_name'] == 'TAGame.Ball_TA':
+                    actor_id = 'ball'
+                elif value['class_name'] == 'TAGame.Car_TA':
+                    if 'Engine.Pawn:PlayerReplicationInfo' not in value:
+                        continue
+
+                    actor_id = value['Engine.Pawn:PlayerReplicationInfo']['value']
+
+                if 'TAGame.RBActor_TA:ReplicatedRBState' in value:
+                    key = '{},{}'.format(
+                        value['TAGame.RBActor_TA:ReplicatedRBState']['value']['location']['x'],
+                        value['TAGame.RBActor_TA:ReplicatedRBState']['value']['location']['y'],
+                    )
+                elif 'location' in value:
+                    key = '{},{}'.format(
+                        value['location']['x'],
+                        value['location']['y'],
+                    )
+
+                if actor_id not in heatmap_data:
+                    heatmap_data[actor_id] = {}
+
+                if key in heatmap_data[actor_id]:
+                    heatmap_data[actor_id][key] += 1
+                else:
+                    heatmap_data[actor_id][key] = 1
+
+    return {
+        'location_data': location_data,
+        'heatmap_data': heatmap_data,
+        'boost_data': boost_data,
+        'shot_data': shot_data,
+        'goal_actors': goal_actors,
+        'seconds_mapping': seconds_mapping,
+        'player_actors': player_actors,
+        'team_data': team_data,
+        'replay_fields': replay_fields,
+    }
+
+
+def legacy_results(results):
+    # The legacy heatmap counted raw coordinates, bin them so they can be
+    # compared with the grid.
+    heatmap = Heatmap()
+
+    for actor_id, counts in results['heatmap_data'].items():
+        for key, count in counts.items():
+            x, y = key.split(',')
+            heatmap.add(actor_id, float(x), float(y), count)
+
+    return dict(results, heatmap_data=heatmap.to_legacy_json())
+
+
+def netstream_results(netstream):
+    results = netstream.results()
+
+    return {
+        'location_data': results['frame_store'].to_frame_data(),
+        'heatmap_data': results['heatmap'].to_legacy_json(),
+        'boost_data': results['boost_data'],
+        'shot_data': results['shot_data'],
+        'goal_actors': netstream.goal_actors,
+        'seconds_mapping': results['seconds_mapping'],
+        'player_actors': netstream.player_actors,
+        'team_data': netstream.team_data,
+        'replay_fields': netstream.replay_fields,
+    }
+
+
+def current_netstream(goals, frames):
+    netstream = NetstreamParser(goals)
+    netstream.parse(frames)
+    return netstream
+
+
+class Command(BaseCommand):
+    help = "Compare the speed and output of the netstream frame loop against the legacy implementation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='Replay files to benchmark, defaults to the test replays.')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        files = options['files'] or sorted(glob.glob(os.path.join(
+            os.path.dirname(__file__), '..', '..', 'tests', 'replays', '*.replay'
+        )))
+
+        totals = {'legacy': 0, 'current': 0}
+
+        for path in files:
+            # Decode the file once up front so only the frame loop is timed.
+            replay = iter_command('{} -i {}'.format(rattletrap_binary(), path))
+            header = next(replay)['body']['properties']['value']
+            frames = list(replay)
+
+            goals = {
+                get_value(goal, 'frame'): {
+                    'PlayerName': get_value(goal, 'PlayerName'),
+                    'PlayerTeam': get_value(goal, 'PlayerTeam')
+                }
+                for goal in get_value(header, 'Goals', [])
+            }
+
+            timings = {}
+            results = {}
+
+            implementations = [
+                ('legacy', legacy_netstream, legacy_results),
+                ('current', current_netstream, netstream_results),
+            ]
+
+            try:
+                for name, func, export in implementations:
+                    best = None
+
+                    for _ in range(options['repeat']):
+                        # Both implementations modify the frames they're given.
+                        frames_copy = copy.deepcopy(frames)
+
+                        start = time.perf_counter()
+                        result = func(goals, frames_copy)
+                        elapsed = time.perf_counter() - start
+
+                        if best is None or elapsed < best:
+                            best = elapsed
+
+                    # Converting to the legacy shapes for comparison isn't timed.
+                    results[name] = export(result)
+                    timings[name] = best
+            except Exception as e:
+                self.stderr.write('{}: {} failed: {!r}'.format(os.path.basename(path), name, e))
+                continue
+
+            for name in timings:
+                totals[name] += timings[name]
+
+            mismatches = [
+                key
+                for key in results['legacy']
+                if results['legacy'][key] != results['current'][key]
+            ]
+
+            self.stdout.write('{}: {} frames, legacy {:.3f}s, current {:.3f}s ({:.2f}x){}'.format(
+                os.path.basename(path),
+                len(frames),
+                timings['legacy'],
+                timings['current'],
+                timings['legacy'] / timings['current'],
+                ', MISMATCH: {}'.format(', '.join(mismatches)) if mismatches else '',
+            ))
+
+        if files:
+            self.stdout.write('Total: legacy {:.3f}s, current {:.3f}s ({:.2f}x)'.format(
+                totals['legacy'],
+                totals['current'],
+                totals['legacy'] / totals['current'],
+            ))
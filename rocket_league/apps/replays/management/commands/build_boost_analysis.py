@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from ...boost import save_boost_analysis
+from ...models import BoostData, BoostTimeline, Replay
+
+
+class Command(BaseCommand):
+    help = (
+        "Work out the boost analysis of replays which were processed before it "
+        "was stored, without parsing them again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--limit', type=int, help='Stop after this many replays.')
+
+    def handle(self, *args, **options):
+        replays = Replay.objects.filter(
+            Q(boost_chart_file__isnull=True) | Q(boost_chart_file=''),
+        ).filter(
+            Q(pk__in=BoostTimeline.objects.values('replay_id')) |
+            Q(pk__in=BoostData.objects.values('replay_id')),
+        )
+
+        replays = replays.order_by('pk')
+
+        built = 0
+        cursor = 0
+
+        while options['limit'] is None or built < options['limit']:
+            batch = list(replays.filter(pk__gt=cursor)[:options['batch_size']])
+
+            if not batch:
+                break
+
+            for replay in batch:
+                save_boost_analysis(replay)
+
+                built += 1
+                cursor = replay.pk
+
+                if options['limit'] is not None and built >= options['limit']:
+                    break
+
+            self.stdout.write('Built {} replays, up to replay {}.'.format(built, cursor))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from social.apps.django_app.default.models import UserSocialAuth
+
+from ...daily_stats import STEAM_PLATFORMS, add_steam_logins, day_counts, sketch
+from ...models import DailyStats, Player, Replay
+
+
+class Command(BaseCommand):
+    help = (
+        "Work out the daily stats from scratch for every day with a replay, "
+        "and add everyone who has signed in with Steam."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild the days from this date (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        dates = Replay.objects.filter(
+            timestamp_date__isnull=False,
+        )
+
+        if options['since']:
+            dates = dates.filter(timestamp_date__gte=options['since'])
+
+        dates = dates.order_by('timestamp_date').values_list('timestamp_date', flat=True).distinct()
+
+        for date in dates:
+            players = Player.objects.filter(
+                replay__timestamp_date=date,
+            ).values_list('player_name', 'platform', 'online_id')
+
+            player_names = set()
+            steam_ids = set()
+
+            for player_name, platform, online_id in players.iterator():
+                player_names.add(player_name)
+
+                if platform in STEAM_PLATFORMS and online_id:
+                    steam_ids.add(online_id)
+
+            stats = day_counts(date)
+            stats['player_names'] = sketch(player_names).tobytes()
+            stats['steam_ids'] = sketch(steam_ids).tobytes()
+
+            DailyStats.objects.update_or_create(
+                date=date,
+                defaults=stats,
+            )
+
+            self.stdout.write('{}: {} replays, {} players.'.format(date, stats['replays'], len(player_names)))
+
+        add_steam_logins(UserSocialAuth.objects.filter(
+            provider='steam',
+        ).values_list('uid', flat=True))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from ...models import SCOREBOARD_FIELDS, Player, Replay
+
+
+class Command(BaseCommand):
+    help = (
+        "Save the scoreboard of replays which were processed before it was "
+        "stored, or before it held every field, in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        built = 0
+        cursor = 0
+
+        while True:
+            batch = list(Replay.objects.filter(
+                pk__gt=cursor,
+            ).order_by('pk').only('scoreboard')[:options['batch_size']])
+
+            if not batch:
+                break
+
+            cursor = batch[-1].pk
+            replay_ids = [replay.pk for replay in batch if not replay.has_scoreboard]
+
+            # The players of the whole batch in one query.
+            scoreboards = {replay_id: [] for replay_id in replay_ids}
+
+            for player in Player.objects.filter(
+                replay_id__in=replay_ids,
+            ).annotate(
+                goal_count=Count('goal'),
+            ).values(*['replay_id'] + SCOREBOARD_FIELDS + ['goal_count']):
+                scoreboards[player.pop('replay_id')].append(player)
+
+            with transaction.atomic():
+                for replay_id, scoreboard in scoreboards.items():
+                    Replay.objects.filter(pk=replay_id).update(scoreboard=scoreboard)
+
+            built += len(replay_ids)
+
+            self.stdout.write('Built {} scoreboards, up to replay {}.'.format(built, cursor))
@@ -0,0 +1,85 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import BoostData, BoostTimeline
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the BoostData rows of each replay into one BoostTimeline per "
+        "player, a batch of replays at a time.  Converted rows are deleted, so "
+        "the command can be stopped and run again to carry on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Replays to convert per transaction.')
+        parser.add_argument('--limit', type=int, help='Stop after converting this many replays.')
+        parser.add_argument('--keep', action='store_true', help="Don't delete the BoostData rows once converted.")
+
+    def handle(self, *args, **options):
+        converted = 0
+        cursor = 0
+
+        while options['limit'] is None or converted < options['limit']:
+            batch_size = options['batch_size']
+
+            if options['limit'] is not None:
+                batch_size = min(batch_size, options['limit'] - converted)
+
+            # Walk the replays with boost data in primary key order.
+            batch = list(BoostData.objects.filter(
+                replay_id__gt=cursor,
+            ).order_by(
+                'replay_id',
+            ).values_list(
+                'replay_id', flat=True,
+            ).distinct()[:batch_size])
+
+            if not batch:
+                break
+
+            self.convert(batch, keep=options['keep'])
+
+            converted += len(batch)
+            cursor = batch[-1]
+
+            self.stdout.write('Converted {} replays, up to replay {}.'.format(converted, cursor))
+
+        self.stdout.write('Done, {} replays converted.'.format(converted))
+
+    @transaction.atomic
+    def convert(self, replay_ids, keep=False):
+        # Players which already have a timeline were reprocessed after
+        # BoostTimeline was added, so their old rows are out of date.
+        done = set(BoostTimeline.objects.filter(
+            replay_id__in=replay_ids,
+        ).values_list('player_id', flat=True))
+
+        rows = BoostData.objects.filter(
+            replay_id__in=replay_ids,
+        ).order_by(
+            'player_id', 'frame',
+        ).values_list('replay_id', 'player_id', 'frame', 'value')
+
+        timelines = []
+
+        for (replay_id, player_id), player_rows in groupby(rows.iterator(), key=lambda row: row[:2]):
+            if player_id in done:
+                continue
+
+            frames, values = zip(*[row[2:] for row in player_rows])
+            frame_deltas, values = BoostTimeline.encode(frames, values)
+
+            timelines.append(BoostTimeline(
+                replay_id=replay_id,
+                player_id=player_id,
+                frame_deltas=frame_deltas,
+                values=values,
+            ))
+
+        BoostTimeline.objects.bulk_create(timelines)
+
+        if not keep:
+            BoostData.objects.filter(replay_id__in=replay_ids).delete()
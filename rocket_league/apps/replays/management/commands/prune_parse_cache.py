@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ... import parse_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove this worker's old cached parses, and the least recently used "
+        "until the cache fits in REPLAY_PARSE_CACHE_MAX_BYTES."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-bytes', type=int, help='Override REPLAY_PARSE_CACHE_MAX_BYTES.')
+        parser.add_argument('--max-age', type=int, help='Override REPLAY_PARSE_CACHE_MAX_AGE, in seconds.')
+
+    def handle(self, *args, **options):
+        removed = parse_cache.prune(
+            max_bytes=options['max_bytes'],
+            max_age=options['max_age'],
+        )
+
+        self.stdout.write('Removed {} cached parses.'.format(removed))
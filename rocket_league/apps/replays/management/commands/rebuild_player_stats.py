@@ -0,0 +1,62 @@
+from multiprocessing import Pool
+
+from django import db
+from django.core.management.base import BaseCommand
+
+from ...models import Player
+from ...player_stats import normalise_platform, refresh_player_stats
+
+
+def refresh_batch(keys):
+    for platform, online_id, season_id in keys:
+        refresh_player_stats(platform, online_id, season_id)
+
+    return len(keys)
+
+
+class Command(BaseCommand):
+    help = "Work out the season stats of every player from scratch, in parallel batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--season', type=int, help='Only rebuild the stats for this season.')
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=500, help='Players per batch.')
+
+    def handle(self, *args, **options):
+        # Replays without a season aren't counted.
+        players = Player.objects.filter(
+            bot=False,
+            online_id__isnull=False,
+            replay__season__isnull=False,
+        ).exclude(
+            online_id='',
+        )
+
+        if options['season']:
+            players = players.filter(replay__season_id=options['season'])
+
+        keys = set()
+
+        for platform, online_id, season_id in players.values_list(
+            'platform', 'online_id', 'replay__season_id',
+        ).distinct().iterator():
+            platform = normalise_platform(platform)
+
+            if platform is not None:
+                keys.add((platform, online_id, season_id))
+
+        keys = sorted(keys)
+        batches = [keys[i:i + options['batch_size']] for i in range(0, len(keys), options['batch_size'])]
+
+        self.stdout.write('Rebuilding the stats of {} players in {} batches.'.format(len(keys), len(batches)))
+
+        # Each process needs its own database connection rather than a copy
+        # of this one.
+        db.connections.close_all()
+
+        done = 0
+
+        with Pool(options['processes']) as pool:
+            for count in pool.imap_unordered(refresh_batch, batches):
+                done += count
+                self.stdout.write('{} of {} players done.'.format(done, len(keys)))
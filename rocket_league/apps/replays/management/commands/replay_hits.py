@@ -11,7 +11,7 @@ from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from ...models import PLATFORMS, BoostData, Goal, Map, Player, Replay, Season
+from ...models import PLATFORMS, BoostData, BoostTimeline, Goal, Map, Player, Replay, Season
 
 
 def distance(pos1, pos2):
@@ -39,6 +39,7 @@ class Command(BaseCommand):
         Goal.objects.filter(replay=replay_obj).delete()
         Player.objects.filter(replay=replay_obj).delete()
         BoostData.objects.filter(replay=replay_obj).delete()
+        BoostTimeline.objects.filter(replay=replay_obj).delete()
 
         assert Goal.objects.filter(replay=replay_obj).count() == 0
         assert Player.objects.filter(replay=replay_obj).count() == 0
@@ -454,15 +455,9 @@ class Command(BaseCommand):
             )
 
             # Store the boost data for this player.
-            for boost_frame, boost_value in boost_data[actor_id].items():
-                boost_objects.append(BoostData(
-                    replay=replay_obj,
-                    player=player_objects[actor_id],
-                    frame=boost_frame,
-                    value=boost_value,
-                ))
+            boost_objects.append(BoostTimeline.from_values(replay_obj, player_objects[actor_id], boost_data[actor_id]))
 
-        BoostData.objects.bulk_create(boost_objects)
+        BoostTimeline.objects.bulk_create(boost_objects)
 
         # Create the goals.
         goal_objects = []
@@ -0,0 +1,129 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...analyzers import get_analyzers
+from ...celery import app
+from ...models import Replay, ReprocessCampaign
+from ...parse_cache import out_of_date, parser_version, stored_versions, up_to_date
+from ...tasks import process_netstream
+
+
+def queue_length(queue):
+    with app.connection() as connection:
+        return connection.default_channel.queue_declare(queue=queue).message_count
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue replays which were processed by an older version of the parser "
+        "for reprocessing, a batch at a time.  Progress is kept, so the command "
+        "can be stopped with --pause (or ctrl-c) and run again to carry on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyzers', help='Comma separated analyzers to rerun, rather than the whole parse.')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--max-queued', type=int, default=1000, help="Don't queue any more while this many tasks are waiting.")
+        parser.add_argument('--wait', type=int, default=30, help='Seconds to wait before checking the queue again.')
+        parser.add_argument('--limit', type=int, help='Stop after queueing this many replays.')
+        parser.add_argument('--include-crashed', action='store_true', help='Also queue replays the parser crashed on.')
+        parser.add_argument('--pause', action='store_true', help='Stop a running campaign after its current batch.')
+        parser.add_argument('--status', action='store_true', help='Show the progress of the campaign and exit.')
+        parser.add_argument('--restart', action='store_true', help='Start again from the first replay.')
+
+    def handle(self, *args, **options):
+        analyzers = options['analyzers'].split(',') if options['analyzers'] else None
+        version = parser_version()
+
+        # Each combination of parser version and analyzers is its own
+        # campaign, with its own position.
+        name = '{}:{}'.format(
+            version,
+            ','.join(analyzer.name for analyzer in get_analyzers(analyzers)) if analyzers else 'all',
+        )
+
+        replays = Replay.objects.filter(
+            processed=True,
+        ).exclude(
+            file='',
+        )
+
+        if not options['include_crashed']:
+            replays = replays.filter(crashed_heatmap_parser=False)
+
+        if options['pause']:
+            ReprocessCampaign.objects.filter(name=name).update(paused=True)
+            self.stdout.write('Asked the campaign to pause.')
+            return
+
+        # The versions replays have been processed with are checked once, so
+        # the filters below are exact matches on the parser_version index.
+        versions = stored_versions()
+
+        if options['status']:
+            total = replays.count()
+            current = replays.filter(up_to_date(analyzers, versions)).count()
+
+            self.stdout.write('Parser version {}: {} of {} replays up to date, {} to go.'.format(
+                version, current, total, total - current,
+            ))
+
+            campaign = ReprocessCampaign.objects.filter(name=name).first()
+
+            self.stdout.write('Last replay queued: {}.'.format(campaign.cursor if campaign else 'none'))
+            return
+
+        campaign, _ = ReprocessCampaign.objects.get_or_create(name=name)
+
+        if options['restart']:
+            campaign.cursor = 0
+
+        campaign.paused = False
+        campaign.save()
+
+        queued = 0
+        stale = replays.filter(out_of_date(analyzers, versions)).order_by('pk')
+
+        self.stdout.write('Queueing replays for parser version {} on the {} queue.'.format(
+            version, settings.REPROCESS_QUEUE,
+        ))
+
+        while options['limit'] is None or queued < options['limit']:
+            if ReprocessCampaign.objects.filter(pk=campaign.pk, paused=True).exists():
+                self.stdout.write('Paused, run the command again to carry on.')
+                break
+
+            # Don't swamp the workers, let them catch up first.
+            waiting = queue_length(settings.REPROCESS_QUEUE)
+
+            if waiting >= options['max_queued']:
+                self.stdout.write('{} tasks waiting, sleeping for {} seconds.'.format(waiting, options['wait']))
+                time.sleep(options['wait'])
+                continue
+
+            batch_size = options['batch_size']
+
+            if options['limit'] is not None:
+                batch_size = min(batch_size, options['limit'] - queued)
+
+            # Walk the stale replays in primary key order, picking up after
+            # the last one queued.
+            batch = list(stale.filter(pk__gt=campaign.cursor).values_list('pk', flat=True)[:batch_size])
+
+            if not batch:
+                self.stdout.write('No more replays to queue.')
+                campaign.delete()
+                break
+
+            for replay_pk in batch:
+                process_netstream.apply_async([replay_pk, analyzers], queue=settings.REPROCESS_QUEUE)
+
+            queued += len(batch)
+
+            # Only the cursor, so a pause asked for meanwhile isn't undone.
+            campaign.cursor = batch[-1]
+            campaign.save(update_fields=['cursor', 'last_updated'])
+
+            self.stdout.write('Queued {} replays, up to replay {}.'.format(queued, batch[-1]))
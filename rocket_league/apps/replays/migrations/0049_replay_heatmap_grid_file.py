@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replays', '0048_auto_20180519_2109'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replay',
+            name='heatmap_grid_file',
+            field=models.FileField(upload_to='uploads/replay_heatmap_grid_files', blank=True, null=True),
+        ),
+    ]
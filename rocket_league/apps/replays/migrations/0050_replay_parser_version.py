@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replays', '0049_replay_heatmap_grid_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replay',
+            name='parser_version',
+            field=models.CharField(default='', max_length=200, blank=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replays', '0050_replay_parser_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoostTimeline',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, primary_key=True, verbose_name='ID')),
+                ('frame_deltas', models.BinaryField()),
+                ('values', models.BinaryField()),
+                ('player', models.OneToOneField(related_name='boost_timeline', to='replays.Player')),
+                ('replay', models.ForeignKey(to='replays.Replay')),
+            ],
+        ),
+    ]
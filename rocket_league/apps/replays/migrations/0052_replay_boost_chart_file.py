@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replays', '0051_boosttimeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replay',
+            name='boost_chart_file',
+            field=models.FileField(upload_to='uploads/replay_boost_chart_files', blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replays', '0052_replay_boost_chart_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerSeasonStats',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('platform', models.PositiveIntegerField()),
+                ('online_id', models.CharField(max_length=128)),
+                ('appearances', models.PositiveIntegerField(default=0)),
+                ('winning_goals', models.PositiveIntegerField(default=0)),
+                ('last_minute_goals', models.PositiveIntegerField(default=0)),
+                ('overtime_triggering_goals', models.PositiveIntegerField(default=0)),
+                ('overtime_triggering_and_winning_goals', models.PositiveIntegerField(default=0)),
+                ('overtime_trigger_and_team_win', models.PositiveIntegerField(default=0)),
+                ('preferred_match_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('preferred_role', models.CharField(max_length=20, blank=True, null=True)),
+                ('highest_score', models.IntegerField(blank=True, null=True)),
+                ('most_goals', models.IntegerField(blank=True, null=True)),
+                ('most_shots', models.IntegerField(blank=True, null=True)),
+                ('most_assists', models.IntegerField(blank=True, null=True)),
+                ('most_saves', models.IntegerField(blank=True, null=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('biggest_win', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, blank=True, to='replays.Replay', null=True)),
+                ('season', models.ForeignKey(to='replays.Season')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='playerseasonstats',
+            unique_together=set([('platform', 'online_id', 'season')]),
+        ),
+    ]
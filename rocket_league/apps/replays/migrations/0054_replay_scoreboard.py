@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import social.apps.django_app.default.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replays', '0053_playerseasonstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replay',
+            name='scoreboard',
+            field=social.apps.django_app.default.fields.JSONField(default='{}', blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replays', '0054_replay_scoreboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replay',
+            name='listable',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='replay',
+            name='timestamp_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        # The same rules as Replay.save().
+        migrations.RunSQL(
+            """
+            UPDATE replays_replay SET timestamp_date = (timestamp AT TIME ZONE 'UTC')::date;
+
+            UPDATE replays_replay SET listable = (
+                processed AND
+                replay_id IS DISTINCT FROM '' AND
+                team_sizes IS NOT NULL AND
+                timestamp_date IS NOT NULL AND
+                average_rating IS NOT NULL
+            );
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterIndexTogether(
+            name='replay',
+            index_together=set([('season', 'privacy', 'listable', 'timestamp_date', 'average_rating', 'id')]),
+        ),
+    ]
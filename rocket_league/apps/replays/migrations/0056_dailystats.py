@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replays', '0055_replay_listing_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('date', models.DateField(unique=True)),
+                ('replays', models.PositiveIntegerField(default=0)),
+                ('goals', models.PositiveIntegerField(default=0)),
+                ('player_names', models.BinaryField(blank=True, null=True)),
+                ('steam_ids', models.BinaryField(blank=True, null=True)),
+                ('steam_logins', models.BinaryField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['date'],
+                'verbose_name_plural': 'daily stats',
+            },
+        ),
+        migrations.AlterField(
+            model_name='replay',
+            name='timestamp_date',
+            field=models.DateField(blank=True, null=True, db_index=True),
+        ),
+    ]
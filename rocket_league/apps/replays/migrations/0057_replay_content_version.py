@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replays', '0056_dailystats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replay',
+            name='content_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='replay',
+            name='last_modified',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import social.apps.django_app.default.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replays', '0057_replay_content_version'),
+    ]
+
+    operations = [
+        # Replays which have already been processed were counted in their
+        # players' stats without saving what they added, so they're marked
+        # with a JSON null and new replays start out empty.
+        migrations.AddField(
+            model_name='replay',
+            name='season_stats',
+            field=social.apps.django_app.default.fields.JSONField(default='null', blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='replay',
+            name='season_stats',
+            field=social.apps.django_app.default.fields.JSONField(default='{}', blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playerseasonstats',
+            name='match_sizes',
+            field=social.apps.django_app.default.fields.JSONField(default='{}', blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playerseasonstats',
+            name='total_assists',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playerseasonstats',
+            name='total_goals',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playerseasonstats',
+            name='total_saves',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('replays', '0058_season_stats_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReprocessCampaign',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('cursor', models.PositiveIntegerField(default=0)),
+                ('paused', models.BooleanField(default=False)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
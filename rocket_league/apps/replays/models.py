@@ -4,6 +4,7 @@ import re
 from itertools import zip_longest
 
 import bitstring
+import numpy as np
 from django.conf import settings
 from django.contrib.staticfiles.templatetags.staticfiles import static
 from django.core.exceptions import ValidationError
@@ -12,7 +13,7 @@ from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
-from django.utils.timezone import now
+from django.utils.timezone import now, utc
 from pyrope import Replay as Pyrope
 from social.apps.django_app.default.fields import JSONField
 
@@ -76,6 +77,14 @@ PLATFORMS_MAPPINGS = {
     None: PLATFORM_UNKNOWN,
 }
 
+# The player fields saved in a replay's scoreboard, enough to show its
+# players without looking them up, see Replay.build_scoreboard().
+SCOREBOARD_FIELDS = [
+    'id', 'player_name', 'team', 'score', 'goals', 'assists', 'saves', 'shots',
+    'platform', 'online_id', 'bot', 'spectator', 'heatmap', 'actor_id',
+    'camera_settings', 'vehicle_loadout',
+]
+
 
 class Season(models.Model):
 
@@ -94,7 +103,11 @@ class Season(models.Model):
 
 
 def get_default_season():
-    if Season.objects.count() == 0:
+    from .reference import season_for
+
+    season_id = season_for(now())
+
+    if season_id is None and not Season.objects.exists():
         season = Season.objects.create(
             title='Season 1',
             start_date='2015-07-07'  # Game release date
@@ -102,9 +115,7 @@ def get_default_season():
 
         return season.pk
 
-    return Season.objects.filter(
-        start_date__lte=now(),
-    )[0].pk
+    return season_id
 
 
 class Map(models.Model):
@@ -170,12 +181,24 @@ class Replay(models.Model):
         null=True,
     )
 
+    heatmap_grid_file = models.FileField(
+        upload_to='uploads/replay_heatmap_grid_files',
+        blank=True,
+        null=True,
+    )
+
     location_json_file = models.FileField(
         upload_to='uploads/replay_location_json_files',
         blank=True,
         null=True,
     )
 
+    boost_chart_file = models.FileField(
+        upload_to='uploads/replay_boost_chart_files',
+        blank=True,
+        null=True,
+    )
+
     replay_id = models.CharField(
         "replay ID",
         max_length=100,
@@ -290,6 +313,20 @@ class Replay(models.Model):
         null=True,
     )
 
+    # The players and their stats, saved when the replay is processed so the
+    # replay lists don't have to look them up, see build_scoreboard().
+    scoreboard = JSONField(
+        blank=True,
+        null=True,
+    )
+
+    # What the replay added to its players' season stats, see player_stats.py.
+    # Replays counted before this was saved have null.
+    season_stats = JSONField(
+        blank=True,
+        null=True,
+    )
+
     excitement_factor = models.FloatField(
         default=0.00,
     )
@@ -312,18 +349,104 @@ class Replay(models.Model):
         default=False,
     )
 
+    # Whether the replay shows in the replay list and the day it was played,
+    # kept up to date by save() so the list can be read from one index.
+    listable = models.BooleanField(
+        default=False,
+    )
+
+    timestamp_date = models.DateField(
+        blank=True,
+        null=True,
+        db_index=True,
+    )
+
+    # The netstream parser and analyzers which produced the players, goals,
+    # boost data and files, see `parse_cache.parser_version`.
+    parser_version = models.CharField(
+        max_length=200,
+        blank=True,
+        default='',
+        db_index=True,
+    )
+
+    # Bumped whenever the replay's pages would change, for the ETags and
+    # Last-Modified headers, see bump_content_version().
+    content_version = models.PositiveIntegerField(
+        default=0,
+    )
+
+    last_modified = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+
     @cached_property
     def uuid(self):
         return re.sub(r'([A-F0-9]{8})([A-F0-9]{4})([A-F0-9]{4})([A-F0-9]{4})([A-F0-9]{12})', r'\1-\2-\3-\4-\5', self.replay_id).lower()
 
+    def bump_content_version(self):
+        """
+        Mark the replay as changed, when it's been processed or edited.
+        """
+        self.content_version += 1
+        self.last_modified = now()
+
+    def build_scoreboard(self):
+        """
+        The players of the replay with their stats and the number of goals
+        each scored, in one query.
+        """
+        return list(self.player_set.annotate(
+            goal_count=models.Count('goal'),
+        ).values(*SCOREBOARD_FIELDS + ['goal_count']))
+
+    @property
+    def has_scoreboard(self):
+        """
+        Whether the scoreboard has been saved with every field.  It's an empty
+        dict on replays which were processed before it was saved.
+        """
+        return isinstance(self.scoreboard, list) and all(
+            field in player
+            for player in self.scoreboard
+            for field in SCOREBOARD_FIELDS
+        )
+
+    @cached_property
+    def scoreboard_players(self):
+        # Replays processed before the scoreboard was saved work it out until
+        # build_scoreboards has caught them up.
+        if not self.has_scoreboard:
+            return self.build_scoreboard()
+
+        return self.scoreboard
+
+    @cached_property
+    def players_by_team(self):
+        teams = {}
+
+        for fields in self.scoreboard_players:
+            player = Player(replay=self, **{
+                field: fields[field] for field in SCOREBOARD_FIELDS
+            })
+
+            teams.setdefault(player.team, []).append(player)
+
+        return teams
+
+    @cached_property
+    def goal_numbers(self):
+        # Goal numbers by the frame they were scored in.
+        return dict(self.goal_set.values_list('frame', 'number'))
+
     def team_x_player_list(self, team):
         return [
             "{}{}".format(
-                player.player_name,
-                " ({})".format(player.goal_set.count()) if player.goal_set.count() > 0 else '',
-            ) for player in self.player_set.filter(
-                team=team,
-            )
+                player['player_name'],
+                " ({})".format(player['goal_count']) if player['goal_count'] > 0 else '',
+            ) for player in self.scoreboard_players
+            if player['team'] == team
         ]
 
     def team_x_players(self, team):
@@ -466,36 +589,19 @@ class Replay(models.Model):
         return 0
 
     def eligible_for_feature(self, feature):
-        features = {
-            'playback': settings.PATREON_PLAYBACK_PRICE,
-            'boost_analysis': settings.PATREON_BOOST_PRICE,
-        }
-
-        patreon_amount = features[feature]
-
         # Import here to avoid circular imports.
-        from ..site.templatetags.site import patreon_pledge_amount
-
-        # Is the uploader a patron?
-        if self.user:
-            pledge_amount = patreon_pledge_amount({}, user=self.user)
-
-            if pledge_amount >= patreon_amount:
-                return True
-
-        # Are any of the players patron?
-        players = self.player_set.filter(
-            platform__in=['OnlinePlatform_Steam', '1'],
+        from ..site.entitlements import eligible_for_feature
+
+        # Is the uploader or are any of the players patrons?
+        return eligible_for_feature(
+            feature,
+            user_id=self.user_id,
+            steam_ids=[
+                player['online_id'] for player in self.scoreboard_players
+                if player['platform'] in ['OnlinePlatform_Steam', '1']
+            ],
         )
 
-        for player in players:
-            pledge_amount = patreon_pledge_amount({}, steam_id=player.online_id)
-
-            if pledge_amount >= patreon_amount:
-                return True
-
-        return False
-
     @property
     def queue_priority(self):
         # Returns one of 'tournament', 'priority', 'general', where 'tournament'
@@ -525,10 +631,16 @@ class Replay(models.Model):
     def eligible_for_boost_analysis(self):
         return self.eligible_for_feature('boost_analysis')
 
+    @cached_property
+    def has_boost_data(self):
+        # Replays processed before BoostTimeline may still only have BoostData
+        # rows, until convert_boost_data has been run.
+        return self.boosttimeline_set.exists() or self.boostdata_set.exists()
+
     @cached_property
     def show_boost_analysis(self):
         # Have we got any boost data yet?
-        if self.boostdata_set.count() == 0:
+        if not self.has_boost_data:
             return False
 
         return self.eligible_for_feature('boost_analysis')
@@ -557,6 +669,9 @@ class Replay(models.Model):
 
     class Meta:
         ordering = ['-timestamp', '-pk']
+        index_together = [
+            ['season', 'privacy', 'listable', 'timestamp_date', 'average_rating', 'id'],
+        ]
 
     def __str__(self):
         return self.title or str(self.pk) or '[{}] {} {} game on {}. Final score: {}, Uploaded by {}.'.format(
@@ -602,13 +717,29 @@ class Replay(models.Model):
         if 'parse_netstream' in kwargs:
             parse_netstream = kwargs.pop('parse_netstream')
 
+        # Limit a netstream parse to these analyzers.
+        analyzers = kwargs.pop('analyzers', None)
+
+        # The dates are in UTC, as DATE(timestamp) was.
+        self.timestamp_date = self.timestamp.astimezone(utc).date() if self.timestamp else None
+
+        # The replay list orders by the date and rating, so both have to be
+        # set for the replay to be listed.
+        self.listable = bool(
+            self.processed and
+            self.replay_id != '' and
+            self.team_sizes is not None and
+            self.timestamp_date is not None and
+            self.average_rating is not None
+        )
+
         super(Replay, self).save(*args, **kwargs)
 
         if self.file and not self.processed:
             try:
                 if parse_netstream:
                     # Header parse?
-                    parse_replay_netstream(self.pk)
+                    parse_replay_netstream(self.pk, analyzers)
                 else:
                     parse_replay_header(self.pk)
             except:
@@ -776,6 +907,8 @@ class Player(models.Model):
         }
         """
 
+        from .reference import get_component
+
         components = {}
 
         if not self.vehicle_loadout:
@@ -810,20 +943,11 @@ class Player(models.Model):
 
             for index, component in enumerate(self.vehicle_loadout):
                 if component > 0:
-                    get_component = Component.objects.filter(
-                        type=component_maps[index],
-                        internal_id=component,
+                    components[component_maps[index]] = get_component(
+                        component_maps[index],
+                        component,
                     )
 
-                    if get_component.exists():
-                        components[component_maps[index]] = get_component[0]
-                    else:
-                        components[component_maps[index]] = Component.objects.create(
-                            type=component_maps[index],
-                            internal_id=component,
-                            name='Unknown',
-                        )
-
         elif type(self.vehicle_loadout) == dict:
             component_maps = {
                 'Body': {'type': 'body', 'replace': 'Body_'},
@@ -837,16 +961,16 @@ class Player(models.Model):
             for component_type, mappings in component_maps.items():
                 if component_type in self.vehicle_loadout and self.vehicle_loadout[component_type]['Name']:
                     try:
-                        components[mappings['type']] = Component.objects.get_or_create(
-                            type=mappings['type'],
-                            internal_id=self.vehicle_loadout[component_type]['Id'],
-                            defaults={
-                                'name': self.vehicle_loadout[component_type]['Name'].replace(mappings['replace'], '').replace('_', ' ')
-                            }
-                        )[0]
+                        name = self.vehicle_loadout[component_type]['Name'].replace(mappings['replace'], '').replace('_', ' ')
+
+                        components[mappings['type']] = get_component(
+                            mappings['type'],
+                            self.vehicle_loadout[component_type]['Id'],
+                            name,
+                        )
 
                         if components[mappings['type']].name == 'Unknown':
-                            components[mappings['type']].name = self.vehicle_loadout[component_type]['Name'].replace(mappings['replace'], '').replace('_', ' ')
+                            components[mappings['type']].name = name
                             components[mappings['type']].save()
                     except Exception:
                         pass
@@ -922,6 +1046,200 @@ class Goal(models.Model):
         ordering = ['frame']
 
 
+class PlayerSeasonStats(models.Model):
+    """
+    A player's statistics across a season, kept up to date as their replays
+    are processed (see player_stats.py) so their profile only has to read
+    one row.
+    """
+
+    # One of the PLATFORM_ constants, the players' platforms are stored in a
+    # few different formats.
+    platform = models.PositiveIntegerField()
+
+    online_id = models.CharField(
+        max_length=128,
+    )
+
+    season = models.ForeignKey(
+        Season,
+    )
+
+    appearances = models.PositiveIntegerField(
+        default=0,
+    )
+
+    winning_goals = models.PositiveIntegerField(
+        default=0,
+    )
+
+    last_minute_goals = models.PositiveIntegerField(
+        default=0,
+    )
+
+    overtime_triggering_goals = models.PositiveIntegerField(
+        default=0,
+    )
+
+    overtime_triggering_and_winning_goals = models.PositiveIntegerField(
+        default=0,
+    )
+
+    overtime_trigger_and_team_win = models.PositiveIntegerField(
+        default=0,
+    )
+
+    # The totals the preferred match size and role are worked out from, null
+    # on rows from before they were kept.
+    total_goals = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+    )
+
+    total_assists = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+    )
+
+    total_saves = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+    )
+
+    # The number of appearances at each match size.
+    match_sizes = JSONField(
+        blank=True,
+        null=True,
+    )
+
+    preferred_match_size = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+    )
+
+    preferred_role = models.CharField(
+        max_length=20,
+        blank=True,
+        null=True,
+    )
+
+    biggest_win = models.ForeignKey(
+        Replay,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+    )
+
+    highest_score = models.IntegerField(
+        blank=True,
+        null=True,
+    )
+
+    most_goals = models.IntegerField(
+        blank=True,
+        null=True,
+    )
+
+    most_shots = models.IntegerField(
+        blank=True,
+        null=True,
+    )
+
+    most_assists = models.IntegerField(
+        blank=True,
+        null=True,
+    )
+
+    most_saves = models.IntegerField(
+        blank=True,
+        null=True,
+    )
+
+    last_updated = models.DateTimeField(
+        auto_now=True,
+    )
+
+    def __str__(self):
+        return 'Platform: {}, Online ID: {}, Season: {}'.format(
+            self.platform,
+            self.online_id,
+            self.season_id,
+        )
+
+    class Meta:
+        unique_together = [['platform', 'online_id', 'season']]
+
+
+class DailyStats(models.Model):
+    """
+    The number of replays and goals played on a day, and HyperLogLog sketches
+    of the distinct players, kept up to date as replays are processed (see
+    daily_stats.py) for the stats page.
+    """
+
+    date = models.DateField(
+        unique=True,
+    )
+
+    replays = models.PositiveIntegerField(
+        default=0,
+    )
+
+    goals = models.PositiveIntegerField(
+        default=0,
+    )
+
+    player_names = models.BinaryField(
+        blank=True,
+        null=True,
+    )
+
+    steam_ids = models.BinaryField(
+        blank=True,
+        null=True,
+    )
+
+    # The Steam IDs of people who signed in that day, which only count
+    # towards the all time total.
+    steam_logins = models.BinaryField(
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        ordering = ['date']
+        verbose_name_plural = 'daily stats'
+
+
+class ReprocessCampaign(models.Model):
+    """
+    The progress of a reprocess_replays run, one per parser version and set
+    of analyzers, so it can be paused and carried on from any machine.
+    """
+
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+    )
+
+    # The primary key of the last replay queued.
+    cursor = models.PositiveIntegerField(
+        default=0,
+    )
+
+    paused = models.BooleanField(
+        default=False,
+    )
+
+    last_updated = models.DateTimeField(
+        auto_now=True,
+    )
+
+    def __str__(self):
+        return self.name
+
+
 class ReplayPack(models.Model):
 
     title = models.CharField(
@@ -1024,6 +1342,76 @@ class BoostData(models.Model):
         # unique_together = [('player', 'frame', 'value')]
 
 
+class BoostTimeline(models.Model):
+    """
+    The boost values of one player over a replay, stored as two arrays rather
+    than a BoostData row per change: the frames (delta encoded, as unsigned
+    32 bit integers) and the boost values (unsigned bytes).
+    """
+
+    replay = models.ForeignKey(
+        Replay,
+        db_index=True,
+    )
+
+    player = models.OneToOneField(
+        Player,
+        related_name='boost_timeline',
+    )
+
+    frame_deltas = models.BinaryField()
+
+    values = models.BinaryField()
+
+    @staticmethod
+    def encode(frames, values):
+        deltas = np.diff(np.concatenate([[0], np.asarray(frames, dtype=np.int64)]))
+
+        return (
+            np.asarray(deltas, dtype='<u4').tobytes(),
+            np.asarray(values, dtype=np.uint8).tobytes(),
+        )
+
+    @classmethod
+    def from_values(cls, replay, player, values):
+        """
+        Build a timeline from a dict of frame -> boost value.
+        """
+        frames = sorted(values)
+
+        frame_deltas, boost_values = cls.encode(frames, [values[frame] for frame in frames])
+
+        return cls(
+            replay=replay,
+            player=player,
+            frame_deltas=frame_deltas,
+            values=boost_values,
+        )
+
+    @property
+    def frames_array(self):
+        return np.cumsum(np.frombuffer(bytes(self.frame_deltas), dtype='<u4'), dtype=np.int64)
+
+    @property
+    def values_array(self):
+        return np.frombuffer(bytes(self.values), dtype=np.uint8)
+
+    def arrays(self):
+        return self.frames_array, self.values_array
+
+
+def player_boost_arrays(player):
+    """
+    Return the frames and boost values of a player as NumPy arrays, reading
+    the old BoostData rows for replays which haven't been converted yet.
+    """
+    try:
+        return player.boost_timeline.arrays()
+    except BoostTimeline.DoesNotExist:
+        rows = np.array(player.boostdata_set.values_list('frame', 'value'), dtype=np.int64).reshape(-1, 2)
+        return rows[:, 0], rows[:, 1].astype(np.uint8)
+
+
 class Component(models.Model):
 
     type = models.CharField(
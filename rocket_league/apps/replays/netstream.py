@@ -0,0 +1,362 @@
+"""
+The network frame walk for replays decoded by Rattletrap.
+
+`NetstreamParser` holds the actor state for a replay as its frames are fed in,
+along with the goals, players and match details every replay needs.  The rest
+(positions, boost amounts, heatmaps and so on) is pulled out by the analyzers
+in `analyzers`.  Saving the results is left to `parser.parse_replay_netstream`.
+
+Each replication is flattened once.  Once the frame's actor state has been
+applied, the properties which changed are routed to their handlers with a
+single dictionary lookup each, so properties nothing is listening for cost
+nothing.
+"""
+import itertools
+from collections import OrderedDict
+
+from .analyzers import get_analyzers, handler_methods, handles
+from .hits import Timeline
+from .parser import flatten_value
+
+
+class ActorRegistry(object):
+
+    """
+    The live actors of each class, kept up to date as actors are spawned and
+    destroyed so we never need to scan every actor to find, say, the ball.
+    """
+
+    def __init__(self):
+        self.classes = {}  # Class name -> {actor ID: spawn sequence number}
+        self.sequence = itertools.count()
+
+    def add(self, actor_id, class_name):
+        self.classes.setdefault(class_name, {})[actor_id] = next(self.sequence)
+
+    def remove(self, actor_id, class_name):
+        del self.classes[class_name][actor_id]
+
+    def of_class(self, *class_names):
+        """
+        Return the IDs of the live actors of the given classes, oldest first.
+        """
+        if len(class_names) == 1:
+            return list(self.classes.get(class_names[0], {}))
+
+        spawned = {}
+
+        for class_name in class_names:
+            spawned.update(self.classes.get(class_name, {}))
+
+        return sorted(spawned, key=spawned.get)
+
+    def first(self, *class_names):
+        """
+        Return the ID of the oldest live actor of the given classes, if any.
+        """
+        oldest = None
+
+        for class_name in class_names:
+            for actor_id, sequence in self.classes.get(class_name, {}).items():
+                if oldest is None or sequence < oldest[1]:
+                    oldest = (actor_id, sequence)
+
+                break
+
+        return oldest[0] if oldest else None
+
+    def ball(self):
+        return self.first('TAGame.Ball_TA')
+
+    def cars(self):
+        return self.of_class('TAGame.Car_TA')
+
+    def players(self):
+        return self.of_class('TAGame.PRI_TA')
+
+    def teams(self):
+        return self.of_class('TAGame.Team_Soccar_TA')
+
+
+class NetstreamParser(object):
+
+    # Bump this whenever the state kept here changes, along with the version
+    # of any analyzer whose output changes.
+    version = 1
+
+    def __init__(self, goals, analyzers=None):
+        # Frame -> {'PlayerName': ..., 'PlayerTeam': ...}, from the header.
+        self.goals = goals
+
+        self.actors = {}  # All actors
+        self.registry = ActorRegistry()  # Live actor IDs by class.
+        self.player_actors = {}  # XXX: This will be used to make the replay.save() easier.
+        self.match_goals = {}
+        self.teaminfo_score = {}
+        self.goal_actors = {}
+        self.team_data = {}
+        self.player_cars = {}  # Player -> Car actor ID mappings.
+        self.car_players = {}  # Car -> Player actor ID mappings.
+        self.car_timeline = Timeline()  # Whether each player is in a car.
+        self.num_frames = 0
+        self.replay_fields = {}  # Values to set on the Replay object.
+
+        # Analyzer name -> analyzer, for the analyzers being run.
+        self.analyzers = OrderedDict(
+            (analyzer_class.name, analyzer_class(self))
+            for analyzer_class in get_analyzers(analyzers)
+        )
+
+        # Property name -> [(position, bound handler), ...], for our own
+        # handlers followed by those of each analyzer.
+        self.property_handlers = {}
+        position = itertools.count()
+
+        for owner in itertools.chain([self], self.analyzers.values()):
+            for handler in handler_methods(owner):
+                handler_position = next(position)
+
+                for property_name in handler.handles:
+                    self.property_handlers.setdefault(property_name, []).append((handler_position, handler))
+
+        # The analyzer hooks to call, only for analyzers which use them.
+        self.spawn_hooks = {}  # Class name -> [hook, ...]
+        self.destroy_hooks = {}  # Class name -> [hook, ...]
+        self.frame_start_hooks = []
+        self.frame_end_hooks = []
+
+        for analyzer in self.analyzers.values():
+            for class_name in analyzer.classes:
+                if analyzer.overrides('actor_spawned'):
+                    self.spawn_hooks.setdefault(class_name, []).append(analyzer.actor_spawned)
+
+                if analyzer.overrides('actor_destroyed'):
+                    self.destroy_hooks.setdefault(class_name, []).append(analyzer.actor_destroyed)
+
+            if analyzer.overrides('start_frame'):
+                self.frame_start_hooks.append(analyzer.start_frame)
+
+            if analyzer.overrides('end_frame'):
+                self.frame_end_hooks.append(analyzer.end_frame)
+
+    def parse(self, frames):
+        for index, frame in enumerate(frames):
+            self.parse_frame(index, frame)
+
+        self.finish()
+
+    def finish(self):
+        for analyzer in self.analyzers.values():
+            analyzer.finish()
+
+    def results(self):
+        """
+        The output of every analyzer which was run, keyed by what it produces.
+        """
+        results = {}
+
+        for analyzer in self.analyzers.values():
+            results.update(analyzer.results())
+
+        return results
+
+    def parse_frame(self, index, frame):
+        self.num_frames = index + 1
+
+        for hook in self.frame_start_hooks:
+            hook(index)
+
+        # Apply the replications to the actor state, keeping hold of the
+        # properties which changed so they can be handled once the whole
+        # frame is in place.
+        changed = []
+
+        for replication in frame['replications']:
+            actor_id = int(replication['actor_id']['value'])
+
+            (replication_type, value), = replication['value'].items()
+
+            if replication_type == 'spawned':
+                self.actor_spawned(index, actor_id, value)
+                changed.append((actor_id, value))
+
+                for hook in self.spawn_hooks.get(value['class_name'], ()):
+                    hook(index, actor_id, value)
+            elif replication_type == 'updated':
+                flattened_value = flatten_value(value)
+                self.actor_updated(index, actor_id, flattened_value)
+                changed.append((actor_id, flattened_value))
+            elif replication_type == 'destroyed':
+                value = self.actor_destroyed(index, actor_id)
+
+                for hook in self.destroy_hooks.get(value['class_name'], ()):
+                    hook(index, actor_id, value)
+            else:
+                raise Exception('Unhandled replication_type: {}'.format(replication_type))
+
+        # Loop over actors which have changed in this frame.
+        property_handlers = self.property_handlers
+
+        for actor_id, flattened_value in changed:
+            handlers = []
+
+            for property_name in flattened_value:
+                if property_name in property_handlers:
+                    handlers.extend(property_handlers[property_name])
+
+            if len(handlers) > 1:
+                handlers.sort(key=lambda handler: handler[0])
+
+            for _, handler in handlers:
+                handler(index, actor_id, flattened_value)
+
+        for hook in self.frame_end_hooks:
+            hook(index, changed)
+
+    # Actor bookkeeping.
+
+    def actor_spawned(self, index, actor_id, value):
+        if actor_id not in self.actors:
+            self.actors[actor_id] = value
+            self.registry.add(actor_id, value['class_name'])
+
+        if 'Engine.Pawn:PlayerReplicationInfo' in value:
+            self.link_car(index, value['Engine.Pawn:PlayerReplicationInfo']['value'], actor_id)
+
+        if value['class_name'] == 'TAGame.PRI_TA':
+            self.player_actors[actor_id] = value
+            self.player_actors[actor_id]['joined'] = index
+        elif value['class_name'] == 'TAGame.Team_Soccar_TA':
+            self.team_data[actor_id] = value['object_name'].replace('Archetypes.Teams.Team', '')
+
+    def actor_updated(self, index, actor_id, flattened_value):
+        actors = self.actors
+
+        if (
+            'Engine.PlayerReplicationInfo:Team' in flattened_value and
+            not flattened_value['Engine.PlayerReplicationInfo:Team']['value']
+        ):
+            del flattened_value['Engine.PlayerReplicationInfo:Team']
+
+        # If an actor is getting their team value nuked, store what it was
+        # so we can use it later on.
+        if (
+            'Engine.PlayerReplicationInfo:Team' in flattened_value and
+            flattened_value['Engine.PlayerReplicationInfo:Team']['value'] == -1 and
+            actors[actor_id]['Engine.PlayerReplicationInfo:Team']['value'] != -1
+        ):
+            actors[actor_id]['Engine.PlayerReplicationInfo:CachedTeam'] = actors[actor_id]['Engine.PlayerReplicationInfo:Team']
+
+        # Merge the new properties with the existing.
+        actors[actor_id] = {**actors[actor_id], **flattened_value}
+
+        if actor_id in self.player_actors:
+            self.player_actors[actor_id] = actors[actor_id]
+
+        if 'Engine.Pawn:PlayerReplicationInfo' in flattened_value:
+            self.link_car(index, flattened_value['Engine.Pawn:PlayerReplicationInfo']['value'], actor_id)
+
+    def actor_destroyed(self, index, actor_id):
+        value = self.actors.pop(actor_id)
+        self.registry.remove(actor_id, value['class_name'])
+
+        # Actor IDs are reused, so don't leave anything pointing at this one.
+        if actor_id in self.car_players:
+            self.unlink_car(index, actor_id)
+
+        if actor_id in self.player_cars:
+            self.unlink_car(index, self.player_cars[actor_id])
+
+        if actor_id in self.player_actors:
+            self.player_actors[actor_id]['left'] = index
+
+        return value
+
+    def link_car(self, index, player_actor_id, car_actor_id):
+        """
+        Record that a player is driving a car.  A player only has one car at a
+        time and a car only has one driver, so any previous pairing of either
+        actor is dropped.
+        """
+        old_car_actor_id = self.player_cars.get(player_actor_id)
+
+        if old_car_actor_id == car_actor_id:
+            return
+
+        if old_car_actor_id is not None and old_car_actor_id != car_actor_id:
+            del self.car_players[old_car_actor_id]
+
+        old_player_actor_id = self.car_players.get(car_actor_id)
+
+        if old_player_actor_id is not None and old_player_actor_id != player_actor_id:
+            del self.player_cars[old_player_actor_id]
+            self.car_timeline.set(old_player_actor_id, index, False)
+
+        self.player_cars[player_actor_id] = car_actor_id
+        self.car_players[car_actor_id] = player_actor_id
+        self.car_timeline.set(player_actor_id, index, True)
+
+    def unlink_car(self, index, car_actor_id):
+        player_actor_id = self.car_players.pop(car_actor_id)
+        del self.player_cars[player_actor_id]
+        self.car_timeline.set(player_actor_id, index, False)
+
+    # Property handlers.
+
+    @handles('TAGame.CameraSettingsActor_TA:ProfileSettings')
+    def handle_camera_settings(self, index, actor_id, flattened_value):
+        # Get the camera details.
+        if self.actors[actor_id]['class_name'] == 'TAGame.CameraSettingsActor_TA':
+            # Define some short variable names to stop the next line
+            # being over 200 characters long.  This block of code
+            # makes new replays have a camera structure which is
+            # similar to that of the old replays - where the camera
+            # settings are directly attached to the player rather
+            # than a CameraActor (which is what the actor in this
+            # current loop is).
+
+            csa = 'TAGame.CameraSettingsActor_TA:PRI'
+            ps = 'TAGame.CameraSettingsActor_TA:ProfileSettings'
+            cs = 'TAGame.PRI_TA:CameraSettings'
+
+            if csa in flattened_value:
+                player_actor_id = flattened_value[csa]['value']
+                self.actors[player_actor_id][cs] = flattened_value[ps]['value']
+
+    @handles('Engine.GameReplicationInfo:ServerName')
+    def handle_server_name(self, index, actor_id, flattened_value):
+        self.replay_fields['server_name'] = flattened_value['Engine.GameReplicationInfo:ServerName']['value']
+
+    @handles('ProjectX.GRI_X:ReplicatedGamePlaylist')
+    def handle_playlist(self, index, actor_id, flattened_value):
+        self.replay_fields['playlist'] = flattened_value['ProjectX.GRI_X:ReplicatedGamePlaylist']['value']
+
+    @handles('TAGame.GameEvent_Team_TA:MaxTeamSize')
+    def handle_team_size(self, index, actor_id, flattened_value):
+        self.replay_fields['team_sizes'] = flattened_value['TAGame.GameEvent_Team_TA:MaxTeamSize']['value']
+
+    @handles('TAGame.PRI_TA:MatchGoals')
+    def handle_match_goals(self, index, actor_id, flattened_value):
+        # Get the closest goal to this frame.
+        mg = flattened_value['TAGame.PRI_TA:MatchGoals']
+        mg_increased = False
+
+        if mg['value'] > self.match_goals.get(actor_id, 0):
+            self.match_goals[actor_id] = mg['value']
+            mg_increased = True
+
+        if index not in self.match_goals and mg_increased:
+            self.goal_actors[index] = actor_id
+            self.match_goals[actor_id] = mg['value']
+
+    @handles('Engine.TeamInfo:Score')
+    def handle_team_score(self, index, actor_id, flattened_value):
+        tis = flattened_value['Engine.TeamInfo:Score']
+        tis_increased = False
+
+        if tis['value'] > self.teaminfo_score.get(actor_id, 0):
+            self.teaminfo_score[actor_id] = tis['value']
+            tis_increased = True
+
+        if index not in self.goal_actors and tis_increased:
+            self.goal_actors[index] = actor_id
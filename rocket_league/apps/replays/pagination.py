@@ -0,0 +1,130 @@
+"""
+Keyset pagination for the replay list.
+
+Rather than an OFFSET, which has to walk past every earlier row, each page
+carries on from the sort key of the last replay on the one before, so a deep
+page costs as much as the first.  The total is only a guide and is cached.
+"""
+import hashlib
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+
+from .models import Replay
+
+# The order of the replay list.  Along with the season, privacy and listable
+# flag these are the columns of the index in Replay.Meta.index_together.
+KEYSET_FIELDS = ('timestamp_date', 'average_rating', 'id')
+
+COUNT_CACHE_TIMEOUT = 60 * 10
+
+
+def encode_cursor(replay):
+    return '{}.{}.{}'.format(
+        replay.timestamp_date.strftime('%Y-%m-%d'),
+        replay.average_rating,
+        replay.pk,
+    )
+
+
+def decode_cursor(cursor):
+    try:
+        date, rating, pk = cursor.split('.')
+        return datetime.strptime(date, '%Y-%m-%d').date(), int(rating), int(pk)
+    except (AttributeError, ValueError):
+        raise EmptyPage('That page contains no results')
+
+
+class KeysetPage(object):
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator(object):
+    # Tells the templates to link pages by cursor rather than number.
+    keyset = True
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    @property
+    def count(self):
+        query = self.queryset.order_by().query
+        sql, params = query.sql_with_params()
+        cache_key = 'replay_list_count:{}'.format(
+            hashlib.md5('{}{}'.format(sql, params).encode('utf-8')).hexdigest()
+        )
+
+        count = cache.get(cache_key)
+
+        if count is None:
+            count = self.queryset.count()
+            cache.set(cache_key, count, COUNT_CACHE_TIMEOUT)
+
+        return count
+
+    def _seek(self, cursor, operator):
+        # A row comparison is served by the index, unlike the equivalent
+        # chain of ORs.
+        return self.queryset.extra(
+            where=['({}) {} (%s, %s, %s)'.format(
+                ', '.join('{}.{}'.format(Replay._meta.db_table, field) for field in KEYSET_FIELDS),
+                operator,
+            )],
+            params=list(decode_cursor(cursor)),
+        )
+
+    def page(self, after=None, before=None):
+        """
+        The page following the `after` cursor, the page before the `before`
+        cursor, or the first page.
+        """
+        descending = ['-{}'.format(field) for field in KEYSET_FIELDS]
+
+        if before:
+            # Walk backwards from the cursor, then put the page back in order.
+            rows = list(self._seek(before, '>').order_by(*KEYSET_FIELDS)[:self.per_page + 1])
+            object_list = rows[:self.per_page][::-1]
+
+            if not object_list:
+                return self.page()
+
+            return KeysetPage(
+                object_list,
+                self,
+                next_cursor=encode_cursor(object_list[-1]),
+                previous_cursor=encode_cursor(object_list[0]) if len(rows) > self.per_page else None,
+            )
+
+        queryset = self.queryset
+
+        if after:
+            queryset = self._seek(after, '<')
+
+        rows = list(queryset.order_by(*descending)[:self.per_page + 1])
+        object_list = rows[:self.per_page]
+
+        return KeysetPage(
+            object_list,
+            self,
+            next_cursor=encode_cursor(object_list[-1]) if len(rows) > self.per_page else None,
+            previous_cursor=encode_cursor(object_list[0]) if after and object_list else None,
+        )
@@ -0,0 +1,285 @@
+"""
+A cache of netstream parse results.
+
+Decoding a replay with Rattletrap and walking its frames is by far the most
+expensive part of processing it, and reprocessing usually happens because the
+way the output is saved has changed rather than the replay or the parser.  The
+result of the parse is kept for replays which are being reprocessed, keyed by
+a hash of the replay file, the Rattletrap build and the versions of the
+netstream parser and the analyzers which were run.  Changing any of those
+misses the cache rather than serving stale results.
+
+The entries are pickles, so they're kept on the workers' own disks (the
+REPLAY_PARSE_CACHE_ROOT setting) rather than in the shared media storage,
+and each is signed with the secret key.  An entry which doesn't match its
+signature is never unpickled.  Entries which haven't been used for
+REPLAY_PARSE_CACHE_MAX_AGE seconds are removed, followed by the least recently
+used until the cache fits in REPLAY_PARSE_CACHE_MAX_BYTES, see `prune`.
+"""
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import time
+import zlib
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Q
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .analyzers import get_analyzers
+from .netstream import NetstreamParser
+from .rattletrap import rattletrap_binary
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_SALT = 'replays.parse_cache'
+SIGNATURE_LENGTH = 20  # salted_hmac is SHA-1 based.
+
+
+def cache_storage():
+    return FileSystemStorage(location=settings.REPLAY_PARSE_CACHE_ROOT)
+
+
+def replay_key(replay_obj):
+    """
+    A hash of the replay file's contents, so a file uploaded again under the
+    same name can't be given another file's parse.
+    """
+    digest = hashlib.sha256()
+
+    replay_obj.file.open('rb')
+
+    try:
+        for chunk in replay_obj.file.chunks():
+            digest.update(chunk)
+    finally:
+        replay_obj.file.close()
+
+    return digest.hexdigest()
+
+
+def decoder_version():
+    """
+    The Rattletrap build in use, taken from the name of its binary, or None if
+    it can't be found.
+    """
+    binaries = sorted(glob.glob(rattletrap_binary()))
+
+    if not binaries:
+        return None
+
+    return os.path.basename(binaries[-1])
+
+
+def parser_version(analyzers=None):
+    """
+    A version string covering the netstream parser and the analyzers it runs,
+    e.g. "netstream1-boost1-locations1".
+    """
+    return '-'.join(
+        ['netstream{}'.format(NetstreamParser.version)] +
+        ['{}{}'.format(analyzer.name, analyzer.version) for analyzer in get_analyzers(analyzers)]
+    )
+
+
+def version_parts(version):
+    """
+    The versions in a stored parser version string by name, e.g.
+    {'netstream': '1', 'boost': '1'}.
+    """
+    versions = {}
+
+    for part in filter(None, version.split('-')):
+        name = part.rstrip('0123456789')
+        versions[name] = part[len(name):]
+
+    return versions
+
+
+def is_up_to_date(version, analyzers=None):
+    """
+    Whether a stored parser version is current for the given analyzers, or
+    for the whole parse with none.  Only the analyzers' own versions are
+    compared, as rerunning them leaves the rest as it was.
+    """
+    if analyzers is None:
+        return version == parser_version()
+
+    versions = version_parts(version)
+
+    return all(
+        versions.get(analyzer.name) == str(analyzer.version)
+        for analyzer in get_analyzers(analyzers)
+    )
+
+
+def stored_versions():
+    """
+    The distinct parser versions replays have been processed with.
+    """
+    from .models import Replay
+
+    return set(Replay.objects.order_by().values_list('parser_version', flat=True).distinct())
+
+
+def up_to_date(analyzers=None, versions=None):
+    """
+    A filter for the replays whose stored parser version is current for the
+    given analyzers.  Each of the stored versions is checked here and matched
+    exactly, so the filter can use the parser_version index.
+    """
+    if versions is None:
+        versions = stored_versions()
+
+    return Q(parser_version__in=sorted(
+        version for version in versions if is_up_to_date(version, analyzers)
+    ))
+
+
+def out_of_date(analyzers=None, versions=None):
+    """
+    The opposite of `up_to_date`, also matched exactly.
+    """
+    if versions is None:
+        versions = stored_versions()
+
+    return Q(parser_version__in=sorted(
+        version for version in versions if not is_up_to_date(version, analyzers)
+    ))
+
+
+def update_parser_version(version, analyzers):
+    """
+    Return a stored parser version string with the versions of the given
+    analyzers brought up to date, for a replay which had just those analyzers
+    rerun.
+    """
+    versions = version_parts(version)
+
+    for analyzer in get_analyzers(analyzers):
+        versions[analyzer.name] = analyzer.version
+
+    # Keep the order parser_version uses, so a replay which is up to date
+    # matches it exactly.
+    names = ['netstream'] + [analyzer.name for analyzer in get_analyzers()]
+
+    return '-'.join(
+        '{}{}'.format(name, versions[name])
+        for name in names
+        if name in versions
+    )
+
+
+def cache_name(replay_obj, analyzers=None):
+    """
+    Return the storage name of the cached parse of a replay, or None if the
+    parse can't be cached.
+    """
+    version = decoder_version()
+
+    if version is None:
+        return None
+
+    return '{}/{}/{}.pickle.zlib'.format(
+        version,
+        parser_version(analyzers),
+        replay_key(replay_obj),
+    )
+
+
+def _signature(data):
+    return salted_hmac(SIGNATURE_SALT, data).digest()
+
+
+def load(name, storage=None):
+    storage = storage or cache_storage()
+
+    if not storage.exists(name):
+        return None
+
+    with storage.open(name, 'rb') as f:
+        data = f.read()
+
+    # The modification time is when the entry was last used, for `prune`.
+    os.utime(storage.path(name))
+
+    signature, data = data[:SIGNATURE_LENGTH], data[SIGNATURE_LENGTH:]
+
+    if not constant_time_compare(signature, _signature(data)):
+        logger.warning('Ignoring cached parse %s with a bad signature', name)
+        return None
+
+    try:
+        return pickle.loads(zlib.decompress(data))
+    except (zlib.error, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        # Treat an entry we can't read as a miss, it'll be replaced.
+        logger.exception('Unable to read cached parse %s', name)
+        return None
+
+
+def store(name, parsed, storage=None):
+    storage = storage or cache_storage()
+
+    # Storages pick a new name rather than overwriting an existing file.
+    if storage.exists(name):
+        storage.delete(name)
+
+    data = zlib.compress(pickle.dumps(parsed, pickle.HIGHEST_PROTOCOL))
+    storage.save(name, ContentFile(_signature(data) + data))
+
+    prune(storage)
+
+
+def prune(storage=None, max_bytes=None, max_age=None):
+    """
+    Remove the entries which haven't been used for `max_age` seconds, then
+    the least recently used until the rest fit in `max_bytes`.  Returns the
+    number of entries removed.
+    """
+    storage = storage or cache_storage()
+
+    if max_bytes is None:
+        max_bytes = settings.REPLAY_PARSE_CACHE_MAX_BYTES
+
+    if max_age is None:
+        max_age = settings.REPLAY_PARSE_CACHE_MAX_AGE
+
+    entries = []
+
+    for directory, _, filenames in os.walk(storage.location):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Removed by another worker.
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    entries.sort(reverse=True)
+
+    cutoff = time.time() - max_age
+    total = 0
+    removed = 0
+
+    # Newest first, once the limit is passed everything older goes as well.
+    for last_used, size, path in entries:
+        total += size
+
+        if last_used >= cutoff and total <= max_bytes:
+            continue
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+
+        removed += 1
+
+    return removed
@@ -7,16 +7,18 @@ import time
 from collections import OrderedDict
 from datetime import datetime, timedelta
 from pprint import pprint
-from sys import platform
 
 import pytz
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.db import transaction
 from django.utils import timezone
 
 from pyrope import Replay as Pyrope
 
+from .rattletrap import iter_replay
+
 
 def distance(pos1, pos2):
     xd = pos2[0] - pos1[0]
@@ -219,15 +221,7 @@ def flatten_value(value):
 
 
 def _parse_header(replay_obj, replay):
-    from .models import BoostData, Goal, Map, Player, Season
-
-    Goal.objects.filter(replay=replay_obj).delete()
-    Player.objects.filter(replay=replay_obj).delete()
-    BoostData.objects.filter(replay=replay_obj).delete()
-
-    assert Goal.objects.filter(replay=replay_obj).count() == 0
-    assert Player.objects.filter(replay=replay_obj).count() == 0
-    assert BoostData.objects.filter(replay=replay_obj).count() == 0
+    from .reference import get_map, season_for
 
     # Assign the metadata to the replay object.
     header = replay['header']['body']['properties']['value']
@@ -251,9 +245,7 @@ def _parse_header(replay_obj, replay):
     replay_obj.record_fps = get_value(header, 'RecordFPS')
 
     if get_value(header, 'MapName', False):
-        map_obj, _ = Map.objects.get_or_create(
-            slug=get_value(header, 'MapName').lower(),
-        )
+        map_obj = get_map(get_value(header, 'MapName').lower())
     else:
         map_obj = None
 
@@ -309,9 +301,7 @@ def _parse_header(replay_obj, replay):
                 timezone.get_current_timezone()
             )
 
-    replay_obj.season = Season.objects.filter(
-        start_date__lte=replay_obj.timestamp,
-    ).first()
+    replay_obj.season_id = season_for(replay_obj.timestamp)
 
     replay_obj.title = get_value(header, 'ReplayName', None)
 
@@ -319,118 +309,99 @@ def _parse_header(replay_obj, replay):
 
 
 def parse_replay_header(replay_id):
-    from .models import Replay, Player, Goal
+    from .daily_stats import update_daily_stats
+    from .models import Replay
+    from .persistence import player_key, save_goals, save_players
 
     replay_obj = Replay.objects.get(pk=replay_id)
 
     replay = Pyrope(replay_obj.file.read())
 
     replay = _pyrope_to_rattletrap(replay)
-    replay_obj, replay, header = _parse_header(replay_obj, replay)
-
-    # Create the player objects.
-    if 'PlayerStats' in header:
-        for player in get_value(header, 'PlayerStats', []):
-            Player.objects.get_or_create(
-                replay=replay_obj,
-                player_name=get_value(player, 'Name'),
-                platform=get_value(player, 'Platform'),
-                saves=get_value(player, 'Saves'),
-                score=get_value(player, 'Score'),
-                goals=get_value(player, 'Goals'),
-                shots=get_value(player, 'Shots'),
-                team=get_value(player, 'Team'),
-                assists=get_value(player, 'Assists'),
-                bot=get_value(player, 'bBot'),
-                online_id=get_value(player, 'OnlineID'),
-            )
-    else:
-        # The best we can do is to get the goal scorers and the player.
-        for goal in get_value(header, 'Goals', []):
-            Player.objects.get_or_create(
-                replay=replay_obj,
-                player_name=get_value(goal, 'PlayerName'),
-                team=get_value(goal, 'PlayerTeam'),
-            )
 
-        if 'PlayerName' in header:
+    with transaction.atomic():
+        replay_obj, replay, header = _parse_header(replay_obj, replay)
+
+        # Work out the players.
+        players = []
+
+        if 'PlayerStats' in header:
+            for player in get_value(header, 'PlayerStats', []):
+                players.append({
+                    'player_name': get_value(player, 'Name'),
+                    'platform': get_value(player, 'Platform'),
+                    'saves': get_value(player, 'Saves'),
+                    'score': get_value(player, 'Score'),
+                    'goals': get_value(player, 'Goals'),
+                    'shots': get_value(player, 'Shots'),
+                    'team': get_value(player, 'Team'),
+                    'assists': get_value(player, 'Assists'),
+                    'bot': get_value(player, 'bBot'),
+                    'online_id': get_value(player, 'OnlineID'),
+                })
+        elif 'PlayerName' in header:
+            # The best we can do is the player who saved the replay, and the
+            # goal scorers below.
             team = 0
 
             if 'PrimaryPlayerTeam' in header:
                 team = get_value(header, 'PrimaryPlayerTeam')
 
-            Player.objects.get_or_create(
-                replay=replay_obj,
-                player_name=get_value(header, 'PlayerName'),
-                team=team,
-            )
-
-    # Create the goal objects.
-    if 'Goals' in header:
-        for index, goal in enumerate(get_value(header, 'Goals', [])):
-            player = None
-
-            players = Player.objects.filter(
-                replay=replay_obj,
-                player_name=get_value(goal, 'PlayerName'),
-                team=get_value(goal, 'PlayerTeam'),
-            )
-
-            if players.count() > 0:
-                player = players[0]
-            else:
-                player = Player.objects.create(
-                    replay=replay_obj,
-                    player_name=get_value(goal, 'PlayerName'),
-                    team=get_value(goal, 'PlayerTeam'),
-                )
-
-            try:
-                goal_obj = Goal.objects.get(
-                    replay=replay_obj,
-                    frame=get_value(goal, 'frame'),
-                    number=index + 1,
-                    player=player,
-                )
+            players.append({
+                'player_name': get_value(header, 'PlayerName'),
+                'team': team,
+            })
 
-                goal_obj.delete()
-            except Goal.DoesNotExist:
-                pass
+        # Make sure every goal scorer has a player.
+        for goal in get_value(header, 'Goals', []):
+            players.append({
+                'player_name': get_value(goal, 'PlayerName'),
+                'team': get_value(goal, 'PlayerTeam'),
+            })
 
-            Goal.objects.create(
-                replay=replay_obj,
-                frame=get_value(goal, 'frame'),
-                number=index + 1,
-                player=player,
-            )
+        player_objects = save_players(replay_obj, players)
 
-    replay_obj.processed = True
-    replay_obj.crashed_heatmap_parser = False
-    replay_obj.save()
+        # Create the goal objects.
+        save_goals(replay_obj, [
+            {
+                'number': index + 1,
+                'frame': get_value(goal, 'frame'),
+                'player': player_objects[player_key(get_value(goal, 'PlayerName'), get_value(goal, 'PlayerTeam'))],
+            }
+            for index, goal in enumerate(get_value(header, 'Goals', []))
+        ])
 
+        replay_obj.processed = True
+        replay_obj.crashed_heatmap_parser = False
+        replay_obj.scoreboard = replay_obj.build_scoreboard()
+        replay_obj.bump_content_version()
+        replay_obj.save()
 
-def parse_replay_netstream(replay_id):
-    from .models import PLATFORMS, BoostData, Goal, Player, Replay
+        update_daily_stats(replay_obj)
 
-    replay_obj = Replay.objects.get(pk=replay_id)
 
+def _decode_netstream(replay_obj):
     try:
-        if settings.DEBUG and platform == 'darwin':
-            replay = json.loads(subprocess.check_output('rattletrap-binaries/rattletrap-*-osx -i {}'.format(
-                replay_obj.file.url
-            ), shell=True).decode('utf-8'))
-        else:
-            replay = json.loads(subprocess.check_output('rattletrap-binaries/rattletrap-*-linux -i {}'.format(
-                replay_obj.file.path if settings.DEBUG else replay_obj.file.url,
-            ), shell=True).decode('utf-8'))
-
-    except subprocess.CalledProcessError as e:
+        yield from iter_replay(replay_obj)
+    except subprocess.CalledProcessError:
         # Parsing the file failed.
         replay_obj.processed = False
         replay_obj.save()
-        raise e
+        raise
 
-    replay_obj, replay, header = _parse_header(replay_obj, replay)
+
+def _parse_netstream(replay_obj, analyzers=None):
+    """
+    Decode a replay and walk its network frames, returning the header section
+    along with everything the netstream parser pulled out of it.
+    """
+    from .netstream import NetstreamParser
+
+    # Rattletrap's output is read incrementally, the header comes first and
+    # the network frames follow one at a time.
+    replay_stream = _decode_netstream(replay_obj)
+    header_section = next(replay_stream)
+    header = header_section['body']['properties']['value']
 
     goals = {
         get_value(goal, 'frame'): {
@@ -440,402 +411,95 @@ def parse_replay_netstream(replay_id):
         for goal in get_value(header, 'Goals', [])
     }
 
-    last_hits = {
-        0: None,
-        1: None
+    netstream = NetstreamParser(goals, analyzers)
+    netstream.parse(replay_stream)
+
+    return {
+        'header': header_section,
+        'actors': netstream.actors,
+        'player_actors': netstream.player_actors,
+        'goal_actors': netstream.goal_actors,
+        'team_data': netstream.team_data,
+        'replay_fields': netstream.replay_fields,
+        'results': netstream.results(),
     }
 
-    actors = {}  # All actors
-    player_actors = {}  # XXX: This will be used to make the replay.save() easier.
-    match_goals = {}
-    teaminfo_score = {}
-    goal_actors = {}
-    team_data = {}
-    actor_positions = {}  # The current position data for all actors. Do we need this?
-    player_cars = {}  # Car -> Player actor ID mappings.
-    boost_components = {}  # Archetypes.CarComponents.CarComponent_Boost objects
-    ball_angular_velocity = None  # The current angular velocity of the ball.
-    ball_possession = None  # The team currently in possession of the ball.
-    cars_frozen = False  # Whether the cars are frozen in place (3.. 2.. 1..)
-    shot_data = []  # The locations of the player and the ball when goals were scored.
-    unknown_boost_data = {}  # Holding dict for boosts without player data.
-    ball_actor_id = None
-
-    location_data = []  # Used for the location JSON.
-    boost_data = {}  # Used for the boost stats.
-    boost_objects = []
-    heatmap_data = {}
-    seconds_mapping = {}  # Frame -> seconds remaining mapping.
 
-    heatmap_json_filename = 'uploads/replay_json_files/{}.json'.format(replay_obj.replay_id)
-    location_json_filename = 'uploads/replay_location_json_files/{}.json'.format(replay_obj.replay_id)
+def parse_replay_netstream(replay_id, analyzers=None):
+    """
+    Decode a replay's network stream and save what we pull out of it.
 
-    for index, frame in enumerate(replay['content']['body']['frames']):
-        # Add an empty location list for this frame.
-        location_data.append([])
+    By default every analyzer is run and the players and goals are saved.
+    Passing a list of analyzer names instead reruns just those analyzers (and
+    any they require) against a replay which has already been processed,
+    replacing only their output.
+    """
+    from . import parse_cache
+    from .boost import save_boost_analysis
+    from .models import Replay
+    from .player_stats import update_player_stats
 
-        ball_hit = False
-        confirmed_ball_hit = False
-        ball_spawned = False
+    replay_obj = Replay.objects.get(pk=replay_id)
 
-        if index in goals:
-            # Get the ball position.
-            ball_actor_id = list(filter(lambda x: actors[x]['class_name'] in ['TAGame.Ball_TA', 'TAGame.Ball_Breakout_TA'], actors))[0]
-            ball_position = actor_positions[ball_actor_id]
+    # Decoding the replay is the slow part, so reuse an earlier parse of the
+    # same file by the same code if we have one.  Only replays which are being
+    # reprocessed are cached, a new upload is unlikely to be parsed again by
+    # the same code.
+    cache_name = None
+    parsed = None
 
-            # XXX: Update this to also register the hitter?
-            hit_position = last_hits[goals[index]['PlayerTeam']]
+    if settings.REPLAY_PARSE_CACHE and replay_obj.parser_version:
+        cache_name = parse_cache.cache_name(replay_obj, analyzers)
 
-            shot_data.append({
-                'player': hit_position,
-                'ball': ball_position,
-                'frame': index
-            })
+        if cache_name:
+            parsed = parse_cache.load(cache_name)
 
-            # Reset the last hits.
-            last_hits = {
-                0: None,
-                1: None
-            }
+    if parsed is None:
+        parsed = _parse_netstream(replay_obj, analyzers)
 
-        # Handle any new actors.
-        for replication in frame['replications']:
-            actor_id = int(replication['actor_id']['value'])
-            replication_type = list(replication['value'].keys())[0]
-            value = replication['value'][replication_type]
-            flattened_value = flatten_value(value)
-
-            if replication_type == 'spawned':
-                if actor_id not in actors:
-                    actors[actor_id] = value
-
-                if 'Engine.Pawn:PlayerReplicationInfo' in flattened_value:
-                    player_actor_id = value['Engine.Pawn:PlayerReplicationInfo']['value']
-                    player_cars[player_actor_id] = actor_id
-
-                if value['class_name'] == 'TAGame.Ball_TA':
-                    ball_spawned = True
-                elif value['class_name'] == 'TAGame.PRI_TA':
-                    player_actors[actor_id] = value
-                    player_actors[actor_id]['joined'] = index
-                elif value['class_name'] == 'TAGame.Team_Soccar_TA':
-                    team_data[actor_id] = value['object_name'].replace('Archetypes.Teams.Team', '')
-
-            # Handle any updates to existing actors.
-            elif replication_type == 'updated':
-                if (
-                    'Engine.PlayerReplicationInfo:Team' in flattened_value and
-                    not flattened_value['Engine.PlayerReplicationInfo:Team']['value']
-                ):
-                    del flattened_value['Engine.PlayerReplicationInfo:Team']
-
-                # If an actor is getting their team value nuked, store what it was
-                # so we can use it later on.
-                if (
-                    'Engine.PlayerReplicationInfo:Team' in flattened_value and
-                    flattened_value['Engine.PlayerReplicationInfo:Team']['value'] == -1 and
-                    actors[actor_id]['Engine.PlayerReplicationInfo:Team']['value'] != -1
-                ):
-                    actors[actor_id]['Engine.PlayerReplicationInfo:CachedTeam'] = actors[actor_id]['Engine.PlayerReplicationInfo:Team']
-
-                # Merge the new properties with the existing.
-                if actors[actor_id] != value:
-                    actors[actor_id] = {**actors[actor_id], **flattened_value}
-
-                    if actor_id in player_actors:
-                        player_actors[actor_id] = actors[actor_id]
-
-                if 'Engine.Pawn:PlayerReplicationInfo' in flattened_value:
-                    player_actor_id = flattened_value['Engine.Pawn:PlayerReplicationInfo']['value']
-                    player_cars[player_actor_id] = actor_id
-
-            # Handle removing any destroyed actors.
-            elif replication_type == 'destroyed':
-                del actors[actor_id]
-
-                if actor_id in player_actors:
-                    player_actors[actor_id]['left'] = index
-            else:
-                raise Exception('Unhandled replication_type: {}'.format(replication_type))
+        if cache_name:
+            parse_cache.store(cache_name, parsed)
 
-        # Loop over actors which have changed in this frame.
-        for replication in frame['replications']:
-            actor_id = int(replication['actor_id']['value'])
-            replication_type = list(replication['value'].keys())[0]
-            value = replication['value'][replication_type]
-            flattened_value = flatten_value(value)
+    _save_netstream(replay_obj, parsed, analyzers)
 
-            if replication_type not in ['spawned', 'updated']:
-                continue
-
-            # Look for any position data.
-            if 'TAGame.RBActor_TA:ReplicatedRBState' in flattened_value:
-                location = flattened_value['TAGame.RBActor_TA:ReplicatedRBState']['value']['location']
-                rotation = flattened_value['TAGame.RBActor_TA:ReplicatedRBState']['value']['rotation']
-
-                actor_positions[actor_id] = [location['x'], location['y'], location['z']]
-
-                # Get the player actor id.
-                real_actor_id = actor_id
-
-                for player_actor_id, car_actor_id in player_cars.items():
-                    if actor_id == car_actor_id:
-                        real_actor_id = player_actor_id
-                        break
-
-                if real_actor_id == actor_id:
-                    real_actor_id = 'ball'
-
-                data_dict = {'id': real_actor_id}
-                data_dict['x'] = location['x']
-                data_dict['y'] = location['y']
-                data_dict['z'] = location['z']
-
-                # print(rotation)
-                data_dict['roll'] = rotation['x']['value']
-                data_dict['pitch'] = rotation['y']['value']
-                data_dict['yaw'] = rotation['z']['value']
-
-                location_data[index].append(data_dict)
-
-            # If this property exists, the ball has changed possession.
-            if 'TAGame.Ball_TA:HitTeamNum' in flattened_value:
-                ball_hit = confirmed_ball_hit = True
-                hit_team_num = flattened_value['TAGame.Ball_TA:HitTeamNum']['value']
-                ball_possession = hit_team_num
-
-                # Clean up the actor positions.
-                actor_positions_copy = actor_positions.copy()
-                for actor_position in actor_positions_copy:
-                    found = False
-
-                    for car in player_cars:
-                        if actor_position == player_cars[car]:
-                            found = True
-
-                    if not found and actor_position != ball_actor_id:
-                        del actor_positions[actor_position]
-
-            # Store the boost data for each actor at each frame where it changes.
-            if 'TAGame.CarComponent_Boost_TA:ReplicatedBoostAmount' in flattened_value:
-                boost_value = flattened_value['TAGame.CarComponent_Boost_TA:ReplicatedBoostAmount']['value']
-                assert 0 <= boost_value <= 255, 'Boost value {} is not in range 0-255.'.format(boost_value)
-
-                if actor_id not in boost_data:
-                    boost_data[actor_id] = {}
-
-                # Sometimes we have a boost component without a reference to
-                # a car. We don't want to lose that data, so stick it into a
-                # holding dictionary until we can figure out who it belongs to.
-
-                if 'TAGame.CarComponent_TA:Vehicle' not in actors[actor_id]:
-                    if actor_id not in unknown_boost_data:
-                        unknown_boost_data[actor_id] = {}
-
-                    unknown_boost_data[actor_id][index] = boost_value
-                else:
-                    car_id = actors[actor_id]['TAGame.CarComponent_TA:Vehicle']['value']
-
-                    # Find out which player this car belongs to.
-                    try:
-                        player_actor_id = [
-                            player_actor_id
-                            for player_actor_id, car_actor_id in player_cars.items()
-                            if car_actor_id == car_id
-                        ][0]
-
-                        if player_actor_id not in boost_data:
-                            boost_data[player_actor_id] = {}
-
-                        boost_data[player_actor_id][index] = boost_value
-
-                        # Attach any floating data (if we can).
-                        if actor_id in unknown_boost_data:
-                            for frame_index, boost_value in unknown_boost_data[actor_id].items():
-                                boost_data[player_actor_id][frame_index] = boost_value
-
-                            del unknown_boost_data[actor_id]
-
-                    except IndexError:
-                        pass
-
-            # Store the mapping of frame -> clock time.
-            if 'TAGame.GameEvent_Soccar_TA:SecondsRemaining' in flattened_value:
-                seconds_mapping[index] = flattened_value['TAGame.GameEvent_Soccar_TA:SecondsRemaining']['value']
-
-            # See if the cars are frozen in place.
-            if 'TAGame.GameEvent_TA:ReplicatedGameStateTimeRemaining' in flattened_value:
-                if flattened_value['TAGame.GameEvent_TA:ReplicatedGameStateTimeRemaining']['value'] == 3:
-                    cars_frozen = True
-                elif flattened_value['TAGame.GameEvent_TA:ReplicatedGameStateTimeRemaining']['value'] == 0:
-                    cars_frozen = False
-
-            # Get the camera details.
-            if 'TAGame.CameraSettingsActor_TA:ProfileSettings' in flattened_value:
-                if actors[actor_id]['class_name'] == 'TAGame.CameraSettingsActor_TA':
-                    # Define some short variable names to stop the next line
-                    # being over 200 characters long.  This block of code
-                    # makes new replays have a camera structure which is
-                    # similar to that of the old replays - where the camera
-                    # settings are directly attached to the player rather
-                    # than a CameraActor (which is what the actor in this
-                    # current loop is).
-
-                    csa = 'TAGame.CameraSettingsActor_TA:PRI'
-                    ps = 'TAGame.CameraSettingsActor_TA:ProfileSettings'
-                    cs = 'TAGame.PRI_TA:CameraSettings'
-
-                    if csa in flattened_value:
-                        player_actor_id = flattened_value[csa]['value']
-                        actors[player_actor_id][cs] = flattened_value[ps]['value']
-
-            if 'Engine.GameReplicationInfo:ServerName' in flattened_value:
-                replay_obj.server_name = flattened_value['Engine.GameReplicationInfo:ServerName']['value']
-
-            if 'ProjectX.GRI_X:ReplicatedGamePlaylist' in flattened_value:
-                replay_obj.playlist = flattened_value['ProjectX.GRI_X:ReplicatedGamePlaylist']['value']
-
-            if 'TAGame.GameEvent_Team_TA:MaxTeamSize' in flattened_value:
-                replay_obj.team_sizes = flattened_value['TAGame.GameEvent_Team_TA:MaxTeamSize']['value']
-
-            if 'TAGame.PRI_TA:MatchGoals' in flattened_value:
-                # Get the closest goal to this frame.
-                mg = flattened_value['TAGame.PRI_TA:MatchGoals']
-                mg_increased = False
-
-                if mg['value'] > match_goals.get(actor_id, 0):
-                    match_goals[actor_id] = mg['value']
-                    mg_increased = True
-
-                if index not in match_goals and mg_increased:
-                    goal_actors[index] = actor_id
-                    match_goals[actor_id] = mg['value']
-
-            if 'Engine.TeamInfo:Score' in flattened_value:
-                tis = flattened_value['Engine.TeamInfo:Score']
-                tis_increased = False
-
-                if tis['value'] > teaminfo_score.get(actor_id, 0):
-                    teaminfo_score[actor_id] = tis['value']
-                    tis_increased = True
-
-                if index not in goal_actors and tis_increased:
-                    goal_actors[index] = actor_id
-
-        # Work out which direction the ball is travelling and if it has
-        # changed direction or speed.
-        ball = None
-        ball_actor_id = None
-        for actor_id, value in actors.items():
-            if value['class_name'] == 'TAGame.Ball_TA':
-                ball_actor_id = actor_id
-                ball = value
-                break
-
-        ball_hit = False
-
-        # Take a look at the ball this frame, has anything changed?
-        if (
-            ball and
-            'TAGame.RBActor_TA:ReplicatedRBState' in ball and
-            'angular_velocity' in ball['TAGame.RBActor_TA:ReplicatedRBState']['value']
-        ):
-            new_ball_angular_velocity = ball['TAGame.RBActor_TA:ReplicatedRBState']['value']['angular_velocity']
-
-            # The ball has *changed direction*, but not necessarily been hit (it
-            # may have bounced).
-
-            if ball_angular_velocity != new_ball_angular_velocity:
-                ball_hit = True
-
-            ball_angular_velocity = new_ball_angular_velocity
-
-            # Calculate the current distances between cars and the ball.
-            # Do we have position data for the ball?
-            if ball_hit and not ball_spawned and ball_actor_id in actor_positions:
-
-                # Iterate over the cars to get the players.
-                lowest_distance = None
-                lowest_distance_car_actor = None
-
-                for player_id, car_actor_id in player_cars.items():
-                    # Get the team.
-                    if (
-                        player_id in actors and
-                        'Engine.PlayerReplicationInfo:Team' in actors[player_id] and
-                        actors[player_id]['Engine.PlayerReplicationInfo:Team']['value']
-                    ):
-                        team_id = actors[player_id]['Engine.PlayerReplicationInfo:Team']['value']
-
-                        try:
-                            team_actor = actors[team_id]
-                            team = int(team_actor['object_name'].replace('Archetypes.Teams.Team', '').replace('GameEvent_Soccar_TA_', ''))
-                        except KeyError:
-                            team = -1
-                    else:
-                        team = -1
-
-                    # Make sure this actor is in on the team which is currently
-                    # in possession.
-
-                    if team != ball_possession:
-                        continue
-
-                    if car_actor_id in actor_positions:
-                        actor_distance = distance(actor_positions[car_actor_id], actor_positions[ball_actor_id])
-
-                        if not confirmed_ball_hit:
-                            if actor_distance > 350:  # Value taken from the max confirmed distance.
-                                continue
-
-                        # Get the player on this team with the lowest distance.
-                        if lowest_distance is None or actor_distance < lowest_distance:
-                            lowest_distance = actor_distance
-                            lowest_distance_car_actor = car_actor_id
-
-                if lowest_distance_car_actor:
-                    last_hits[ball_possession] = actor_positions[lowest_distance_car_actor]
-
-        # Generate the heatmap data for this frame.  Get all of the players
-        # and the ball.
-        if not cars_frozen:
-            moveable_actors = [
-                (actor_id, value)
-                for actor_id, value in actors.items()
-                if value['class_name'] in ['TAGame.Ball_TA', 'TAGame.PRI_TA', 'TAGame.Car_TA'] and
-                (
-                    'TAGame.RBActor_TA:ReplicatedRBState' in value or
-                    'location' in value
-                )
-            ]
+    # Now the parse has been committed, work out the boost analysis rather
+    # than when it's viewed, and bring the season stats of everyone in the
+    # replay up to date.
+    if 'boost_data' in parsed['results']:
+        save_boost_analysis(replay_obj)
 
-            for actor_id, value in moveable_actors:
-                if value['class_name'] == 'TAGame.Ball_TA':
-                    actor_id = 'ball'
-                elif value['class_name'] == 'TAGame.Car_TA':
-                    if 'Engine.Pawn:PlayerReplicationInfo' not in value:
-                        continue
+    update_player_stats(replay_obj)
 
-                    actor_id = value['Engine.Pawn:PlayerReplicationInfo']['value']
 
-                if 'TAGame.RBActor_TA:ReplicatedRBState' in value:
-                    key = '{},{}'.format(
-                        value['TAGame.RBActor_TA:ReplicatedRBState']['value']['location']['x'],
-                        value['TAGame.RBActor_TA:ReplicatedRBState']['value']['location']['y'],
-                    )
-                elif 'location' in value:
-                    key = '{},{}'.format(
-                        value['location']['x'],
-                        value['location']['y'],
-                    )
+@transaction.atomic
+def _save_netstream(replay_obj, parsed, analyzers=None):
+    """
+    Save the result of `_parse_netstream` to a replay, its players, goals and
+    boost data, and its files.  The rows are written in one transaction, so a
+    failure part way through leaves the replay's players and goals as they
+    were.
+    """
+    from . import parse_cache
+    from .daily_stats import update_daily_stats
+    from .models import PLATFORMS, Player
+    from .persistence import player_key, save_boost_data, save_goals, save_players
+
+    replay = {'header': parsed['header']}
+    replay_obj, replay, header = _parse_header(replay_obj, replay)
 
-                if actor_id not in heatmap_data:
-                    heatmap_data[actor_id] = {}
+    results = parsed['results']
 
-                if key in heatmap_data[actor_id]:
-                    heatmap_data[actor_id][key] += 1
-                else:
-                    heatmap_data[actor_id][key] = 1
+    for field, value in parsed['replay_fields'].items():
+        setattr(replay_obj, field, value)
+
+    actors = parsed['actors']
+    player_actors = parsed['player_actors']
+    goal_actors = parsed['goal_actors']
+    team_data = parsed['team_data']
+
+    heatmap_json_filename = 'uploads/replay_json_files/{}.json'.format(replay_obj.replay_id)
+    heatmap_grid_filename = 'uploads/replay_heatmap_grid_files/{}.json'.format(replay_obj.replay_id)
+    location_json_filename = 'uploads/replay_location_json_files/{}.json'.format(replay_obj.replay_id)
 
     def get_team(actor_id):
         if actor_id == -1:
@@ -843,189 +507,223 @@ def parse_replay_netstream(replay_id):
 
         return int(actors[actor_id]['object_name'].replace('Archetypes.Teams.Team', ''))
 
-    player_objects = {}
+    player_objects = {}  # Actor ID -> Player
 
-    # Make a dict of all the player actors and then do a bulk_create?
-    for actor_id, value in player_actors.items():
-        if 'Engine.PlayerReplicationInfo:UniqueId' in value:
-            system = value['Engine.PlayerReplicationInfo:UniqueId']['value']['system_id']
-            local_id = value['Engine.PlayerReplicationInfo:UniqueId']['value']['local_id']
-            online_id = value['Engine.PlayerReplicationInfo:UniqueId']['value']['remote_id']
+    if analyzers is None:
+        players = []
+        player_keys = {}  # Actor ID -> player_key
 
-            unique_id = '{system}-{remote}-{local}'.format(
-                system=system,
-                remote=online_id,
-                local=local_id,
-            )
-        else:
-            system = 'Unknown'
-            unique_id = ''
-            online_id = ''
-
-        team = -1
-
-        if 'Engine.PlayerReplicationInfo:Team' in value and value['Engine.PlayerReplicationInfo:Team']['value']:
-            team = get_team(value['Engine.PlayerReplicationInfo:Team']['value'])
-
-        # Attempt to get the team ID from our cache.
-        if team == -1 and 'Engine.PlayerReplicationInfo:CachedTeam' in value:
-            team = get_team(value['Engine.PlayerReplicationInfo:CachedTeam']['value'])
-
-        if team == -1:
-            # If this is a 1v1 and the other player has a team, then put this
-            # player on the opposite team.
-            if len(player_actors) == 2:
-                pak = list(player_actors.keys())
-                other_player = player_actors[pak[(pak.index(actor_id) - 1) * -1]]
-
-                other_team = -1
-
-                if 'Engine.PlayerReplicationInfo:Team' in other_player and other_player['Engine.PlayerReplicationInfo:Team']['value']:
-                    other_team = other_player['Engine.PlayerReplicationInfo:Team']['value']
-
-                # Attempt to get the team ID from our cache.
-                if other_team == -1 and 'Engine.PlayerReplicationInfo:CachedTeam' in other_player:
-                    other_team = other_player['Engine.PlayerReplicationInfo:CachedTeam']['value']
-
-                if other_team != -1:
-                    # There's nothing more we can do.
-                    tdk = list(team_data.keys())
-                    team_id = tdk[(tdk.index(other_team) - 1) * 1]
-                    team = get_team(team_id)
-
-                    player_actors[actor_id]['Engine.PlayerReplicationInfo:Team'] = {
-                        'Type': 'FlaggedInt',
-                        'Value': {
-                            'Flag': True,
-                            'Int': team_id,
-                        }
-                    }
-
-        player_objects[actor_id] = Player.objects.create(
-            replay=replay_obj,
-            player_name=value['Engine.PlayerReplicationInfo:PlayerName']['value'],
-            team=team,
-            score=value.get('TAGame.PRI_TA:MatchScore', {'value': 0})['value'],
-            goals=value.get('TAGame.PRI_TA:MatchGoals', {'value': 0})['value'],
-            shots=value.get('TAGame.PRI_TA:MatchShots', {'value': 0})['value'],
-            assists=value.get('TAGame.PRI_TA:MatchAssists', {'value': 0})['value'],
-            saves=value.get('TAGame.PRI_TA:MatchSaves', {'value': 0})['value'],
-            platform=PLATFORMS.get(system, system),
-            online_id=online_id,
-            bot=value.get('Engine.PlayerReplicationInfo:bBot', {'value': False})['value'],
-            spectator='Engine.PlayerReplicationInfo:Team' not in value,
-            actor_id=actor_id,
-            unique_id=unique_id,
-            camera_settings=value.get('TAGame.PRI_TA:CameraSettings', None),
-            vehicle_loadout=value.get('TAGame.PRI_TA:ClientLoadout', {'value': {}})['value'],
-            total_xp=value.get('TAGame.PRI_TA:TotalXP', {'value': 0})['value'],
-        )
+        for actor_id, value in player_actors.items():
+            if 'Engine.PlayerReplicationInfo:UniqueId' in value:
+                system = value['Engine.PlayerReplicationInfo:UniqueId']['value']['system_id']
+                local_id = value['Engine.PlayerReplicationInfo:UniqueId']['value']['local_id']
+                online_id = value['Engine.PlayerReplicationInfo:UniqueId']['value']['remote_id']
 
-        # Store the boost data for this player.
-        for boost_frame, boost_value in boost_data.get(actor_id, {}).items():
-            boost_objects.append(BoostData(
-                replay=replay_obj,
-                player=player_objects[actor_id],
-                frame=boost_frame,
-                value=boost_value,
-            ))
-
-    BoostData.objects.bulk_create(boost_objects)
-
-    # Create the goals.
-    goal_objects = []
-    goal_actors = OrderedDict(sorted(goal_actors.items()))
-
-    for index, actor_id in goal_actors.items():
-        # Use the player_objects dict rather than the full actors dict as
-        # players who leave the game get removed from the latter.
-
-        if actor_id in player_actors:
-            goal_objects.append(Goal(
-                replay=replay_obj,
-                number=len(goal_objects) + 1,
-                player=player_objects[actor_id],
-                frame=index,
-            ))
-
-        # This actor is most likely the team object, meaning the goal was an
-        # own goal scored without any of the players on the benefiting team
-        # hitting the ball.
-
-        elif actor_id in actors:
-            if actors[actor_id]['class_name'] == 'TAGame.Team_Soccar_TA':
-                own_goal_player, _ = Player.objects.get_or_create(
-                    replay=replay_obj,
-                    player_name='Unknown player (own goal?)',
-                    team=get_team(actor_id),
+                unique_id = '{system}-{remote}-{local}'.format(
+                    system=system,
+                    remote=online_id,
+                    local=local_id,
                 )
+            else:
+                system = 'Unknown'
+                unique_id = ''
+                online_id = ''
+
+            team = -1
+
+            if 'Engine.PlayerReplicationInfo:Team' in value and value['Engine.PlayerReplicationInfo:Team']['value']:
+                team = get_team(value['Engine.PlayerReplicationInfo:Team']['value'])
+
+            # Attempt to get the team ID from our cache.
+            if team == -1 and 'Engine.PlayerReplicationInfo:CachedTeam' in value:
+                team = get_team(value['Engine.PlayerReplicationInfo:CachedTeam']['value'])
+
+            if team == -1:
+                # If this is a 1v1 and the other player has a team, then put this
+                # player on the opposite team.
+                if len(player_actors) == 2:
+                    pak = list(player_actors.keys())
+                    other_player = player_actors[pak[(pak.index(actor_id) - 1) * -1]]
+
+                    other_team = -1
+
+                    if 'Engine.PlayerReplicationInfo:Team' in other_player and other_player['Engine.PlayerReplicationInfo:Team']['value']:
+                        other_team = other_player['Engine.PlayerReplicationInfo:Team']['value']
+
+                    # Attempt to get the team ID from our cache.
+                    if other_team == -1 and 'Engine.PlayerReplicationInfo:CachedTeam' in other_player:
+                        other_team = other_player['Engine.PlayerReplicationInfo:CachedTeam']['value']
+
+                    if other_team != -1:
+                        # There's nothing more we can do.
+                        tdk = list(team_data.keys())
+                        team_id = tdk[(tdk.index(other_team) - 1) * 1]
+                        team = get_team(team_id)
+
+                        player_actors[actor_id]['Engine.PlayerReplicationInfo:Team'] = {
+                            'Type': 'FlaggedInt',
+                            'Value': {
+                                'Flag': True,
+                                'Int': team_id,
+                            }
+                        }
+
+            players.append({
+                'player_name': value['Engine.PlayerReplicationInfo:PlayerName']['value'],
+                'team': team,
+                'score': value.get('TAGame.PRI_TA:MatchScore', {'value': 0})['value'],
+                'goals': value.get('TAGame.PRI_TA:MatchGoals', {'value': 0})['value'],
+                'shots': value.get('TAGame.PRI_TA:MatchShots', {'value': 0})['value'],
+                'assists': value.get('TAGame.PRI_TA:MatchAssists', {'value': 0})['value'],
+                'saves': value.get('TAGame.PRI_TA:MatchSaves', {'value': 0})['value'],
+                'platform': PLATFORMS.get(system, system),
+                'online_id': online_id,
+                'bot': value.get('Engine.PlayerReplicationInfo:bBot', {'value': False})['value'],
+                'spectator': 'Engine.PlayerReplicationInfo:Team' not in value,
+                'actor_id': actor_id,
+                'unique_id': unique_id,
+                'camera_settings': value.get('TAGame.PRI_TA:CameraSettings', None),
+                'vehicle_loadout': value.get('TAGame.PRI_TA:ClientLoadout', {'value': {}})['value'],
+                'total_xp': value.get('TAGame.PRI_TA:TotalXP', {'value': 0})['value'],
+            })
+
+            player_keys[actor_id] = player_key(players[-1]['player_name'], team, actor_id)
+
+        # Work out who scored the goals.
+        goals = []  # (frame, player_key)
+        goal_actors = OrderedDict(sorted(goal_actors.items()))
+
+        for index, actor_id in goal_actors.items():
+            # Use the player_objects dict rather than the full actors dict as
+            # players who leave the game get removed from the latter.
 
-                goal_objects.append(Goal(
-                    replay=replay_obj,
-                    number=len(goal_objects) + 1,
-                    player=own_goal_player,
-                    frame=index,
-                ))
+            if actor_id in player_actors:
+                goals.append((index, player_keys[actor_id]))
 
-    Goal.objects.bulk_create(goal_objects)
+            # This actor is most likely the team object, meaning the goal was an
+            # own goal scored without any of the players on the benefiting team
+            # hitting the ball.
+
+            elif actor_id in actors:
+                if actors[actor_id]['class_name'] == 'TAGame.Team_Soccar_TA':
+                    players.append({
+                        'player_name': 'Unknown player (own goal?)',
+                        'team': get_team(actor_id),
+                    })
+
+                    goals.append((index, player_key(players[-1]['player_name'], players[-1]['team'])))
+
+        saved_players = save_players(replay_obj, players)
+
+        player_objects = {
+            actor_id: saved_players[key]
+            for actor_id, key in player_keys.items()
+        }
+
+        save_goals(replay_obj, [
+            {
+                'number': number,
+                'frame': index,
+                'player': saved_players[key],
+            }
+            for number, (index, key) in enumerate(goals, 1)
+        ])
+    else:
+        # Only part of the replay is being reprocessed, the players were
+        # saved when it was first processed.
+        player_objects = {
+            player.actor_id: player
+            for player in Player.objects.filter(replay=replay_obj)
+        }
+
+    if 'boost_data' in results:
+        boost_data = results['boost_data']
+
+        # Store the boost data for each player.
+        save_boost_data(replay_obj, {
+            player_objects[actor_id]: boost_data.get(actor_id, {})
+            for actor_id in player_actors
+            if actor_id in player_objects
+        })
 
     # Generate heatmap and location JSON files.
 
-    # Put together the heatmap file.
-    replay_obj.heatmap_json_file = default_storage.save(
-        heatmap_json_filename,
-        ContentFile(json.dumps(heatmap_data, separators=(',', ':')))
-    )
+    if 'heatmap' in results:
+        # Put together the heatmap files, the binned grid and the keyed
+        # version the heatmap.js front end reads.
+        replay_obj.heatmap_grid_file = default_storage.save(
+            heatmap_grid_filename,
+            ContentFile(json.dumps(results['heatmap'].to_json(), separators=(',', ':')))
+        )
 
-    # Put together the location JSON file.
+        replay_obj.heatmap_json_file = default_storage.save(
+            heatmap_json_filename,
+            ContentFile(json.dumps(results['heatmap'].to_legacy_json(), separators=(',', ':')))
+        )
 
-    # Get rid of any boost data keys which have an empty value.
-    for actor_id, data in boost_data.copy().items():
-        if not data:
-            del boost_data[actor_id]
+    if 'frame_store' in results:
+        # Put together the location JSON file.
 
-    goal_data = [
-        {
-            'PlayerName': get_value(goal, 'PlayerName'),
-            'PlayerTeam': get_value(goal, 'PlayerTeam'),
-            'frame': get_value(goal, 'frame'),
+        # Get rid of any boost data keys which have an empty value.  The
+        # locations analyzer always runs with the boost one.
+        for actor_id, data in boost_data.copy().items():
+            if not data:
+                del boost_data[actor_id]
+
+        goal_data = [
+            {
+                'PlayerName': get_value(goal, 'PlayerName'),
+                'PlayerTeam': get_value(goal, 'PlayerTeam'),
+                'frame': get_value(goal, 'frame'),
+            }
+            for goal in get_value(header, 'Goals', [])
+        ]
+
+        # Trim down the actors to just the information we care about.
+        player_data = {
+            actor_id: {
+                'type': 'player',
+                'join': data['joined'],
+                'left': data.get('left', get_value(header, 'NumFrames')),
+                'team': data['Engine.PlayerReplicationInfo:Team']['value'],
+                'name': data['Engine.PlayerReplicationInfo:PlayerName']['value']
+            }
+            for actor_id, data in player_actors.items()
+            if 'Engine.PlayerReplicationInfo:Team' in data
         }
-        for goal in get_value(header, 'Goals', [])
-    ]
 
-    # Trim down the actors to just the information we care about.
-    player_data = {
-        actor_id: {
-            'type': 'player',
-            'join': data['joined'],
-            'left': data.get('left', get_value(header, 'NumFrames')),
-            'team': data['Engine.PlayerReplicationInfo:Team']['value'],
-            'name': data['Engine.PlayerReplicationInfo:PlayerName']['value']
+        final_data = {
+            'frame_data': results['frame_store'].to_frame_data(),
+            'goals': goal_data,
+            'boost': boost_data,
+            'seconds_mapping': results['seconds_mapping'],
+            'actors': player_data,
+            'teams': team_data,
         }
-        for actor_id, data in player_actors.items()
-        if 'Engine.PlayerReplicationInfo:Team' in data
-    }
 
-    final_data = {
-        'frame_data': location_data,
-        'goals': goal_data,
-        'boost': boost_data,
-        'seconds_mapping': seconds_mapping,
-        'actors': player_data,
-        'teams': team_data,
-    }
+        replay_obj.location_json_file = default_storage.save(
+            location_json_filename,
+            ContentFile(json.dumps(final_data, separators=(',', ':')))
+        )
 
-    replay_obj.location_json_file = default_storage.save(
-        location_json_filename,
-        ContentFile(json.dumps(final_data, separators=(',', ':')))
-    )
+    if 'shot_data' in results:
+        replay_obj.shot_data = results['shot_data']
+
+    if analyzers is None:
+        replay_obj.parser_version = parse_cache.parser_version()
+    else:
+        replay_obj.parser_version = parse_cache.update_parser_version(replay_obj.parser_version, analyzers)
 
-    replay_obj.shot_data = shot_data
     replay_obj.processed = True
     replay_obj.show_leaderboard = True
     replay_obj.crashed_heatmap_parser = False
 
     replay_obj.excitement_factor = replay_obj.calculate_excitement_factor()
     replay_obj.average_rating = replay_obj.calculate_average_rating()
+    replay_obj.scoreboard = replay_obj.build_scoreboard()
+    replay_obj.bump_content_version()
 
     replay_obj.save()
+
+    # Bring the stats of the day it was played up to date.
+    update_daily_stats(replay_obj)
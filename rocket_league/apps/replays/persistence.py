@@ -0,0 +1,159 @@
+"""
+Saving the players, goals and boost timelines pulled out of a replay.
+
+Rather than deleting a replay's rows and creating them again one at a time,
+the new rows are compared with those already stored: unchanged rows are left
+alone, changed ones updated, and anything new is inserted in bulk.  Callers
+run these inside a transaction, so a parse which fails part way through
+leaves the replay as it was.
+"""
+from .models import BoostData, BoostTimeline, Goal, Player
+
+
+def player_key(player_name, team, actor_id=0):
+    # Players from the header have no actor ID, but their name and team are
+    # unique within a replay.
+    return (player_name, team, actor_id or 0)
+
+
+def _match_by_name(existing, key):
+    """
+    Find the stored player a player from the other parser corresponds to.
+    The header's players have no actor ID, so they match the netstream's
+    player with the same name and team, and the other way round.
+    """
+    player_name, team, actor_id = key
+
+    for existing_key in list(existing):
+        if existing_key[:2] == (player_name, team) and not (actor_id and existing_key[2]):
+            return existing.pop(existing_key)
+
+
+def save_players(replay_obj, players):
+    """
+    Bring the players of a replay in line with `players`, a list of dicts of
+    Player field values.  Returns a dict of the saved players, keyed by
+    `player_key`.
+    """
+    existing = {}
+    stale = []
+
+    for player in Player.objects.filter(replay=replay_obj):
+        key = player_key(player.player_name, player.team, player.actor_id)
+
+        if key in existing:
+            stale.append(player.pk)
+        else:
+            existing[key] = player
+
+    saved = {}
+    new_players = []
+
+    for fields in players:
+        key = player_key(fields['player_name'], fields['team'], fields.get('actor_id'))
+
+        if key in saved:
+            continue
+
+        player = existing.pop(key, None)
+
+        if player is None:
+            # Keep the header's rows (and the goals pointing at them) when
+            # the netstream is parsed, setting their actor IDs in place.
+            player = _match_by_name(existing, key)
+
+        if player is None:
+            player = Player(replay=replay_obj, **fields)
+            new_players.append(player)
+        else:
+            changed = [name for name, value in fields.items() if getattr(player, name) != value]
+
+            if changed:
+                for name in changed:
+                    setattr(player, name, fields[name])
+
+                player.save(update_fields=changed)
+
+        saved[key] = player
+
+    stale.extend(player.pk for player in existing.values())
+
+    if stale:
+        Player.objects.filter(pk__in=stale).delete()
+
+    if new_players:
+        Player.objects.bulk_create(new_players)
+
+        # bulk_create doesn't set primary keys, so fetch the new rows back.
+        for player in Player.objects.filter(replay=replay_obj).exclude(pk__in=[
+            player.pk for player in saved.values() if player.pk
+        ]):
+            saved[player_key(player.player_name, player.team, player.actor_id)] = player
+
+    return saved
+
+
+def save_goals(replay_obj, goals):
+    """
+    Bring the goals of a replay in line with `goals`, a list of dicts with
+    the number, frame and player of each goal.
+    """
+    existing = {}
+    stale = []
+
+    for goal in Goal.objects.filter(replay=replay_obj):
+        if goal.number in existing:
+            stale.append(goal.pk)
+        else:
+            existing[goal.number] = goal
+
+    new_goals = []
+
+    for fields in goals:
+        goal = existing.pop(fields['number'], None)
+
+        if goal is None:
+            new_goals.append(Goal(replay=replay_obj, **fields))
+        elif goal.frame != fields['frame'] or goal.player_id != fields['player'].pk:
+            goal.frame = fields['frame']
+            goal.player = fields['player']
+            goal.save(update_fields=['frame', 'player'])
+
+    stale.extend(goal.pk for goal in existing.values())
+
+    if stale:
+        Goal.objects.filter(pk__in=stale).delete()
+
+    Goal.objects.bulk_create(new_goals)
+
+
+def save_boost_data(replay_obj, boost_data):
+    """
+    Replace the boost timelines of a replay with `boost_data`, a dict of
+    Player -> {frame: boost amount}.  Unchanged timelines aren't rewritten.
+    """
+    existing = {
+        timeline.player_id: timeline
+        for timeline in BoostTimeline.objects.filter(replay=replay_obj)
+    }
+
+    new_timelines = []
+
+    for player, values in boost_data.items():
+        timeline = BoostTimeline.from_values(replay_obj, player, values)
+        current = existing.get(player.pk)
+
+        if current is not None and (bytes(current.frame_deltas), bytes(current.values)) == (timeline.frame_deltas, timeline.values):
+            del existing[player.pk]
+            continue
+
+        new_timelines.append(timeline)
+
+    # Whatever is left over is either stale or about to be replaced.
+    if existing:
+        BoostTimeline.objects.filter(pk__in=[timeline.pk for timeline in existing.values()]).delete()
+
+    BoostTimeline.objects.bulk_create(new_timelines)
+
+    # Any rows in the old format are superseded.
+    BoostData.objects.filter(replay=replay_obj).delete()
@@ -0,0 +1,445 @@
+"""
+Season statistics for each player, kept in PlayerSeasonStats.
+
+Rather than running a long series of queries each time a profile is viewed,
+the stats of everyone in a replay are brought up to date once it's been
+processed.  What the replay added to each player's stats is saved with it
+(Replay.season_stats), so reprocessing it takes the old numbers back out
+before adding the new ones rather than counting it twice.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .models import (PLATFORMS_MAPPINGS, Goal, Player, PlayerSeasonStats,
+                     Replay, get_default_season)
+
+# Stats which are added up across a player's replays.
+COUNTERS = [
+    'appearances', 'winning_goals', 'last_minute_goals',
+    'overtime_triggering_goals', 'overtime_triggering_and_winning_goals',
+    'overtime_trigger_and_team_win', 'total_goals', 'total_assists',
+    'total_saves',
+]
+
+# The per-game maximums, and the player stat each is the maximum of.
+MAXIMUMS = {
+    'highest_score': 'score',
+    'most_goals': 'goals',
+    'most_shots': 'shots',
+    'most_assists': 'assists',
+    'most_saves': 'saves',
+}
+
+PLAYER_FIELDS = [
+    'replay_id', 'platform', 'online_id', 'bot', 'team', 'score', 'goals',
+    'shots', 'assists', 'saves', 'replay__show_leaderboard',
+    'replay__team_sizes', 'replay__num_frames', 'replay__record_fps',
+    'replay__team_0_score', 'replay__team_1_score', 'replay__timestamp',
+]
+
+GOAL_FIELDS = [
+    'replay_id', 'number', 'frame', 'player__team', 'player__platform',
+    'player__online_id',
+]
+
+
+def platform_values(platform):
+    """
+    The values a player's platform may be stored as for one of the PLATFORM_
+    constants.
+    """
+    return sorted(set(
+        [str(platform)] + [
+            key for key, value in PLATFORMS_MAPPINGS.items()
+            if isinstance(key, str) and value == platform
+        ]
+    ))
+
+
+def normalise_platform(platform):
+    value = PLATFORMS_MAPPINGS.get(platform)
+
+    if isinstance(value, int):
+        return value
+
+    try:
+        return int(platform)
+    except (TypeError, ValueError):
+        return None
+
+
+def replay_stats(players, goals):
+    """
+    What one replay adds to a player's stats, from their rows of the replay
+    (split screen players appear more than once) and the goals they scored.
+    """
+    replay = players[0]
+
+    # The maximums include replays which aren't on the leaderboard.
+    stats = {
+        field: max([player[stat] for player in players if player[stat] is not None] or [None])
+        for field, stat in MAXIMUMS.items()
+    }
+
+    stats.update({counter: 0 for counter in COUNTERS})
+    stats['team_sizes'] = None
+    stats['won_overtime'] = False
+
+    if not replay['replay__show_leaderboard']:
+        return stats
+
+    stats['appearances'] = 1
+    stats['team_sizes'] = replay['replay__team_sizes']
+
+    for stat in ['goals', 'assists', 'saves']:
+        stats['total_' + stat] = sum(player[stat] or 0 for player in players)
+
+    team_0_score = replay['replay__team_0_score'] or 0
+    team_1_score = replay['replay__team_1_score'] or 0
+    num_goals = team_0_score + team_1_score
+    fps = replay['replay__record_fps']
+    num_frames = replay['replay__num_frames']
+
+    numbers = Counter(goal['number'] for goal in goals)
+
+    stats['winning_goals'] = numbers[num_goals]
+
+    # The rest need to know how long the match was.
+    if num_frames is None or fps is None:
+        return stats
+
+    # Last minute goals (literally, goals scored within the last minute of
+    # the game).
+    stats['last_minute_goals'] = len([
+        goal for goal in goals
+        if goal['frame'] is not None and goal['frame'] >= num_frames - 60 * fps
+    ])
+
+    if num_frames <= 60 * 5 * fps or num_goals < 2:
+        return stats
+
+    # The most recent game which went into overtime and the player won is
+    # their biggest win.
+    stats['won_overtime'] = (
+        replay['team'] == 0 and team_0_score > team_1_score or
+        replay['team'] == 1 and team_1_score > team_0_score
+    )
+
+    # Goals which equalised the game and forced it into overtime.
+    if numbers[num_goals - 1] == 1:
+        stats['overtime_triggering_goals'] = 1
+
+        team = [goal for goal in goals if goal['number'] == num_goals - 1][0]['player__team']
+
+        if (
+            team == 0 and team_0_score > team_1_score or
+            team == 1 and team_1_score > team_0_score
+        ):
+            stats['overtime_trigger_and_team_win'] = 1
+
+        # Did they also score the winning goal?
+        if numbers[num_goals] == 1:
+            stats['overtime_triggering_and_winning_goals'] = 1
+
+    return stats
+
+
+def recency(timestamp, replay_id):
+    """
+    A sort key for the replays by when they were played, as the replay list
+    orders them.
+    """
+    return (timestamp is not None, timestamp, replay_id)
+
+
+def preferences(stats):
+    """
+    The player's preferred match size and role from their totals.
+    """
+    # Which match size does this player appear most in?
+    sizes = stats['match_sizes']
+    stats['preferred_match_size'] = None
+
+    if sizes:
+        stats['preferred_match_size'] = int(max(
+            sorted(sizes, key=int),
+            key=lambda size: sizes[size],
+        ))
+
+    # What's this player's prefered role within a team?
+    stats['preferred_role'] = None
+
+    if any(stats['total_' + stat] for stat in ['goals', 'assists', 'saves']):
+        stats['preferred_role'] = {
+            'goals': 'Goalscorer',
+            'assists': 'Assister',
+            'saves': 'Goalkeeper',
+        }[max(['goals', 'assists', 'saves'], key=lambda stat: stats['total_' + stat])]
+
+    return stats
+
+
+def calculate_player_stats(platform, online_id, season_id):
+    """
+    Work out a player's stats for a season from all of their replays,
+    returning a dict of PlayerSeasonStats field values.
+    """
+    players = defaultdict(list)
+
+    for player in Player.objects.filter(
+        platform__in=platform_values(platform),
+        online_id=online_id,
+        replay__season_id=season_id,
+    ).values(*PLAYER_FIELDS):
+        players[player['replay_id']].append(player)
+
+    goals = defaultdict(list)
+
+    for goal in Goal.objects.filter(
+        player__platform__in=platform_values(platform),
+        player__online_id=online_id,
+        replay__season_id=season_id,
+        replay__show_leaderboard=True,
+    ).values(*GOAL_FIELDS):
+        goals[goal['replay_id']].append(goal)
+
+    stats = {field: None for field in MAXIMUMS}
+    stats.update({counter: 0 for counter in COUNTERS})
+    stats['match_sizes'] = {}
+    stats['biggest_win'] = None
+
+    biggest_win = None
+
+    for replay_id, replay_players in sorted(players.items()):
+        counted = replay_stats(replay_players, goals[replay_id])
+
+        for counter in COUNTERS:
+            stats[counter] += counted[counter]
+
+        for field in MAXIMUMS:
+            if counted[field] is not None and (stats[field] is None or counted[field] > stats[field]):
+                stats[field] = counted[field]
+
+        if counted['team_sizes'] is not None:
+            size = str(counted['team_sizes'])
+            stats['match_sizes'][size] = stats['match_sizes'].get(size, 0) + 1
+
+        if counted['won_overtime']:
+            key = recency(replay_players[0]['replay__timestamp'], replay_id)
+
+            if biggest_win is None or key > biggest_win:
+                biggest_win = key
+                stats['biggest_win'] = replay_id
+
+    return preferences(stats)
+
+
+def refresh_player_stats(platform, online_id, season_id):
+    stats = calculate_player_stats(platform, online_id, season_id)
+    stats['biggest_win_id'] = stats.pop('biggest_win')
+
+    obj, _ = PlayerSeasonStats.objects.update_or_create(
+        platform=platform,
+        online_id=online_id,
+        season_id=season_id,
+        defaults=stats,
+    )
+
+    return obj
+
+
+def player_keys(players):
+    """
+    The distinct (platform, online ID) pairs of the given players, leaving
+    out bots and players without an online ID.
+    """
+    keys = set()
+
+    for player in players:
+        if player.bot or not player.online_id:
+            continue
+
+        platform = normalise_platform(player.platform)
+
+        if platform is not None:
+            keys.add((platform, player.online_id))
+
+    return keys
+
+
+def counted_stats(replay_obj):
+    """
+    What a replay adds to its players' season stats, in the form it's saved
+    in Replay.season_stats.  Replays without a season don't count.
+    """
+    if replay_obj.season_id is None:
+        return {}
+
+    players = defaultdict(list)
+
+    for player in replay_obj.player_set.values(*PLAYER_FIELDS):
+        platform = normalise_platform(player['platform'])
+
+        if player['bot'] or not player['online_id'] or platform is None:
+            continue
+
+        players['{}:{}'.format(platform, player['online_id'])].append(player)
+
+    goals = defaultdict(list)
+
+    if replay_obj.show_leaderboard:
+        for goal in replay_obj.goal_set.values(*GOAL_FIELDS):
+            platform = normalise_platform(goal['player__platform'])
+            goals['{}:{}'.format(platform, goal['player__online_id'])].append(goal)
+
+    return {
+        'season': replay_obj.season_id,
+        'players': {
+            key: replay_stats(key_players, goals[key])
+            for key, key_players in players.items()
+        },
+    }
+
+
+def _apply(platform, online_id, season_id, replay_obj, removed, added):
+    """
+    Take a replay's old numbers out of a player's stats and add its new ones,
+    or work the player out from scratch if that isn't possible.
+    """
+    try:
+        stats = PlayerSeasonStats.objects.select_for_update().get(
+            platform=platform,
+            online_id=online_id,
+            season_id=season_id,
+        )
+    except PlayerSeasonStats.DoesNotExist:
+        # None of the player's replays have been counted yet.
+        refresh_player_stats(platform, online_id, season_id)
+        return
+
+    # Rows from before the totals were kept can only be worked out again.
+    if stats.total_goals is None:
+        refresh_player_stats(platform, online_id, season_id)
+        return
+
+    # A maximum, or the biggest win, can't be taken back out if this replay
+    # held it.
+    for field in MAXIMUMS:
+        current = getattr(stats, field)
+
+        if (
+            removed and removed[field] is not None and current is not None and
+            removed[field] >= current and (not added or added[field] is None or added[field] < removed[field])
+        ):
+            refresh_player_stats(platform, online_id, season_id)
+            return
+
+    if (
+        removed and removed['won_overtime'] and stats.biggest_win_id == replay_obj.pk and
+        not (added and added['won_overtime'])
+    ):
+        refresh_player_stats(platform, online_id, season_id)
+        return
+
+    match_sizes = dict(stats.match_sizes or {})
+
+    for sign, counted in [(-1, removed), (1, added)]:
+        if not counted:
+            continue
+
+        for counter in COUNTERS:
+            setattr(stats, counter, getattr(stats, counter) + sign * counted[counter])
+
+        if counted['team_sizes'] is not None:
+            size = str(counted['team_sizes'])
+            match_sizes[size] = match_sizes.get(size, 0) + sign
+
+            if not match_sizes[size]:
+                del match_sizes[size]
+
+    if added:
+        for field in MAXIMUMS:
+            current = getattr(stats, field)
+
+            if added[field] is not None and (current is None or added[field] > current):
+                setattr(stats, field, added[field])
+
+        if added['won_overtime'] and stats.biggest_win_id != replay_obj.pk:
+            biggest_win = Replay.objects.filter(pk=stats.biggest_win_id).values_list('timestamp', 'pk').first()
+
+            if biggest_win is None or recency(replay_obj.timestamp, replay_obj.pk) > recency(*biggest_win):
+                stats.biggest_win_id = replay_obj.pk
+
+    stats.match_sizes = match_sizes
+    preferred = preferences({
+        'match_sizes': match_sizes,
+        'total_goals': stats.total_goals,
+        'total_assists': stats.total_assists,
+        'total_saves': stats.total_saves,
+    })
+    stats.preferred_match_size = preferred['preferred_match_size']
+    stats.preferred_role = preferred['preferred_role']
+    stats.save()
+
+
+def update_player_stats(replay_obj):
+    """
+    Bring the season stats of everyone in a replay up to date once it's been
+    processed, by taking out what it added last time and adding what it adds
+    now.  This runs after the parse has been committed, so it doesn't hold
+    the parse's transaction open.
+    """
+    counted = counted_stats(replay_obj)
+
+    with transaction.atomic():
+        previous = Replay.objects.select_for_update().values_list(
+            'season_stats', flat=True,
+        ).get(pk=replay_obj.pk)
+
+        if previous == counted:
+            return
+
+        changes = defaultdict(lambda: [None, None])
+
+        if previous:
+            for key, removed in previous['players'].items():
+                changes[key, previous['season']][0] = removed
+
+        for key, added in counted.get('players', {}).items():
+            changes[key, counted['season']][1] = added
+
+        for (key, season_id), (removed, added) in sorted(changes.items()):
+            platform, online_id = key.split(':', 1)
+
+            # Replays counted before their numbers were saved can't be taken
+            # back out, so their players are worked out again.
+            if previous is None:
+                refresh_player_stats(int(platform), online_id, season_id)
+            elif removed != added:
+                _apply(int(platform), online_id, season_id, replay_obj, removed, added)
+
+        Replay.objects.filter(pk=replay_obj.pk).update(season_stats=counted)
+
+
+def get_player_stats(platform, online_id, season_id=None):
+    """
+    A player's stats for a season, defaulting to the current one.  They're
+    worked out the first time they're asked for if none of the player's
+    replays have been processed since the table was added.
+    """
+    if season_id is None:
+        season_id = get_default_season()
+
+    # Outside of a season there's nothing to count.
+    if season_id is None:
+        return PlayerSeasonStats(platform=platform, online_id=online_id)
+
+    try:
+        return PlayerSeasonStats.objects.select_related('biggest_win').get(
+            platform=platform,
+            online_id=online_id,
+            season_id=season_id,
+        )
+    except PlayerSeasonStats.DoesNotExist:
+        return refresh_player_stats(platform, online_id, season_id)
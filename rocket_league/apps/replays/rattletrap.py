@@ -0,0 +1,243 @@
+"""
+Incremental access to the JSON produced by Rattletrap.
+
+Rattletrap writes the whole replay as a single JSON document, most of which is
+the list of network frames.  Rather than loading that document in one go, the
+decoder's output is read as a stream and the header and frames are handed out
+one at a time, so only a single frame needs to be held in memory at once.
+"""
+import codecs
+import json
+import re
+import subprocess
+from sys import platform
+
+from django.conf import settings
+
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JSONStream(object):
+
+    """
+    A minimal pull parser over a file-like object containing JSON.
+
+    Containers can be walked with `iter_object` and `iter_array`, while any
+    other value (including containers we don't care about the insides of) is
+    decoded in full with `value`.
+    """
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+
+        data = self.stream.read(size or self.chunk_size)
+
+        if not data:
+            self.eof = True
+
+        # Drop everything which has already been consumed.
+        self.buffer = self.buffer[self.pos:] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+
+        return not self.eof
+
+    def peek(self):
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+
+            if not self._fill():
+                raise ValueError('Unexpected end of JSON stream.')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected {!r} at position {} of the JSON stream.'.format(char, self.pos))
+
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        size = self.chunk_size
+
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+
+                # A number running up to the end of the buffer may have been
+                # cut short, so make sure there's something after it.
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+
+            # The value continues past the end of the buffer.  Grow the reads
+            # so large values don't get re-scanned once per chunk.
+            self._fill(size)
+            size *= 2
+
+    def iter_object(self):
+        """
+        Yield each key of the object at the current position.  The caller is
+        responsible for consuming the value before asking for the next key.
+        """
+        self.expect('{')
+
+        if self.peek() == '}':
+            self.pos += 1
+            return
+
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+
+            char = self.peek()
+            self.pos += 1
+
+            if char == '}':
+                return
+            elif char != ',':
+                raise ValueError('Malformed object at position {} of the JSON stream.'.format(self.pos))
+
+    def iter_array(self):
+        """
+        Yield once for each item of the array at the current position.  The
+        caller is responsible for consuming the item.
+        """
+        self.expect('[')
+
+        if self.peek() == ']':
+            self.pos += 1
+            return
+
+        while True:
+            yield
+
+            char = self.peek()
+            self.pos += 1
+
+            if char == ']':
+                return
+            elif char != ',':
+                raise ValueError('Malformed array at position {} of the JSON stream.'.format(self.pos))
+
+
+def iter_sections(stream):
+    """
+    Walk a Rattletrap document, yielding ('header', value) and ('frame', value)
+    pairs in the order they appear.  Everything else is skipped.
+    """
+    for key in stream.iter_object():
+        if key == 'header':
+            yield 'header', stream.value()
+        elif key == 'content':
+            for content_key in stream.iter_object():
+                if content_key != 'body':
+                    stream.value()
+                    continue
+
+                for body_key in stream.iter_object():
+                    if body_key != 'frames':
+                        stream.value()
+                        continue
+
+                    for _ in stream.iter_array():
+                        yield 'frame', stream.value()
+        else:
+            stream.value()
+
+
+def iter_replay_stream(stream):
+    """
+    Yield the header section of a Rattletrap document followed by each of its
+    frames.  The frame walk needs the header first, so any frames which appear
+    before it are held back until it arrives.
+    """
+    header = None
+    pending = []
+
+    for section, value in iter_sections(JSONStream(stream)):
+        if header is not None:
+            yield value
+        elif section == 'header':
+            header = value
+            yield header
+
+            for frame in pending:
+                yield frame
+
+            pending = None
+        else:
+            pending.append(value)
+
+    if header is None:
+        raise ValueError('Replay JSON did not contain a header.')
+
+
+def rattletrap_binary():
+    if settings.DEBUG and platform == 'darwin':
+        return 'rattletrap-binaries/rattletrap-*-osx'
+
+    return 'rattletrap-binaries/rattletrap-*-linux'
+
+
+def rattletrap_command(replay_obj):
+    if settings.DEBUG and platform == 'darwin':
+        location = replay_obj.file.url
+    else:
+        location = replay_obj.file.path if settings.DEBUG else replay_obj.file.url
+
+    return '{} -i {}'.format(rattletrap_binary(), location)
+
+
+def iter_command(command):
+    """
+    Run a Rattletrap command, yielding the header section and then each
+    network frame as it is decoded.
+
+    Raises `subprocess.CalledProcessError` if Rattletrap fails, which may only
+    happen after some of the frames have been yielded.
+    """
+    process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE)
+
+    def close():
+        process.stdout.close()
+        return process.wait()
+
+    try:
+        for value in iter_replay_stream(process.stdout):
+            yield value
+    except ValueError:
+        # Rattletrap giving up part way through leaves us with truncated JSON,
+        # so report it as the decoder failure it really is.
+        if close():
+            raise subprocess.CalledProcessError(process.returncode, command)
+        raise
+    finally:
+        close()
+
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def iter_replay(replay_obj):
+    """
+    Decode a replay file with Rattletrap, see `iter_command`.
+    """
+    return iter_command(rattletrap_command(replay_obj))
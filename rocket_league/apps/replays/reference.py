@@ -0,0 +1,131 @@
+"""
+In-process copies of the small reference tables: seasons, maps and
+components.
+
+They are read for nearly every replay and page but hardly ever change, so
+each process loads them once.  Saving or deleting a row clears the copy in
+that process and bumps a generation number in the shared cache (see
+signals.py), which the other web and worker processes check every few
+seconds before reloading.
+"""
+import time
+from bisect import bisect_right
+
+from django.core.cache import cache
+
+from .models import Component, Map, Season
+
+# How often, in seconds, each process checks whether another has changed
+# the tables.
+CHECK_INTERVAL = 10
+
+
+class ReferenceCache(object):
+
+    def __init__(self, name, load):
+        self.name = name
+        self.load = load
+        self.cache_key = 'reference_data_generation:{}'.format(name)
+        self.clear()
+
+    def clear(self):
+        self.data = None
+        self.generation = None
+        self.checked = 0
+
+    def get(self):
+        if self.data is not None and time.time() - self.checked > CHECK_INTERVAL:
+            self.checked = time.time()
+
+            if cache.get(self.cache_key) != self.generation:
+                self.data = None
+
+        if self.data is None:
+            # Read the generation first, so a change made while loading
+            # is picked up on the next check.
+            self.generation = cache.get(self.cache_key)
+            self.checked = time.time()
+            self.data = self.load()
+
+        return self.data
+
+    def invalidate(self):
+        self.clear()
+
+        if not cache.add(self.cache_key, 1, None):
+            try:
+                cache.incr(self.cache_key)
+            except ValueError:
+                # Evicted since it was added.
+                cache.set(self.cache_key, 1, None)
+
+
+def _load_seasons():
+    # Sorted by start date for bisecting.
+    seasons = list(Season.objects.order_by('start_date').values_list('start_date', 'pk'))
+    return [start_date for start_date, _ in seasons], [pk for _, pk in seasons]
+
+
+def _load_maps():
+    maps = {}
+
+    # Slugs aren't unique, the oldest map wins.
+    for map_obj in Map.objects.order_by('-pk'):
+        maps[map_obj.slug] = map_obj
+
+    return maps
+
+
+def _load_components():
+    components = {}
+
+    for component in Component.objects.order_by('-pk'):
+        components[component.type, component.internal_id] = component
+
+    return components
+
+
+seasons = ReferenceCache('seasons', _load_seasons)
+maps = ReferenceCache('maps', _load_maps)
+components = ReferenceCache('components', _load_components)
+
+CACHES = {
+    Season: seasons,
+    Map: maps,
+    Component: components,
+}
+
+
+def season_for(timestamp):
+    """
+    The ID of the season which was running at `timestamp`, or None if it's
+    before the first one.
+    """
+    start_dates, season_ids = seasons.get()
+    index = bisect_right(start_dates, timestamp)
+
+    if index == 0:
+        return None
+
+    return season_ids[index - 1]
+
+
+def get_map(slug):
+    try:
+        return maps.get()[slug]
+    except KeyError:
+        # Another process may have just added it.
+        return Map.objects.get_or_create(slug=slug)[0]
+
+
+def get_component(component_type, internal_id, name='Unknown'):
+    try:
+        return components.get()[component_type, internal_id]
+    except KeyError:
+        return Component.objects.get_or_create(
+            type=component_type,
+            internal_id=internal_id,
+            defaults={
+                'name': name,
+            }
+        )[0]
@@ -1,9 +1,62 @@
+from django.db.models import Prefetch
 from rest_framework.serializers import (HyperlinkedModelSerializer,
+                                        ListSerializer, PrimaryKeyRelatedField,
                                         ReadOnlyField)
 
 from .models import Component, Goal, Map, Player, Replay, ReplayPack, Season
 
 
+def query_list(request, param):
+    """
+    The comma separated values of a query parameter, or None if it wasn't
+    given.
+    """
+    if request is None or param not in request.query_params:
+        return None
+
+    return [value for value in request.query_params[param].split(',') if value]
+
+
+class SparseFieldsMixin(object):
+    """
+    Lets API callers choose the fields they get back with `?fields=id,title`
+    and which relations are nested with `?expand=map,season`.  Relations
+    in `Meta.expandable` which aren't expanded are returned as primary keys.
+    Without `?expand=` all of them are nested, as they always were.
+
+    Only applies to the top level serializer, nested ones are unaffected.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SparseFieldsMixin, self).__init__(*args, **kwargs)
+
+        request = self.context.get('request')
+        fields = query_list(request, 'fields')
+        expand = query_list(request, 'expand')
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+        if expand is not None:
+            for name in getattr(self.Meta, 'expandable', []):
+                if name in self.fields and name not in expand:
+                    self.fields[name] = PrimaryKeyRelatedField(
+                        many=isinstance(self.fields[name], ListSerializer),
+                        read_only=True,
+                    )
+
+    @classmethod
+    def wanted(cls, request, name):
+        fields = query_list(request, 'fields')
+        return fields is None or name in fields
+
+    @classmethod
+    def expanded(cls, request, name):
+        expand = query_list(request, 'expand')
+        return cls.wanted(request, name) and (expand is None or name in expand)
+
+
 class GoalSerializer(HyperlinkedModelSerializer):
 
     goal_time = ReadOnlyField()
@@ -43,7 +96,7 @@ class ComponentSerializer(HyperlinkedModelSerializer):
         model = Component
 
 
-class ReplaySerializer(HyperlinkedModelSerializer):
+class ReplaySerializer(SparseFieldsMixin, HyperlinkedModelSerializer):
 
     id = ReadOnlyField()
 
@@ -73,9 +126,32 @@ class ReplaySerializer(HyperlinkedModelSerializer):
         model = Replay
         exclude = ['user', 'crashed_heatmap_parser']
         depth = 1
+        expandable = ['goal_set', 'player_set', 'map', 'season']
+
+    @classmethod
+    def setup_queryset(cls, queryset, request=None):
+        """
+        Load the relations the response needs along with the replays, rather
+        than a few queries for each one.
+        """
+        related = [name for name in ['map', 'season'] if cls.expanded(request, name)]
+
+        if related:
+            queryset = queryset.select_related(*related)
+
+        for name, model in [('goal_set', Goal), ('player_set', Player)]:
+            if cls.expanded(request, name):
+                queryset = queryset.prefetch_related(name)
+            elif cls.wanted(request, name):
+                queryset = queryset.prefetch_related(Prefetch(
+                    name,
+                    queryset=model.objects.only('id', 'replay'),
+                ))
+
+        return queryset
 
 
-class ReplayPackSerializer(HyperlinkedModelSerializer):
+class ReplayPackSerializer(SparseFieldsMixin, HyperlinkedModelSerializer):
 
     id = ReadOnlyField()
 
@@ -89,6 +165,23 @@ class ReplayPackSerializer(HyperlinkedModelSerializer):
     class Meta:
         model = ReplayPack
         exclude = ['user']
+        expandable = ['replays']
+
+    @classmethod
+    def setup_queryset(cls, queryset, request=None):
+        if cls.expanded(request, 'replays'):
+            # The replays inside a pack are always nested in full.
+            queryset = queryset.prefetch_related(Prefetch(
+                'replays',
+                queryset=ReplaySerializer.setup_queryset(Replay.objects.all()),
+            ))
+        elif cls.wanted(request, 'replays'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'replays',
+                queryset=Replay.objects.only('id'),
+            ))
+
+        return queryset
 
 
 class ReplayCreateSerializer(HyperlinkedModelSerializer):
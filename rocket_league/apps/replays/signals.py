@@ -1,10 +1,29 @@
-from django.db.models.signals import pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch.dispatcher import receiver
+from social.apps.django_app.default.models import UserSocialAuth
 
-from .models import ReplayPack
+from .daily_stats import add_steam_logins
+from .models import Component, Map, ReplayPack, Season
+from .reference import CACHES
 
 
 @receiver(pre_delete, sender=ReplayPack)
 def replaypack_delete(sender, instance, **kwargs):
     # Pass false so FileField doesn't save the model.
     instance.file.delete(False)
+
+
+@receiver(post_save, sender=Season)
+@receiver(post_delete, sender=Season)
+@receiver(post_save, sender=Map)
+@receiver(post_delete, sender=Map)
+@receiver(post_save, sender=Component)
+@receiver(post_delete, sender=Component)
+def reference_data_changed(sender, **kwargs):
+    CACHES[sender].invalidate()
+
+
+@receiver(post_save, sender=UserSocialAuth)
+def steam_login_created(sender, instance, created, **kwargs):
+    if created and instance.provider == 'steam':
+        add_steam_logins([instance.uid])
@@ -32,13 +32,13 @@ def report_to_slack(replay):
 
 
 @app.task(bind=True, name='rocket_league.apps.replays.tasks.process_netstream', ignore_result=False, track_started=True)
-def process_netstream(self, replay_pk):
+def process_netstream(self, replay_pk, analyzers=None):
     replay = Replay.objects.get(pk=replay_pk)
 
     try:
         replay.processed = False
         replay.crashed_heatmap_parser = False
-        replay.save(parse_netstream=True)
+        replay.save(parse_netstream=True, analyzers=analyzers)
 
         replay = Replay.objects.get(pk=replay_pk)
 
@@ -47,7 +47,7 @@ def process_netstream(self, replay_pk):
         if not replay.location_json_file:
             replay_processed = False
 
-        if replay.boostdata_set.count() == 0:
+        if not replay.has_boost_data:
             replay_processed = False
 
         if not replay_processed:
@@ -0,0 +1,50 @@
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from ..management.commands.benchmark_api import seed_replays
+from ..models import Replay
+
+
+class TestReplayAPI(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_list_queries_dont_grow(self):
+        seed_replays(2)
+        few, _ = self.count_queries(reverse('replay-list'))
+
+        seed_replays(5, seed=1)
+        many, data = self.count_queries(reverse('replay-list'))
+
+        self.assertEqual(data['count'], 7)
+        self.assertEqual(few, many)
+
+        # The count, the replays with their map and season, the goals and
+        # the players.
+        with self.assertNumQueries(4):
+            self.client.get(reverse('replay-list'))
+
+    def test_sparse_fields(self):
+        seed_replays(1)
+        replay = Replay.objects.get()
+
+        _, data = self.count_queries('{}?fields=id,map,goal_set&expand=map'.format(reverse('replay-list')))
+        result = data['results'][0]
+
+        self.assertEqual(set(result), {'id', 'map', 'goal_set'})
+        self.assertEqual(result['goal_set'], list(replay.goal_set.values_list('pk', flat=True)))
+
+        # Only the count and the replays with their goal IDs.
+        with self.assertNumQueries(3):
+            self.client.get('{}?fields=id,goal_set&expand='.format(reverse('replay-list')))
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+
+from django.test import SimpleTestCase
+
+from ..boost import boost_chart, boost_summary, downsample_chart
+from ..management.commands.benchmark_boost_chart import (legacy_boost_chart,
+                                                         simulate_boost)
+from ..models import BoostTimeline
+
+
+class TestBoostTimeline(SimpleTestCase):
+
+    def test_round_trip(self):
+        frames = [0, 12, 13, 400, 70000]
+        values = [85, 60, 255, 0, 85]
+
+        frame_deltas, boost_values = BoostTimeline.encode(frames, values)
+        timeline = BoostTimeline(frame_deltas=frame_deltas, values=boost_values)
+
+        self.assertEqual(len(frame_deltas), len(frames) * 4)
+        self.assertEqual(len(boost_values), len(values))
+        self.assertEqual(timeline.frames_array.tolist(), frames)
+        self.assertEqual(timeline.values_array.tolist(), values)
+
+    def test_empty(self):
+        frame_deltas, boost_values = BoostTimeline.encode([], [])
+        timeline = BoostTimeline(frame_deltas=frame_deltas, values=boost_values)
+
+        self.assertEqual(timeline.frames_array.tolist(), [])
+        self.assertEqual(timeline.values_array.tolist(), [])
+
+
+class TestBoostChart(SimpleTestCase):
+
+    def test_matches_legacy_tag(self):
+        for seed in range(10):
+            players, goal_frames, num_frames = simulate_boost(seed, num_frames=1500, team_size=1 + seed % 3)
+
+            self.assertEqual(
+                boost_chart(players, goal_frames, num_frames),
+                legacy_boost_chart(players, goal_frames, num_frames),
+                'Seed {}'.format(seed),
+            )
+
+    def test_shared_actor_id(self):
+        players, goal_frames, num_frames = simulate_boost(0, num_frames=600, team_size=1)
+        players.append((players[0][0], 1, 'Spectator', [], []))
+
+        self.assertEqual(
+            boost_chart(players, goal_frames, num_frames),
+            legacy_boost_chart(players, goal_frames, num_frames),
+        )
+
+
+class TestBoostSummary(SimpleTestCase):
+
+    def test_summary(self):
+        # Use some, a small pickup, a large pickup, empty, then the kickoff
+        # reset.
+        self.assertEqual(boost_summary([60, 89, 255, 0, 85]), {
+            'small_pickups': 1,
+            'large_pickups': 1,
+            'boost_consumption': 110,
+            'unknown_pickups': 0,
+        })
+
+
+class TestDownsampleChart(SimpleTestCase):
+
+    def test_downsample(self):
+        players, goal_frames, num_frames = simulate_boost(1, num_frames=20000)
+        data = boost_chart(players, goal_frames, num_frames)
+        reduced = downsample_chart(data, goal_frames, points=500)
+
+        for series in ['boost_values', 'team_boost_values', 'boost_consumption', 'team_boost_consumption']:
+            for key, values in reduced[series].items():
+                self.assertLessEqual(len(values), 500)
+
+                # The points which are left are the real values.
+                for frame, value in values.items():
+                    self.assertEqual(data[series][key][frame], value)
+
+                # As are the values at each goal.
+                for frame in goal_frames:
+                    if frame in data[series][key]:
+                        self.assertEqual(values[frame], data[series][key][frame])
+
+        self.assertEqual(reduced['boost_distribution'], data['boost_distribution'])
+
+    def test_keeps_large_drops(self):
+        # A little boost used and picked up on every frame, and a demolition
+        # which empties the tank halfway through.
+        series = OrderedDict((frame, 200 + frame % 7) for frame in range(5000))
+        series[2500] = 0
+        series[2501] = 0
+        data = {
+            'boost_values': {1: series},
+            'team_boost_values': {0: series},
+            'boost_consumption': {},
+            'team_boost_consumption': {},
+        }
+
+        reduced = downsample_chart(data, [], points=100)
+
+        for values in [reduced['boost_values'][1], reduced['team_boost_values'][0]]:
+            self.assertLessEqual(len(values), 100)
+            self.assertEqual(values[2499], series[2499])
+            self.assertEqual(values[2500], 0)
@@ -0,0 +1,102 @@
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.urlresolvers import reverse
+from django.test import RequestFactory, TestCase
+from rest_framework.test import APIClient
+
+from ...site.entitlements import get_entitlements
+from ..conditional import get_replay, page_etag
+from ..models import PRIVACY_PRIVATE, PRIVACY_PUBLIC, Replay
+from ..templatetags.replays import replay_fragment_key
+
+
+class TestReplayAPIConditional(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.replay = Replay.objects.create(processed=True)
+        self.replay.bump_content_version()
+        self.replay.save()
+
+        self.url = reverse('replay-detail', kwargs={'pk': self.replay.pk})
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+
+        # Only the replay's version is looked up.
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.replay.bump_content_version()
+        self.replay.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Different fields are a different response.
+        response = self.client.get('{}?fields=id'.format(self.url), HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(response.status_code, 200)
+
+
+class TestReplayPageConditional(TestCase):
+
+    def test_private(self):
+        replay = Replay.objects.create(processed=True, privacy=PRIVACY_PUBLIC)
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+
+        self.assertIsNotNone(page_etag(request, get_replay(request, pk=replay.pk)))
+
+        # Someone who can't see the replay mustn't get a 304 for it.
+        replay.privacy = PRIVACY_PRIVATE
+        replay.save()
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+
+        self.assertIsNone(page_etag(request, get_replay(request, pk=replay.pk)))
+
+    def test_one_query(self):
+        replay = Replay.objects.create(processed=True, privacy=PRIVACY_PUBLIC)
+        get_entitlements()
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+
+        # Only the replay is looked up, not its players or the messages.
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(page_etag(request, get_replay(request, pk=replay.pk)))
+
+        # A page with a flash message on it has to be rendered.
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.COOKIES[CookieStorage.cookie_name] = 'message'
+
+        self.assertIsNone(page_etag(request, get_replay(request, pk=replay.pk)))
+
+
+class TestReplayFragmentKey(TestCase):
+
+    def test_changes_with_version(self):
+        replay = Replay.objects.create(processed=True)
+        context = {'replay': replay, 'user': AnonymousUser()}
+        key = replay_fragment_key(context)
+
+        self.assertEqual(replay_fragment_key(context), key)
+
+        replay.bump_content_version()
+        replay.save()
+
+        self.assertNotEqual(replay_fragment_key(context), key)
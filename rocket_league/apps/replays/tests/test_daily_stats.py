@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from ..daily_stats import estimate, load_sketch, merge, sketch, summarise
+
+
+class TestSketch(SimpleTestCase):
+
+    def test_small_counts(self):
+        self.assertEqual(estimate(sketch([])), 0)
+        self.assertEqual(estimate(sketch(['Player'] * 10)), 1)
+        self.assertEqual(estimate(sketch(['Player {}'.format(index) for index in range(5)])), 5)
+
+    def test_merge(self):
+        names = ['Player {}'.format(index) for index in range(20000)]
+
+        merged = merge(sketch(names[:12000]), sketch(names[8000:]))
+
+        # The overlap is only counted once, and merging is the same as
+        # sketching everything at once.
+        self.assertEqual(merged.tolist(), sketch(names).tolist())
+        self.assertAlmostEqual(estimate(merged) / 20000.0, 1, delta=0.05)
+
+    def test_round_trip(self):
+        registers = sketch(['Player'])
+
+        self.assertEqual(load_sketch(registers.tobytes()).tolist(), registers.tolist())
+        self.assertEqual(load_sketch(None).tolist(), [0] * len(registers))
+
+
+class TestSummarise(SimpleTestCase):
+
+    def test_days(self):
+        days = [
+            SimpleNamespace(
+                replays=2,
+                goals=3,
+                player_names=sketch(['Blue', 'Orange']).tobytes(),
+                steam_ids=sketch(['1']).tobytes(),
+                steam_logins=sketch(['2']).tobytes(),
+            ),
+            SimpleNamespace(
+                replays=1,
+                goals=1,
+                player_names=sketch(['Blue']).tobytes(),
+                steam_ids=None,
+                steam_logins=None,
+            ),
+        ]
+
+        self.assertEqual(summarise(iter(days)), {'replays': 3, 'goals': 4, 'players': 2, 'steam_accounts': 1})
+        self.assertEqual(summarise(iter(days), logins=True)['steam_accounts'], 2)
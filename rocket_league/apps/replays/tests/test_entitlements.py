@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils.timezone import now
+from social.apps.django_app.default.models import UserSocialAuth
+
+from ...site.entitlements import entitlements
+from ...site.models import Patron, PatronTrial
+from ..models import Player, Replay
+
+
+class TestEligibility(TestCase):
+
+    def setUp(self):
+        entitlements.clear()
+
+        self.uploader = User.objects.create(username='uploader')
+        self.replay = Replay.objects.create(user=self.uploader)
+
+        self.player = User.objects.create(username='player')
+        UserSocialAuth.objects.create(user=self.player, provider='steam', uid='76561197960287930')
+        Player.objects.create(
+            replay=self.replay,
+            player_name='Player',
+            team=0,
+            platform='1',
+            online_id='76561197960287930',
+        )
+
+    def get_replay(self):
+        return Replay.objects.get(pk=self.replay.pk)
+
+    def test_not_eligible(self):
+        self.assertFalse(self.get_replay().eligible_for_feature('playback'))
+
+    def test_uploader_patron(self):
+        profile = self.uploader.profile
+        profile.patreon_email_address = 'uploader@example.com'
+        profile.save()
+
+        Patron.objects.create(
+            pledge_id=1,
+            pledge_amount=500,
+            pledge_created=now(),
+            patron_id=1,
+            patron_email='uploader@example.com',
+        )
+
+        self.assertTrue(self.get_replay().eligible_for_feature('playback'))
+
+    def test_player_trial(self):
+        PatronTrial.objects.create(user=self.player, expiry_date=now() + timedelta(days=7))
+
+        replay = self.get_replay()
+        entitlements.get()
+
+        with self.assertNumQueries(1):
+            # Only the players are looked up.
+            self.assertTrue(replay.eligible_for_feature('boost_analysis'))
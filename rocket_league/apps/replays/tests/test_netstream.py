@@ -0,0 +1,291 @@
+import copy
+import random
+
+from django.test import SimpleTestCase
+
+from ..management.commands.benchmark_netstream import (legacy_netstream,
+                                                       legacy_results,
+                                                       netstream_results)
+from ..analyzers import get_analyzers
+from ..netstream import NetstreamParser
+
+
+def _property(name, value):
+    return {'name': name, 'id': {'value': 0}, 'value': value}
+
+
+def _actor(actor_id):
+    return {'flagged_int': {'flag': True, 'int': actor_id}}
+
+
+def _rigid_body(position, angular_velocity):
+    return {'rigid_body_state': {
+        'location': dict(zip('xyz', position)),
+        'rotation': {axis: {'value': 0} for axis in 'xyz'},
+        'angular_velocity': angular_velocity,
+    }}
+
+
+def simulate_match(seed, num_frames=900, team_size=2):
+    """
+    Build a small match in the shape Rattletrap produces: kickoff freezes,
+    cars moving about, demolitions, ball touches and goals.
+    """
+    rng = random.Random(seed)
+    frames = []
+    goals = {}
+    players = {}
+    next_actor_id = [10]
+    ball = None
+    ball_position = [0, 0, 93]
+    angular_velocity = {'x': 0, 'y': 0, 'z': 0}
+    frozen_until = 40
+    scores = {0: 0, 1: 0}
+
+    def new_actor_id():
+        next_actor_id[0] += 1
+        return next_actor_id[0]
+
+    for index in range(num_frames):
+        replications = []
+
+        def spawn(actor_id, class_name, object_name=None):
+            replications.append({'actor_id': {'value': actor_id}, 'value': {'spawned': {
+                'class_name': class_name,
+                'object_name': object_name or class_name,
+            }}})
+
+        def update(actor_id, *properties):
+            replications.append({'actor_id': {'value': actor_id}, 'value': {'updated': list(properties)}})
+
+        def destroy(actor_id):
+            replications.append({'actor_id': {'value': actor_id}, 'value': {'destroyed': {}}})
+
+        if index == 0:
+            spawn(0, 'TAGame.GameEvent_Soccar_TA')
+            spawn(1, 'TAGame.Team_Soccar_TA', 'Archetypes.Teams.Team0')
+            spawn(2, 'TAGame.Team_Soccar_TA', 'Archetypes.Teams.Team1')
+            update(0, _property('TAGame.GameEvent_TA:ReplicatedGameStateTimeRemaining', {'int': 3}))
+
+            for team in [0, 1]:
+                for _ in range(team_size):
+                    player = new_actor_id()
+                    spawn(player, 'TAGame.PRI_TA')
+                    update(player, _property('Engine.PlayerReplicationInfo:Team', _actor(1 + team)))
+                    players[player] = {
+                        'team': team,
+                        'car': None,
+                        'boost': None,
+                        'position': [rng.randint(-3000, 3000), rng.randint(-4000, 4000), 17],
+                    }
+
+        if index == frozen_until:
+            update(0, _property('TAGame.GameEvent_TA:ReplicatedGameStateTimeRemaining', {'int': 0}))
+
+        if ball is None and index > 2:
+            ball = new_actor_id()
+            ball_position = [0, 0, 93]
+            spawn(ball, 'TAGame.Ball_TA')
+
+        for player, data in players.items():
+            if data['car'] is None:
+                if rng.random() < 0.3:
+                    data['car'] = new_actor_id()
+                    data['boost'] = new_actor_id()
+                    spawn(data['car'], 'TAGame.Car_TA')
+                    update(
+                        data['car'],
+                        _property('Engine.Pawn:PlayerReplicationInfo', _actor(player)),
+                        _property('TAGame.RBActor_TA:ReplicatedRBState', _rigid_body(data['position'], angular_velocity)),
+                    )
+                    spawn(data['boost'], 'TAGame.CarComponent_Boost_TA')
+                    update(
+                        data['boost'],
+                        _property('TAGame.CarComponent_TA:Vehicle', _actor(data['car'])),
+                        _property('TAGame.CarComponent_Boost_TA:ReplicatedBoostAmount', {'byte': 85}),
+                    )
+                continue
+
+            if rng.random() < 0.005:
+                # Demolished.
+                destroy(data['car'])
+                destroy(data['boost'])
+                data['car'] = data['boost'] = None
+                continue
+
+            if index > frozen_until:
+                data['position'] = [
+                    data['position'][0] + rng.randint(-60, 60),
+                    data['position'][1] + rng.randint(-60, 60),
+                    17,
+                ]
+
+            # Cars which haven't moved don't always get an update.
+            if rng.random() < 0.7:
+                update(data['car'], _property('TAGame.RBActor_TA:ReplicatedRBState', _rigid_body(data['position'], angular_velocity)))
+
+            if rng.random() < 0.1:
+                update(data['boost'], _property('TAGame.CarComponent_Boost_TA:ReplicatedBoostAmount', {'byte': rng.randint(0, 255)}))
+
+        if ball is not None:
+            properties = []
+
+            if index > frozen_until:
+                ball_position = [
+                    ball_position[0] + rng.randint(-80, 80),
+                    ball_position[1] + rng.randint(-80, 80),
+                    93,
+                ]
+
+                if rng.random() < 0.15:
+                    angular_velocity = {axis: rng.randint(-5000, 5000) for axis in 'xyz'}
+
+                if rng.random() < 0.05:
+                    properties.append(_property('TAGame.Ball_TA:HitTeamNum', {'byte': rng.randint(0, 1)}))
+
+            properties.append(_property('TAGame.RBActor_TA:ReplicatedRBState', _rigid_body(ball_position, angular_velocity)))
+            update(ball, *properties)
+
+            if index > frozen_until + 20 and index < num_frames - 5 and rng.random() < 0.01:
+                team = rng.randint(0, 1)
+                goals[index] = {'PlayerName': '', 'PlayerTeam': team}
+                scores[team] += 1
+                update(1 + team, _property('Engine.TeamInfo:Score', {'int': scores[team]}))
+                update(0, _property('TAGame.GameEvent_TA:ReplicatedGameStateTimeRemaining', {'int': 3}))
+                frozen_until = index + 30
+
+            if index == frozen_until - 20:
+                destroy(ball)
+                ball = None
+
+        frames.append({'replications': replications})
+
+    return goals, frames
+
+
+class TestNetstreamParser(SimpleTestCase):
+
+    def test_matches_legacy_loop(self):
+        for seed in range(4):
+            goals, frames = simulate_match(seed, team_size=1 + seed)
+
+            expected = legacy_results(legacy_netstream(goals, copy.deepcopy(frames)))
+
+            netstream = NetstreamParser(goals)
+            netstream.parse(copy.deepcopy(frames))
+            results = netstream_results(netstream)
+
+            for key in expected:
+                self.assertEqual(results[key], expected[key], '{} differs for seed {}'.format(key, seed))
+
+    def test_heatmap_skips_unlinked_cars(self):
+        frames = []
+
+        for index in range(20):
+            replications = []
+
+            def spawn(actor_id, class_name):
+                replications.append({'actor_id': {'value': actor_id}, 'value': {'spawned': {
+                    'class_name': class_name,
+                    'object_name': class_name,
+                }}})
+
+            def update(actor_id, *properties):
+                replications.append({'actor_id': {'value': actor_id}, 'value': {'updated': list(properties)}})
+
+            if index == 0:
+                spawn(0, 'TAGame.GameEvent_Soccar_TA')
+                spawn(11, 'TAGame.PRI_TA')
+                spawn(20, 'TAGame.Car_TA')
+                spawn(30, 'TAGame.Ball_Breakout_TA')
+                update(30, _property('TAGame.RBActor_TA:ReplicatedRBState', _rigid_body([0, 0, 93], {})))
+
+            # The car moves about before it's linked to its player.
+            if index < 5:
+                update(20, _property('TAGame.RBActor_TA:ReplicatedRBState', _rigid_body([1000 + index, 1000, 17], {})))
+            elif index == 5:
+                update(20, _property('Engine.Pawn:PlayerReplicationInfo', _actor(11)))
+            elif index == 10:
+                update(20, _property('TAGame.RBActor_TA:ReplicatedRBState', _rigid_body([-1000, -1000, 17], {})))
+
+            frames.append({'replications': replications})
+
+        netstream = NetstreamParser({}, ['heatmap'])
+        netstream.parse(copy.deepcopy(frames))
+        heatmap = netstream.results()['heatmap']
+
+        # The moves before the car was linked are stored under the ball.
+        self.assertEqual(len(netstream.results()['frame_store'].track('ball')), 6)
+
+        # The car counts from when it was linked, where it last moved to, and
+        # the Breakout ball isn't counted.
+        self.assertEqual(list(heatmap.counts), [11])
+        self.assertEqual(heatmap.grid(11).ravel()[heatmap.cell(1004, 1000)], 5)
+        self.assertEqual(heatmap.grid(11).ravel()[heatmap.cell(-1000, -1000)], 10)
+        self.assertEqual(heatmap.grid(11).sum(), 15)
+
+        expected = legacy_results(legacy_netstream({}, copy.deepcopy(frames)))
+        self.assertEqual(heatmap.to_legacy_json(), expected['heatmap_data'])
+
+    def test_heatmap_keeps_respawned_actors(self):
+        frames = []
+
+        for index in range(10):
+            replications = []
+
+            # Replays can spawn an actor again without destroying it first,
+            # it keeps its state.
+            if index in [0, 5]:
+                replications.append({'actor_id': {'value': 30}, 'value': {'spawned': {
+                    'class_name': 'TAGame.Ball_TA',
+                    'object_name': 'Archetypes.Ball.Ball_Default',
+                }}})
+
+            if index == 0:
+                replications.append({'actor_id': {'value': 30}, 'value': {'updated': [
+                    _property('TAGame.RBActor_TA:ReplicatedRBState', _rigid_body([0, 0, 93], {})),
+                ]}})
+
+            frames.append({'replications': replications})
+
+        netstream = NetstreamParser({}, ['heatmap'])
+        netstream.parse(copy.deepcopy(frames))
+        heatmap = netstream.results()['heatmap']
+
+        self.assertEqual(heatmap.grid('ball').sum(), 10)
+
+        expected = legacy_results(legacy_netstream({}, copy.deepcopy(frames)))
+        self.assertEqual(heatmap.to_legacy_json(), expected['heatmap_data'])
+
+    def test_runs_selected_analyzers(self):
+        goals, frames = simulate_match(0)
+
+        netstream = NetstreamParser(goals)
+        netstream.parse(copy.deepcopy(frames))
+
+        boost_only = NetstreamParser(goals, ['boost'])
+        boost_only.parse(copy.deepcopy(frames))
+
+        self.assertEqual(list(boost_only.analyzers), ['boost'])
+        self.assertEqual(set(boost_only.results()), {'boost_data'})
+        self.assertEqual(boost_only.results()['boost_data'], netstream.results()['boost_data'])
+        self.assertNotIn('TAGame.RBActor_TA:ReplicatedRBState', boost_only.property_handlers)
+
+        # The heatmap is built from the frame store.
+        heatmap = NetstreamParser(goals, ['heatmap'])
+        heatmap.parse(copy.deepcopy(frames))
+
+        self.assertEqual(list(heatmap.analyzers), ['boost', 'locations', 'heatmap'])
+        self.assertEqual(
+            heatmap.results()['heatmap'].to_json(),
+            netstream.results()['heatmap'].to_json(),
+        )
+
+    def test_analyzer_requirements(self):
+        self.assertEqual(
+            [analyzer.name for analyzer in get_analyzers(['shots'])],
+            ['boost', 'locations', 'shots'],
+        )
+
+        with self.assertRaises(ValueError):
+            get_analyzers(['nonsense'])
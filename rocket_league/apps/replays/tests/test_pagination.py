@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from django.core.paginator import EmptyPage
+from django.test import TestCase
+from django.utils.timezone import utc
+
+from ..models import Replay
+from ..pagination import KeysetPaginator
+
+
+class TestKeysetPaginator(TestCase):
+
+    def setUp(self):
+        timestamp = datetime(2016, 6, 1, 12, tzinfo=utc)
+
+        # Two replays a day, with the same rating on the first day.
+        for index in range(5):
+            Replay.objects.create(
+                processed=True,
+                replay_id='REPLAY{}'.format(index),
+                team_sizes=1,
+                timestamp=timestamp + timedelta(days=index // 2),
+                average_rating=3 if index < 2 else index,
+            )
+
+        self.queryset = Replay.objects.filter(listable=True)
+        self.expected = list(self.queryset.order_by('-timestamp_date', '-average_rating', '-pk'))
+
+    def test_listable(self):
+        self.assertEqual(len(self.expected), 5)
+        self.assertFalse(Replay.objects.create(processed=False, team_sizes=1).listable)
+
+    def test_walk_pages(self):
+        paginator = KeysetPaginator(self.queryset, 2)
+
+        page = paginator.page()
+        pages = [page.object_list]
+        self.assertFalse(page.has_previous())
+
+        while page.has_next():
+            page = paginator.page(after=page.next_cursor)
+            pages.append(page.object_list)
+
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(objects) for objects in pages], [2, 2, 1])
+
+        # And back again.
+        page = paginator.page(before=page.previous_cursor)
+        self.assertEqual(page.object_list, pages[1])
+
+        page = paginator.page(before=page.previous_cursor)
+        self.assertEqual(page.object_list, pages[0])
+        self.assertFalse(page.has_previous())
+
+        self.assertEqual(paginator.count, 5)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(EmptyPage):
+            KeysetPaginator(self.queryset, 2).page(after='nonsense')
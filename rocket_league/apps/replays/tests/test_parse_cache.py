@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import SimpleTestCase, TestCase
+
+from .. import parse_cache
+from ..analyzers import HeatmapAnalyzer
+from ..frames import FrameStore
+from ..models import Replay
+
+
+class TestParseCache(SimpleTestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_round_trip(self):
+        frame_store = FrameStore()
+        frame_store.add_frame()
+        frame_store.append(5, 12, 0, 1, 2, 3, 0, 0, 0)
+
+        name = 'cache/test.pickle.zlib'
+        self.assertIsNone(parse_cache.load(name, self.storage))
+
+        parse_cache.store(name, {'results': {'frame_store': frame_store}}, self.storage)
+        # Storing again replaces the entry rather than saving alongside it.
+        parse_cache.store(name, {'results': {'frame_store': frame_store}}, self.storage)
+
+        parsed = parse_cache.load(name, self.storage)
+        self.assertEqual(parsed['results']['frame_store'].to_frame_data(), frame_store.to_frame_data())
+
+    def test_unreadable_entry_is_a_miss(self):
+        self.storage.save('cache/broken.pickle.zlib', ContentFile(b'not a cache entry'))
+        self.assertIsNone(parse_cache.load('cache/broken.pickle.zlib', self.storage))
+
+    def test_unsigned_entry_is_not_unpickled(self):
+        name = 'cache/unsigned.pickle.zlib'
+        parse_cache.store(name, {'results': {}}, self.storage)
+
+        with self.storage.open(name, 'rb') as f:
+            data = f.read()
+
+        # A pickle written by anyone without the secret key.
+        self.storage.delete(name)
+        self.storage.save(name, ContentFile(b'\0' * parse_cache.SIGNATURE_LENGTH + data[parse_cache.SIGNATURE_LENGTH:]))
+
+        self.assertIsNone(parse_cache.load(name, self.storage))
+
+    def test_prune(self):
+        now = time.time()
+
+        for name, size, age in [('new', 10, 0), ('recent', 10, 60), ('older', 10, 120), ('stale', 1, 3600)]:
+            self.storage.save('cache/{}'.format(name), ContentFile(b'\0' * size))
+            os.utime(self.storage.path('cache/{}'.format(name)), (now - age, now - age))
+
+        # Reading an entry counts as using it.
+        os.utime(self.storage.path('cache/older'), (now - 600, now - 600))
+        parse_cache.load('cache/older', self.storage)
+
+        # The stale entry is too old, and the least recently used go until the
+        # rest fit.
+        self.assertEqual(parse_cache.prune(self.storage, max_bytes=25, max_age=1800), 2)
+        self.assertEqual(sorted(self.storage.listdir('cache')[1]), ['new', 'older'])
+
+    def test_parser_version(self):
+        # The heatmap is built from the locations.
+        version = parse_cache.parser_version(['heatmap'])
+        self.assertEqual(version, 'netstream1-boost1-locations1-heatmap2')
+
+        HeatmapAnalyzer.version += 1
+
+        try:
+            self.assertNotEqual(parse_cache.parser_version(['heatmap']), version)
+        finally:
+            HeatmapAnalyzer.version -= 1
+
+    def test_is_up_to_date(self):
+        self.assertTrue(parse_cache.is_up_to_date(parse_cache.parser_version()))
+        self.assertFalse(parse_cache.is_up_to_date('netstream1-heatmap2'))
+
+        # Only the selected analyzers, and the ones they need, are compared.
+        self.assertTrue(parse_cache.is_up_to_date('boost1-locations1-heatmap2', ['heatmap']))
+        self.assertFalse(parse_cache.is_up_to_date('boost1-locations1-heatmap20', ['heatmap']))
+        self.assertFalse(parse_cache.is_up_to_date('', ['heatmap']))
+
+    def test_update_parser_version(self):
+        self.assertEqual(
+            parse_cache.update_parser_version('netstream1-boost1-locations1-heatmap0-shots1', ['heatmap']),
+            'netstream1-boost1-locations1-heatmap2-shots1',
+        )
+
+        # Analyzers which weren't in the stored version are added.
+        self.assertEqual(
+            parse_cache.update_parser_version('netstream1-heatmap2', ['shots']),
+            'netstream1-boost1-locations1-heatmap2-shots1',
+        )
+
+
+class TestUpToDate(TestCase):
+
+    def test_selected_analyzers(self):
+        versions = [
+            parse_cache.parser_version(),
+            'boost1-locations1-heatmap2',
+            'netstream1-boost1-locations1-heatmap20-shots1',
+            'netstream0-heatmap0',
+            '',
+        ]
+
+        for version in versions:
+            Replay.objects.create(parser_version=version)
+
+        def current(analyzers):
+            return set(Replay.objects.filter(
+                parse_cache.up_to_date(analyzers),
+            ).values_list('parser_version', flat=True))
+
+        def stale(analyzers):
+            return set(Replay.objects.filter(
+                parse_cache.out_of_date(analyzers),
+            ).values_list('parser_version', flat=True))
+
+        self.assertEqual(current(None), {parse_cache.parser_version()})
+        # A replay only needs the selected analyzers to be current.
+        self.assertEqual(current(['heatmap']), {parse_cache.parser_version(), 'boost1-locations1-heatmap2'})
+        self.assertEqual(stale(['heatmap']), set(versions) - current(['heatmap']))
@@ -0,0 +1,30 @@
+from django.test import TestCase
+
+from ..models import Goal, Player, Replay
+from ..persistence import player_key, save_goals, save_players
+
+
+class TestSavePlayers(TestCase):
+
+    def test_netstream_keeps_header_players(self):
+        replay = Replay.objects.create()
+
+        header = save_players(replay, [
+            {'player_name': 'Blue', 'team': 0, 'score': 100},
+            {'player_name': 'Orange', 'team': 1, 'score': 200},
+        ])
+        scorer = header[player_key('Blue', 0)]
+
+        save_goals(replay, [{'number': 1, 'frame': 100, 'player': scorer}])
+        goal = Goal.objects.get(replay=replay)
+
+        netstream = save_players(replay, [
+            {'player_name': 'Blue', 'team': 0, 'score': 100, 'actor_id': 5},
+            {'player_name': 'Orange', 'team': 1, 'score': 200, 'actor_id': 6},
+        ])
+
+        # The rows are updated in place, so the goal survives.
+        self.assertEqual(netstream[player_key('Blue', 0, 5)].pk, scorer.pk)
+        self.assertEqual(Player.objects.get(pk=scorer.pk).actor_id, 5)
+        self.assertEqual(Player.objects.filter(replay=replay).count(), 2)
+        self.assertTrue(Goal.objects.filter(pk=goal.pk, player=scorer).exists())
@@ -0,0 +1,81 @@
+from django.test import SimpleTestCase
+
+from ..player_stats import preferences, replay_stats
+
+
+def player(**values):
+    row = {
+        'team': 0, 'score': 100, 'goals': 0, 'shots': 0, 'assists': 0,
+        'saves': 0, 'replay__show_leaderboard': True, 'replay__team_sizes': 2,
+        'replay__num_frames': 30 * 60 * 6, 'replay__record_fps': 30.0,
+        'replay__team_0_score': 2, 'replay__team_1_score': 1,
+    }
+    row.update(values)
+    return row
+
+
+def goal(number, frame, team=0):
+    return {'number': number, 'frame': frame, 'player__team': team}
+
+
+class TestReplayStats(SimpleTestCase):
+
+    def test_overtime(self):
+        stats = replay_stats([player(goals=2)], [goal(2, 30 * 60 * 5 - 10), goal(3, 30 * 60 * 6 - 10)])
+
+        self.assertEqual(stats['appearances'], 1)
+        self.assertEqual(stats['winning_goals'], 1)
+        self.assertEqual(stats['last_minute_goals'], 1)
+        self.assertEqual(stats['overtime_triggering_goals'], 1)
+        self.assertEqual(stats['overtime_trigger_and_team_win'], 1)
+        self.assertEqual(stats['overtime_triggering_and_winning_goals'], 1)
+        self.assertTrue(stats['won_overtime'])
+
+    def test_lost(self):
+        stats = replay_stats([player(team=1)], [])
+
+        self.assertFalse(stats['won_overtime'])
+        self.assertEqual(stats['winning_goals'], 0)
+
+    def test_split_screen(self):
+        stats = replay_stats([player(score=50, saves=1), player(score=300, saves=2)], [])
+
+        # The replay is only counted once, the totals include both.
+        self.assertEqual(stats['appearances'], 1)
+        self.assertEqual(stats['highest_score'], 300)
+        self.assertEqual(stats['total_saves'], 3)
+
+    def test_not_on_leaderboard(self):
+        stats = replay_stats([player(score=500, goals=3, replay__show_leaderboard=False)], [goal(3, 0)])
+
+        # Only the maximums count.
+        self.assertEqual(stats['highest_score'], 500)
+        self.assertEqual(stats['appearances'], 0)
+        self.assertEqual(stats['total_goals'], 0)
+        self.assertEqual(stats['winning_goals'], 0)
+        self.assertIsNone(stats['team_sizes'])
+
+
+class TestPreferences(SimpleTestCase):
+
+    def test_preferences(self):
+        stats = preferences({
+            'match_sizes': {'1': 2, '3': 5, '2': 5},
+            'total_goals': 4,
+            'total_assists': 1,
+            'total_saves': 7,
+        })
+
+        self.assertEqual(stats['preferred_match_size'], 2)
+        self.assertEqual(stats['preferred_role'], 'Goalkeeper')
+
+    def test_nothing_played(self):
+        stats = preferences({
+            'match_sizes': {},
+            'total_goals': 0,
+            'total_assists': 0,
+            'total_saves': 0,
+        })
+
+        self.assertIsNone(stats['preferred_match_size'])
+        self.assertIsNone(stats['preferred_role'])
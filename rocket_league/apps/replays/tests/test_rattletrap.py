@@ -0,0 +1,65 @@
+import io
+import json
+
+from django.test import SimpleTestCase
+
+from ..rattletrap import iter_replay_stream
+
+
+class TestRattletrapStream(SimpleTestCase):
+
+    document = {
+        'header': {
+            'size': 1234,
+            'body': {
+                'properties': {
+                    'value': {
+                        'ReplayName': {'kind': 'StrProperty', 'value': {'str': 'Café ☃'}},
+                    },
+                },
+            },
+        },
+        'content': {
+            'size': 5678,
+            'body': {
+                'levels': ['Stadium_P'],
+                'frames': [
+                    {'time': 0.0, 'delta': 0.0, 'replications': []},
+                    {'time': 1.5e-2, 'delta': 123456789, 'replications': [{'actor_id': {'value': 1}}]},
+                    {'time': -2, 'delta': True, 'replications': None},
+                ],
+                'class_mappings': [],
+            },
+        },
+    }
+
+    def _stream(self, document, chunk_size):
+        stream = io.BytesIO(json.dumps(document, indent=1).encode('utf-8'))
+        stream.read = lambda size=-1, read=stream.read: read(min(size, chunk_size))
+        return list(iter_replay_stream(stream))
+
+    def test_header_then_frames(self):
+        # Tiny reads force values and multi-byte characters across chunk boundaries.
+        for chunk_size in [1, 3, 7, 64 * 1024]:
+            values = self._stream(self.document, chunk_size)
+
+            self.assertEqual(values[0], self.document['header'])
+            self.assertEqual(values[1:], self.document['content']['body']['frames'])
+
+    def test_frames_before_header(self):
+        document = json.loads(json.dumps(self.document))
+        document = {
+            'content': document['content'],
+            'header': document['header'],
+        }
+
+        values = self._stream(document, 5)
+
+        self.assertEqual(values[0], self.document['header'])
+        self.assertEqual(values[1:], self.document['content']['body']['frames'])
+
+    def test_truncated_stream(self):
+        stream = io.BytesIO(json.dumps(self.document).encode('utf-8')[:-20])
+
+        with self.assertRaises(ValueError):
+            list(iter_replay_stream(stream))
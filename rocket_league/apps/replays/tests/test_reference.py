@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from django.test import TestCase
+from django.utils.timezone import utc
+
+from .. import reference
+from ..models import Component, Map, Season
+
+
+class TestReferenceData(TestCase):
+
+    def setUp(self):
+        for cache in reference.CACHES.values():
+            cache.clear()
+
+        self.first = Season.objects.create(title='Season 1', start_date=datetime(2015, 7, 7, tzinfo=utc))
+        self.second = Season.objects.create(title='Season 2', start_date=datetime(2016, 2, 10, tzinfo=utc))
+
+    def test_season_for(self):
+        self.assertIsNone(reference.season_for(datetime(2015, 1, 1, tzinfo=utc)))
+        self.assertEqual(reference.season_for(datetime(2015, 7, 7, tzinfo=utc)), self.first.pk)
+        self.assertEqual(reference.season_for(datetime(2016, 1, 1, tzinfo=utc)), self.first.pk)
+        self.assertEqual(reference.season_for(datetime(2017, 1, 1, tzinfo=utc)), self.second.pk)
+
+        with self.assertNumQueries(0):
+            reference.season_for(datetime(2017, 1, 1, tzinfo=utc))
+
+    def test_saving_invalidates(self):
+        reference.season_for(datetime(2017, 1, 1, tzinfo=utc))
+
+        third = Season.objects.create(title='Season 3', start_date=datetime(2016, 6, 20, tzinfo=utc))
+
+        self.assertEqual(reference.season_for(datetime(2017, 1, 1, tzinfo=utc)), third.pk)
+
+    def test_get_map(self):
+        map_obj = reference.get_map('park_p')
+
+        self.assertEqual(Map.objects.get().pk, map_obj.pk)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(reference.get_map('park_p').pk, map_obj.pk)
+
+        with self.assertNumQueries(0):
+            reference.get_map('park_p')
+
+    def test_get_component(self):
+        component = reference.get_component('body', 22, 'Force')
+
+        self.assertEqual(component.name, 'Force')
+        self.assertEqual(reference.get_component('body', 22).pk, component.pk)
+        self.assertEqual(Component.objects.count(), 1)
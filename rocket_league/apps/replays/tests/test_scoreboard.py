@@ -0,0 +1,59 @@
+from django.test import TestCase
+
+from ..models import Goal, Player, Replay
+
+
+class TestScoreboard(TestCase):
+
+    def setUp(self):
+        replay = Replay.objects.create(processed=True)
+
+        scorer = Player.objects.create(replay=replay, player_name='Blue', team=0, goals=2, score=300)
+        Player.objects.create(replay=replay, player_name='Orange', team=1)
+
+        for number in range(1, 3):
+            Goal.objects.create(replay=replay, number=number, player=scorer, frame=number * 100)
+
+        self.replay = replay
+
+    def test_player_pairs_from_scoreboard(self):
+        self.replay.scoreboard = self.replay.build_scoreboard()
+        self.replay.save()
+
+        replay = Replay.objects.get(pk=self.replay.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(list(replay.player_pairs()), [('Blue (2)', 'Orange')])
+
+    def test_player_pairs_without_scoreboard(self):
+        replay = Replay.objects.get(pk=self.replay.pk)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(list(replay.player_pairs()), [('Blue (2)', 'Orange')])
+
+    def test_player_pairs_from_old_scoreboard(self):
+        # Scoreboards saved before they held every field are worked out again.
+        self.replay.scoreboard = [
+            {'player_name': player['player_name'], 'team': player['team'], 'goal_count': player['goal_count']}
+            for player in self.replay.build_scoreboard()
+        ]
+        self.replay.save()
+
+        replay = Replay.objects.get(pk=self.replay.pk)
+        self.assertFalse(replay.has_scoreboard)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(list(replay.player_pairs()), [('Blue (2)', 'Orange')])
+
+    def test_players_by_team_from_scoreboard(self):
+        self.replay.scoreboard = self.replay.build_scoreboard()
+        self.replay.save()
+
+        replay = Replay.objects.get(pk=self.replay.pk)
+
+        with self.assertNumQueries(0):
+            teams = replay.players_by_team
+
+        self.assertEqual([player.player_name for player in teams[0]], ['Blue'])
+        self.assertEqual([player.player_name for player in teams[1]], ['Orange'])
+        self.assertEqual(teams[0][0], Player.objects.get(player_name='Blue'))
@@ -4,12 +4,13 @@ import re
 
 from braces.views import LoginRequiredMixin
 from django.conf import settings
-from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.core.paginator import EmptyPage
 from django.core.urlresolvers import reverse
 from django.db.models import Q
 from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition
 from django.views.generic import (CreateView, DeleteView, DetailView,
                                   RedirectView, UpdateView)
 from django_filters.views import FilterView
@@ -17,7 +18,7 @@ from rest_framework import mixins, views, viewsets
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
-from . import serializers
+from . import conditional, serializers
 from ...utils.forms import AjaxableResponseMixin
 from ..users.models import User
 from .filters import ReplayFilter, ReplayPackFilter
@@ -25,6 +26,7 @@ from .forms import ReplayPackForm, ReplayUpdateForm
 from .models import (PRIVACY_PRIVATE, PRIVACY_PUBLIC, PRIVACY_UNLISTED,
                      Component, Goal, Map, Player, Replay, ReplayPack, Season,
                      get_default_season)
+from .pagination import KeysetPaginator
 from .tasks import process_netstream
 from .templatetags.replays import process_boost_data
 
@@ -37,12 +39,12 @@ class ReplayListView(FilterView):
     filterset_class = ReplayFilter
 
     def get_queryset(self):
-        qs = super(ReplayListView, self).get_queryset()
+        qs = super(ReplayListView, self).get_queryset().select_related('map')
 
-        qs = qs.exclude(
-            Q(processed=False) |
-            Q(replay_id='') |
-            Q(team_sizes=None)
+        # Processed replays with an ID, team size, date and rating, see
+        # Replay.save().
+        qs = qs.filter(
+            listable=True,
         )
 
         if 'season' not in self.request.GET:
@@ -64,10 +66,7 @@ class ReplayListView(FilterView):
             qs = qs.order_by(*self.request.GET.getlist('order'))
         else:
             # TODO: Make a rating which combines these.
-            qs = qs.extra(select={
-                'timestamp__date': 'DATE(timestamp)'
-            })
-            qs = qs.order_by('-timestamp__date', '-average_rating')
+            qs = qs.order_by('-timestamp_date', '-average_rating', '-pk')
 
         # Limit to public games, or unlisted / private games uploaded by the user.
         if self.request.user.is_authenticated():
@@ -80,6 +79,23 @@ class ReplayListView(FilterView):
             )
         return qs
 
+    def paginate_queryset(self, queryset, page_size):
+        # Other orders are paged by number.
+        if 'order' in self.request.GET:
+            return super(ReplayListView, self).paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size)
+
+        try:
+            page = paginator.page(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
+        except EmptyPage:
+            raise Http404
+
+        return (paginator, page, page.object_list, page.has_other_pages())
+
     def get_context_data(self, **kwargs):
         context = super(ReplayListView, self).get_context_data(**kwargs)
 
@@ -124,7 +140,21 @@ class ReplayUUIDMixin(DetailView):
                 replay_id=re.sub(r'([A-F0-9]{8})([A-F0-9]{4})([A-F0-9]{4})([A-F0-9]{4})([A-F0-9]{12})', r'\1-\2-\3-\4-\5', kwargs['replay_id'].upper()).lower()
             )
 
-        return super(ReplayUUIDMixin, self).dispatch(request, *args, **kwargs)
+        dispatch = super(ReplayUUIDMixin, self).dispatch
+
+        if request.method in ('GET', 'HEAD'):
+            # Answer with a 304 if the client's copy is still current.
+            dispatch = condition(etag_func=self.get_etag)(dispatch)
+
+        return dispatch(request, *args, **kwargs)
+
+    def get_etag(self, request, *args, **kwargs):
+        if 'replay_id' in kwargs:
+            filters = {'replay_id': kwargs['replay_id'].replace('-', '').upper()}
+        else:
+            filters = {'pk': kwargs['pk']}
+
+        return conditional.page_etag(request, conditional.get_replay(request, **filters))
 
     def get_object(self):
         replay_id = ''
@@ -179,34 +209,21 @@ class ReplayBoostAnalysisView(ReplayUUIDMixin):
     def get_context_data(self, **kwargs):
         context = super(ReplayBoostAnalysisView, self).get_context_data(**kwargs)
 
-        CACHE_KEY_0 = 'replay_boost_context_{}_team_0'.format(self.object.pk)
-        CACHE_KEY_1 = 'replay_boost_context_{}_team_1'.format(self.object.pk)
-
-        cached_data_0 = cache.get(CACHE_KEY_0)
-        cached_data_1 = cache.get(CACHE_KEY_1)
-
         context['team_0_boost_consumed'] = 0
         context['team_1_boost_consumed'] = 0
 
-        if cached_data_0 and cached_data_1:
-            context['team_0_boost_consumed'] = cached_data_0
-            context['team_1_boost_consumed'] = cached_data_1
-            return context
-
-        # Get the tabular data.
-        for player in self.object.player_set.all():
-            if not player.boost_data:
-                player.boost_data = process_boost_data({}, obj=player)
-                player.save()
+        # The boost data of each player is worked out when the replay is
+        # processed, see boost.save_boost_analysis.  Replays processed before
+        # then are caught up by build_boost_analysis, until which their
+        # timelines are read here.
+        for player in self.object.player_set.select_related('boost_timeline'):
+            boost_data = player.boost_data or process_boost_data({}, obj=player)
 
             # Get the team boost data.
             if player.team == 0:
-                context['team_0_boost_consumed'] += player.boost_data['boost_consumption']
+                context['team_0_boost_consumed'] += boost_data['boost_consumption']
             elif player.team == 1:
-                context['team_1_boost_consumed'] += player.boost_data['boost_consumption']
-
-        cache.set(CACHE_KEY_0, context['team_0_boost_consumed'], 3600)
-        cache.set(CACHE_KEY_1, context['team_1_boost_consumed'], 3600)
+                context['team_1_boost_consumed'] += boost_data['boost_consumption']
 
         return context
 
@@ -276,6 +293,9 @@ class ReplayUpdateView(LoginRequiredMixin, UpdateView):
                     user_entered=True,
                 )
 
+        self.object.scoreboard = self.object.build_scoreboard()
+        self.object.bump_content_version()
+
         return super(ReplayUpdateView, self).form_valid(form)
 
 
@@ -442,6 +462,10 @@ class ReplayViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.Retri
         Optionally restricts the returned purchases to a given user,
         by filtering against a `owned` query parameter in the URL.
         """
+        return serializers.ReplaySerializer.setup_queryset(self.get_base_queryset(), self.request)
+
+    def get_base_queryset(self):
+        # The replays without their relations, to look up ETags in.
         queryset = Replay.objects.all()
 
         if 'owned' in self.request.query_params and self.request.user.is_authenticated():
@@ -462,6 +486,22 @@ class ReplayViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.Retri
 
         return get_object_or_404(queryset, **filters)
 
+    def retrieve(self, request, *args, **kwargs):
+        # Pollers get a 304 if the replay hasn't changed.
+        return condition(
+            etag_func=lambda request, *args, **kwargs: conditional.api_etag(request, self.get_conditional_replay()),
+            last_modified_func=lambda request, *args, **kwargs: getattr(self.get_conditional_replay(), 'last_modified', None),
+        )(super(ReplayViewSet, self).retrieve)(request, *args, **kwargs)
+
+    def get_conditional_replay(self):
+        # The same lookup as get_object().
+        if 'replay_id' in self.kwargs:
+            filters = {'replay_id': self.kwargs['replay_id']}
+        else:
+            filters = {'pk': self.kwargs['pk']}
+
+        return conditional.get_replay(self.request, self.filter_queryset(self.get_base_queryset()), **filters)
+
     def perform_create(self, serializer):
         instance = serializer.save(user=self.request.user)
 
@@ -505,7 +545,8 @@ class GoalViewSet(viewsets.ReadOnlyModelViewSet):
     Returns a list of all goals in all games.
     """
 
-    queryset = Goal.objects.all()
+    # The goal times need the replay's frame rate.
+    queryset = Goal.objects.select_related('replay')
     serializer_class = serializers.GoalSerializer
 
 
@@ -533,6 +574,12 @@ class ReplayPackViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = serializers.ReplayPackSerializer
     pagination_class = LimitedPageNumberPagination
 
+    def get_queryset(self):
+        return serializers.ReplayPackSerializer.setup_queryset(
+            super(ReplayPackViewSet, self).get_queryset(),
+            self.request,
+        )
+
 
 class LatestUserReplay(views.APIView):
     serializer_class = serializers.ReplaySerializer
@@ -0,0 +1 @@
+default_app_config = 'rocket_league.apps.site.apps.SiteConfig'
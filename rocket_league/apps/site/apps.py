@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class SiteConfig(AppConfig):
+    name = 'rocket_league.apps.site'
+
+    def ready(self):
+        from . import signals  # noqa
@@ -0,0 +1,100 @@
+"""
+The pledge each user is entitled to, looked up without touching the database.
+
+Working out a pledge took a UserSocialAuth lookup, a Profile, a Patron and a
+PatronTrial query, and a replay's eligibility for a feature repeated that for
+the uploader and every Steam player.  Instead the pledges of everyone who has
+one are built into two dicts, by user ID and by Steam ID, which each process
+keeps in memory.  They are rebuilt when a patron, profile, trial or Steam
+login changes (see signals.py), after get_patrons has run and when the date
+changes, as that's when trials run out.
+"""
+from django.conf import settings
+from django.utils.timezone import now
+from social.apps.django_app.default.models import UserSocialAuth
+
+from ..replays.reference import ReferenceCache
+from ..users.models import Profile
+from .models import Patron, PatronTrial
+
+# What an active trial counts as.
+TRIAL_PLEDGE = 99999
+
+FEATURE_PRICES = {
+    'playback': settings.PATREON_PLAYBACK_PRICE,
+    'boost_analysis': settings.PATREON_BOOST_PRICE,
+}
+
+
+def build_entitlements():
+    today = now().date()
+
+    # A declined pledge counts for nothing, even during a trial.
+    pledges = {
+        email: 0 if declined else amount
+        for email, amount, declined in Patron.objects.values_list(
+            'patron_email', 'pledge_amount', 'pledge_declined_since',
+        )
+    }
+
+    users = {}
+
+    for user_id in PatronTrial.objects.filter(
+        expiry_date__gte=today,
+    ).values_list('user_id', flat=True):
+        users[user_id] = TRIAL_PLEDGE
+
+    for user_id, email in Profile.objects.filter(
+        patreon_email_address__in=list(pledges),
+    ).values_list('user_id', 'patreon_email_address'):
+        users[user_id] = pledges[email]
+
+    steam = {
+        uid: users[user_id]
+        for uid, user_id in UserSocialAuth.objects.filter(
+            provider='steam',
+            user_id__in=list(users),
+        ).values_list('uid', 'user_id')
+    }
+
+    return {
+        'date': today,
+        'users': users,
+        'steam': steam,
+    }
+
+
+entitlements = ReferenceCache('patron_entitlements', build_entitlements)
+
+
+def get_entitlements():
+    data = entitlements.get()
+
+    if data['date'] != now().date():
+        entitlements.clear()
+        data = entitlements.get()
+
+    return data
+
+
+def pledge_amount(user_id=None, steam_id=None):
+    """
+    The amount in cents pledged by a user, or by the user who signed in with
+    a Steam ID.
+    """
+    data = get_entitlements()
+
+    if user_id is not None:
+        return data['users'].get(user_id, 0)
+
+    return data['steam'].get(steam_id, 0)
+
+
+def eligible_for_feature(feature, user_id=None, steam_ids=()):
+    price = FEATURE_PRICES[feature]
+    data = get_entitlements()
+
+    if user_id is not None and data['users'].get(user_id, 0) >= price:
+        return True
+
+    return any(data['steam'].get(steam_id, 0) >= price for steam_id in steam_ids)
@@ -3,6 +3,7 @@ import os
 import patreon
 from django.core.management.base import BaseCommand
 
+from ...entitlements import entitlements
 from ...models import Patron
 
 
@@ -52,3 +53,7 @@ class Command(BaseCommand):
             processed += self.process_pledges(pledges)
 
         assert processed == pledges['meta']['count']
+
+        # The pledges are saved one at a time, make sure everyone sees them
+        # all.
+        entitlements.invalidate()
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch.dispatcher import receiver
+from social.apps.django_app.default.models import UserSocialAuth
+
+from ..users.models import Profile
+from .entitlements import entitlements
+from .models import Patron, PatronTrial
+
+
+@receiver(post_save, sender=Patron)
+@receiver(post_delete, sender=Patron)
+@receiver(post_save, sender=PatronTrial)
+@receiver(post_delete, sender=PatronTrial)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def pledges_changed(sender, **kwargs):
+    entitlements.invalidate()
+
+
+@receiver(post_save, sender=UserSocialAuth)
+@receiver(post_delete, sender=UserSocialAuth)
+def social_auth_changed(sender, instance, created=True, **kwargs):
+    # The Steam details are saved on every profile refresh, only a new or
+    # removed login changes anything.
+    if created and instance.provider == 'steam':
+        entitlements.invalidate()
@@ -1,9 +1,7 @@
 from django import template
-from django.utils.timezone import now
-from social.apps.django_app.default.models import UserSocialAuth
 
 from ...replays.models import Player
-from ..models import Patron, PatronTrial
+from ..entitlements import pledge_amount
 
 register = template.Library()
 
@@ -75,47 +73,10 @@ def patreon_pledge_amount(context, user=None, steam_id=None):
         if not user.is_authenticated():
             return 0
 
-    if not user and steam_id:
-        # See if we can get a user object from this Steam ID.
-        try:
-            obj = UserSocialAuth.objects.get(
-                provider='steam',
-                uid=steam_id,
-            )
+    if user:
+        return pledge_amount(user_id=user.pk)
 
-            user = obj.user
-
-        except UserSocialAuth.DoesNotExist:
-            return 0
-
-    # Does this user have a Patreon email address?
-    if user.profile.patreon_email_address:
-        try:
-            # Does a patreon object for this email address exist?
-            obj = Patron.objects.get(
-                patron_email=user.profile.patreon_email_address,
-            )
-
-            if obj.pledge_declined_since:
-                # TODO: Double check this is correct.
-                return 0
-
-            return obj.pledge_amount
-        except Patron.DoesNotExist:
-            pass
-
-    # Does an active trial for this user exist?
-    try:
-        PatronTrial.objects.get(
-            user=user,
-            expiry_date__gte=now().date,
-        )
-
-        return 99999
-    except PatronTrial.DoesNotExist:
-        pass
-
-    return 0
+    return pledge_amount(steam_id=steam_id)
 
 
 @register.assignment_tag(takes_context=True)
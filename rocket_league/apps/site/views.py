@@ -5,12 +5,11 @@ from braces.views import LoginRequiredMixin
 from django.conf import settings
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.db.models import Count
 from django.utils.timezone import now
 from django.views.generic import RedirectView, TemplateView
-from social.apps.django_app.default.models import UserSocialAuth
 
-from ..replays.models import Goal, Player, Replay
+from ..replays.daily_stats import all_time_summary, summarise
+from ..replays.models import DailyStats
 from ..users.models import Profile
 from .models import Patron, PatronTrial
 
@@ -20,38 +19,16 @@ class StatsView(TemplateView):
 
     def get_stats(self, context, timeframe):
         if timeframe == 'all':
-            since = now() - timedelta(days=36500)
+            stats = all_time_summary()
         else:
-            since = now() - timedelta(days=timeframe)
+            stats = summarise(DailyStats.objects.filter(
+                date__gte=(now() - timedelta(days=timeframe)).date(),
+            ))
 
-        # Number of replays total.
-        context['number_of_replays_{}'.format(timeframe)] = Replay.objects.filter(
-            timestamp__gte=since,
-        ).count()
-
-        # Unique players.
-        context['unique_players_{}'.format(timeframe)] = Player.objects.filter(
-            replay__timestamp__gte=since,
-        ).distinct('player_name').order_by('player_name').count()
-
-        # Unique Steam accounts.
-        player_ids = Player.objects.filter(
-            platform__in=['OnlinePlatform_Steam', '1'],
-            replay__timestamp__gte=since,
-        ).distinct('online_id').values_list('online_id', flat=True).order_by()
-
-        social_auth_ids = []
-        if timeframe == 'all':
-            social_auth_ids = UserSocialAuth.objects.filter(
-                provider='steam',
-            ).distinct('uid').values_list('uid', flat=True).order_by()
-
-        context['steam_accounts_{}'.format(timeframe)] = len(set(list(player_ids) + list(social_auth_ids)))
-
-        # Number of goals scored.
-        context['goals_scored_{}'.format(timeframe)] = Goal.objects.filter(
-            replay__timestamp__gte=since,
-        ).count()
+        context['number_of_replays_{}'.format(timeframe)] = stats['replays']
+        context['unique_players_{}'.format(timeframe)] = stats['players']
+        context['steam_accounts_{}'.format(timeframe)] = stats['steam_accounts']
+        context['goals_scored_{}'.format(timeframe)] = stats['goals']
 
         return context
 
@@ -59,14 +36,10 @@ class StatsView(TemplateView):
         context = super(StatsView, self).get_context_data(**kwargs)
 
         # Replays uploaded per day (for graph)
-        context['replays_uploaded_per_day'] = Replay.objects.filter(
-            processed=True,
-            timestamp__gte=now() - timedelta(days=60)
-        ).extra({
-            'date': "date(timestamp)"
-        }).values('date').annotate(
-            created_count=Count('pk')
-        ).order_by('date')
+        context['replays_uploaded_per_day'] = DailyStats.objects.filter(
+            date__gte=(now() - timedelta(days=60)).date(),
+            replays__gt=0,
+        )
 
         # Overall stats #
         context = self.get_stats(context, 'all')
@@ -103,7 +103,7 @@ class PlayerView(ListView):
         else:
             filters['player__player_name'] = self.kwargs['player_id']
 
-        objects = Replay.objects.filter(**filters).distinct()
+        objects = Replay.objects.filter(**filters).select_related('map').distinct()
 
         if self.request.user.is_authenticated():
             objects = objects.filter(
@@ -146,7 +146,7 @@ class PlayerView(ListView):
                 )
                 context['steam_info'] = social_obj.extra_data['player']
 
-                context['uploaded'] = social_obj.user.replay_set.all()
+                context['uploaded'] = social_obj.user.replay_set.select_related('map')
 
                 # Limit to public games, or unlisted / private games uploaded by the user.
                 if self.request.user.is_authenticated() and self.request.user == social_obj.user:
@@ -456,6 +456,16 @@ PATREON_PLAYBACK_PRICE = 300
 PATREON_BOOST_PRICE = 300
 PATREON_STREAM_LISTING_PRICE = 300
 
+# Replay processing
+HEATMAP_BIN_SIZE = 64  # The width of a heatmap grid cell, in unreal units.
+REPLAY_PARSE_CACHE = True  # Keep decoded replays so they can be reprocessed without Rattletrap.
+REPLAY_PARSE_CACHE_ROOT = "/var/cache/rocket_league_parse_cache"  # Local to each worker, never the media storage.
+REPLAY_PARSE_CACHE_MAX_BYTES = 10 * 1024 ** 3  # The least recently used cached parses are removed past this size.
+REPLAY_PARSE_CACHE_MAX_AGE = 60 * 60 * 24 * 30  # Cached parses unused for this many seconds are removed.
+REPROCESS_QUEUE = 'reprocess'  # The Celery queue reprocess_replays sends replays to.
+BOOST_CHART_POINTS = 1000  # Roughly how many points each boost chart line is reduced to, None for all of them.
+REPLAY_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24 * 7  # Cached replay page sections are keyed on the replay's version, this only frees the space.
+
 import os
 import raven
 
@@ -26,6 +26,7 @@ ALLOWED_HOSTS = ['*']
 
 MEDIA_ROOT = os.path.expanduser(os.path.join("~/Sites", SITE_DOMAIN, "media"))
 STATIC_ROOT = os.path.expanduser(os.path.join("~/Sites", SITE_DOMAIN, "static"))
+REPLAY_PARSE_CACHE_ROOT = os.path.expanduser(os.path.join("~/Sites", SITE_DOMAIN, "parse_cache"))
 
 
 # Use local server.